@@ -0,0 +1,514 @@
+"""
+Bộ luật cảnh báo khai báo, có thời gian chờ (for), vùng trễ (hysteresis) và tự động đóng cảnh báo
+
+Luật mặc định được dựng từ config.thresholds, luật trong config.alert_rules bổ sung hoặc ghi đè
+luật mặc định cùng tên. Luật chỉ được biên dịch lại khi cấu hình thay đổi.
+
+Collector chỉ ghi lại chỉ số mới nhất của thiết bị; job định kỳ đánh giá mọi luật cho toàn bộ
+thiết bị trong một lượt, mỗi luật là một phép so sánh trên cả cột chỉ số (numpy nếu có, nếu không
+thì map/compress của thư viện chuẩn) và chỉ phát ra các thay đổi trạng thái:
+- điều kiện đúng liên tục trong `for` giây thì mở cảnh báo;
+- cảnh báo chỉ đóng khi giá trị vượt qua ngưỡng `clear`, nên giá trị dao động quanh ngưỡng không
+  tạo chuỗi cảnh báo mở/đóng liên tục;
+- cảnh báo đã được đóng thủ công không mở lại cho tới khi điều kiện hết hẳn.
+
+Lỗi và drop của interface được tính theo tốc độ tăng của counter (mỗi giây) thay vì giá trị tích lũy.
+
+Chỉ số cũ hơn STALE_FACTOR lần chu kỳ thu thập (thiết bị mất kết nối, bị vô hiệu hóa hoặc
+collector lỗi) không được dùng để mở hay đóng cảnh báo: thời gian chờ bắt đầu lại và cảnh báo
+đang mở giữ nguyên cho tới khi có dữ liệu mới.
+"""
+
+import itertools
+import logging
+import math
+import operator
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import config
+import notifications
+import persistence
+from models import Alert, DataStore, Interface, SystemResources
+
+logger = logging.getLogger(__name__)
+
+SCOPES = ('system', 'interface')
+
+# Collector ghi chỉ số của từng phạm vi
+SCOPE_COLLECTORS = {'system': 'system', 'interface': 'interfaces'}
+
+# Chỉ số cũ hơn số lần chu kỳ thu thập này được coi là hết hạn
+STALE_FACTOR = 2
+
+NAN = float('nan')
+
+# Khoảng cách mặc định giữa ngưỡng mở và ngưỡng đóng của các luật phần trăm
+DEFAULT_HYSTERESIS = 5.0
+
+# Phép so sánh của luật: toán tử -> (điều kiện mở, điều kiện đóng)
+OPERATORS: Dict[str, Tuple[Callable[[float, float], bool], Callable[[float, float], bool]]] = {
+    '>': (lambda value, threshold: value > threshold, lambda value, clear: value <= clear),
+    '<': (lambda value, threshold: value < threshold, lambda value, clear: value >= clear),
+}
+
+
+def _percent(used: float, total: float) -> Optional[float]:
+    return used / total * 100 if total > 0 else None
+
+
+# Các chỉ số của tài nguyên hệ thống; None khi không có dữ liệu
+SYSTEM_METRICS: Dict[str, Callable[[SystemResources], Optional[float]]] = {
+    'cpu_load': lambda resources: float(resources.cpu_load),
+    'memory_usage': lambda resources: _percent(resources.total_memory - resources.free_memory,
+                                               resources.total_memory),
+    'disk_usage': lambda resources: _percent(resources.total_hdd - resources.free_hdd, resources.total_hdd),
+}
+
+# Các chỉ số của interface lấy trực tiếp từ mẫu hiện tại
+INTERFACE_METRICS: Dict[str, Callable[[Interface], Optional[float]]] = {
+    'down': lambda interface: None if interface.type == 'bridge' else
+    float(not interface.running and not interface.disabled),
+    'rx_speed': lambda interface: interface.rx_speed,
+    'tx_speed': lambda interface: interface.tx_speed,
+    # Chỉ có khi đã biết tốc độ liên kết
+    'utilization': lambda interface: interface.utilization if interface.link_speed else None,
+}
+
+# Các chỉ số của interface tính từ chênh lệch counter giữa hai mẫu liên tiếp (đơn vị mỗi giây)
+INTERFACE_COUNTERS: Dict[str, Callable[[Interface], int]] = {
+    'error_rate': lambda interface: interface.rx_error + interface.tx_error,
+    'drop_rate': lambda interface: interface.rx_drop + interface.tx_drop,
+}
+
+
+@dataclass(frozen=True)
+class Rule:
+    """Một luật cảnh báo đã biên dịch
+
+    Args:
+        name: Loại cảnh báo (Alert.type)
+        scope: 'system' hoặc 'interface'
+        metric: Tên chỉ số trong phạm vi
+        op: '>' hoặc '<'
+        threshold: Ngưỡng mở cảnh báo
+        clear: Ngưỡng đóng cảnh báo
+        for_seconds: Thời gian điều kiện phải đúng liên tục trước khi mở cảnh báo
+        severity: Mức độ của cảnh báo
+        message: Mẫu nội dung, có các trường {device}, {subject}, {value}, {threshold}
+    """
+    name: str
+    scope: str
+    metric: str
+    op: str
+    threshold: float
+    clear: float
+    for_seconds: float
+    severity: str
+    message: str
+
+    def triggered(self, value: float) -> bool:
+        return OPERATORS[self.op][0](value, self.threshold)
+
+    def cleared(self, value: float) -> bool:
+        return OPERATORS[self.op][1](value, self.clear)
+
+
+def default_rules(thresholds: Mapping[str, Any]) -> List[Dict[str, Any]]:
+    """Các luật mặc định theo ngưỡng trong config.thresholds"""
+    rules = []
+    for name, label in (('cpu_load', 'CPU load'), ('memory_usage', 'memory usage'), ('disk_usage', 'disk usage')):
+        threshold = float(thresholds.get(name, 80))
+        rules.append({
+            'name': name, 'scope': 'system', 'metric': name, 'op': '>',
+            'threshold': threshold, 'clear': threshold - DEFAULT_HYSTERESIS,
+            'for': 0 if name == 'disk_usage' else 120, 'severity': 'warning',
+            'message': f"High {label} on {{device}}: {{value:.1f}}%",
+        })
+    rules.extend([
+        {
+            'name': 'interface_down', 'scope': 'interface', 'metric': 'down', 'op': '>',
+            'threshold': 0, 'clear': 0, 'for': 0, 'severity': 'error',
+            'message': "Interface {subject} on {device} is down",
+        },
+        {
+            'name': 'interface_usage', 'scope': 'interface', 'metric': 'utilization', 'op': '>',
+            'threshold': float(thresholds.get('interface_usage', 80)),
+            'clear': float(thresholds.get('interface_usage', 80)) - DEFAULT_HYSTERESIS,
+            'for': 120, 'severity': 'warning',
+            'message': "High utilization on interface {subject} on {device}: {value:.1f}%",
+        },
+        {
+            'name': 'interface_errors', 'scope': 'interface', 'metric': 'error_rate', 'op': '>',
+            'threshold': 0.1, 'clear': 0, 'for': 120, 'severity': 'warning',
+            'message': "Interface {subject} on {device} has errors ({value:.2f}/s)",
+        },
+        {
+            'name': 'interface_drops', 'scope': 'interface', 'metric': 'drop_rate', 'op': '>',
+            'threshold': 1, 'clear': 0, 'for': 120, 'severity': 'info',
+            'message': "Interface {subject} on {device} has packet drops ({value:.2f}/s)",
+        },
+    ])
+    return rules
+
+
+def compile_rules(thresholds: Mapping[str, Any], overrides: Any = ()) -> Dict[str, List[Rule]]:
+    """Biên dịch luật mặc định và luật trong cấu hình, trả về danh sách luật theo phạm vi
+
+    Luật cấu hình trùng tên ghi đè các trường của luật mặc định; `"enabled": false` tắt luật.
+    Luật không hợp lệ được bỏ qua và ghi log.
+    """
+    specs: Dict[str, Dict[str, Any]] = {spec['name']: spec for spec in default_rules(thresholds)}
+    for override in overrides or ():
+        name = override.get('name')
+        if not name:
+            logger.error(f"Alert rule without name ignored: {dict(override)}")
+            continue
+        specs[name] = {**specs.get(name, {}), **override}
+
+    rules: Dict[str, List[Rule]] = {scope: [] for scope in SCOPES}
+    for name, spec in specs.items():
+        if not spec.get('enabled', True):
+            continue
+        scope = spec.get('scope')
+        metric = spec.get('metric')
+        op = spec.get('op', '>')
+        known = SYSTEM_METRICS if scope == 'system' else {**INTERFACE_METRICS, **INTERFACE_COUNTERS}
+        if scope not in SCOPES or metric not in known or op not in OPERATORS:
+            logger.error(f"Invalid alert rule {name}: scope={scope}, metric={metric}, op={op}")
+            continue
+        try:
+            threshold = float(spec['threshold'])
+            clear = float(spec.get('clear', threshold))
+            for_seconds = float(spec.get('for', 0))
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error(f"Invalid alert rule {name}: {e}")
+            continue
+        rules[scope].append(Rule(
+            name=name, scope=scope, metric=metric, op=op, threshold=threshold, clear=clear,
+            for_seconds=for_seconds, severity=spec.get('severity', 'warning'),
+            message=spec.get('message', f"{name} on {{device}} {{subject}}: {{value}}"),
+        ))
+    return rules
+
+
+class _Block:
+    """Chỉ số mới nhất của một thiết bị trong một phạm vi, mỗi chỉ số là một cột array('d')
+
+    Block không đổi sau khi ghi (lần thu thập sau tạo block mới) nên kết quả so sánh của mỗi điều
+    kiện được giữ lại trong `matches` cho tới lần thu thập tiếp theo.
+    """
+
+    __slots__ = ('device_id', 'subjects', 'index', 'columns', 'matches', 'recorded')
+
+    def __init__(self, device_id: str, subjects: List[str], columns: Dict[str, array]):
+        self.device_id = device_id
+        self.recorded = time.time()
+        self.subjects = subjects
+        self.index = {subject: row for row, subject in enumerate(subjects)}
+        self.columns = columns
+        # (chỉ số, toán tử, ngưỡng) -> khóa (thiết bị, đối tượng) của các dòng thỏa điều kiện
+        self.matches: Dict[Tuple[str, str, float], List[Tuple[str, str]]] = {}
+
+
+def collection_interval(collector: str) -> float:
+    """Chu kỳ thu thập (giây) của collector theo collector_intervals, mặc định refresh_interval"""
+    snapshot = config.get_snapshot()
+    refresh_interval = snapshot.get('refresh_interval', 60)
+    try:
+        interval = float(snapshot.get('collector_intervals', {}).get(collector, refresh_interval))
+    except (TypeError, ValueError):
+        interval = refresh_interval
+    return interval if interval > 0 else refresh_interval
+
+
+def _column(values: Iterable[Optional[float]]) -> array:
+    return array('d', [NAN if value is None else value for value in values])
+
+
+def _matches(column: array, op: str, threshold: float) -> List[int]:
+    """Chỉ số các dòng thỏa điều kiện mở của luật; NaN (không có dữ liệu) không bao giờ thỏa"""
+    if not column:
+        return []
+    if numpy is not None:
+        values = numpy.frombuffer(column, dtype=numpy.float64)
+        return numpy.flatnonzero(values > threshold if op == '>' else values < threshold).tolist()
+    compare = operator.gt if op == '>' else operator.lt
+    return list(itertools.compress(range(len(column)), map(compare, column, itertools.repeat(threshold))))
+
+
+class AlertEngine:
+    """Đánh giá luật cho toàn bộ thiết bị trong một lượt và mở/đóng cảnh báo trong DataStore.alerts
+
+    Collector chỉ ghi chỉ số mới nhất của thiết bị (record_system, record_interfaces); job định kỳ
+    gọi evaluate() để ghép chỉ số của mọi thiết bị thành từng cột và so sánh cả cột với ngưỡng.
+    Phần xử lý bằng Python chỉ chạy trên các dòng đang vượt ngưỡng hoặc đang có cảnh báo.
+    Mỗi lượt chỉ xét các block còn hạn và bỏ qua phạm vi không có block mới hay block hết hạn.
+    """
+
+    def __init__(self):
+        self._blocks_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._rules: Dict[str, List[Rule]] = {scope: [] for scope in SCOPES}
+        self._rules_source: Optional[Tuple[Any, Any]] = None
+        # Phạm vi -> thiết bị -> chỉ số mới nhất, theo thứ tự ghi (block cũ nhất ở đầu)
+        self._blocks: Dict[str, Dict[str, _Block]] = {scope: {} for scope in SCOPES}
+        # Các phạm vi có block được ghi hoặc bị bỏ kể từ lượt đánh giá trước
+        self._changed: Set[str] = set(SCOPES)
+        self._evaluated_rules: Optional[Dict[str, List[Rule]]] = None
+        # Counter của mẫu trước theo thiết bị: tên interface -> (timestamp, giá trị theo INTERFACE_COUNTERS)
+        self._counters: Dict[str, Dict[str, Tuple[float, Tuple[int, ...]]]] = {}
+        # Luật -> (thiết bị, đối tượng) -> thời điểm điều kiện bắt đầu đúng nhưng chưa đủ thời gian chờ
+        self._pending: Dict[str, Dict[Tuple[str, str], float]] = {}
+        # Luật -> các (thiết bị, đối tượng) đã mở cảnh báo và đang chờ điều kiện đóng
+        self._firing: Dict[str, Set[Tuple[str, str]]] = {}
+        self._seeded = False
+
+    def rules(self) -> Dict[str, List[Rule]]:
+        """Luật hiện hành, chỉ biên dịch lại khi thresholds hoặc alert_rules trong cấu hình thay đổi"""
+        snapshot = config.get_snapshot()
+        thresholds = snapshot.get('thresholds', config.DEFAULT_CONFIG['thresholds'])
+        overrides = snapshot.get('alert_rules', ())
+        # Bản chụp cấu hình được thay mới mỗi khi cấu hình thay đổi nên so sánh theo định danh là đủ
+        source = self._rules_source
+        if source is None or source[0] is not thresholds or source[1] is not overrides:
+            self._rules = compile_rules(thresholds, overrides)
+            self._rules_source = (thresholds, overrides)
+        return self._rules
+
+    def record_system(self, device_id: str, resources: SystemResources) -> None:
+        """Ghi chỉ số tài nguyên hệ thống vừa thu thập của thiết bị"""
+        columns = {name: _column([metric(resources)]) for name, metric in SYSTEM_METRICS.items()}
+        block = _Block(device_id, [''], columns)
+        self._store_block('system', block)
+
+    def record_interfaces(self, device_id: str, interfaces: List[Interface]) -> None:
+        """Ghi chỉ số của danh sách interface vừa thu thập của thiết bị
+
+        Tốc độ lỗi/drop được tính từ chênh lệch counter với lần ghi trước; None khi chưa có mẫu
+        trước hoặc counter bị reset.
+        """
+        previous = self._counters.get(device_id, {})
+        current: Dict[str, Tuple[float, Tuple[int, ...]]] = {}
+        columns: Dict[str, List[Optional[float]]] = {name: [] for name in INTERFACE_METRICS}
+        rates: List[List[Optional[float]]] = [[] for _ in INTERFACE_COUNTERS]
+        counter_functions = list(INTERFACE_COUNTERS.values())
+        for interface in interfaces:
+            for name, metric in INTERFACE_METRICS.items():
+                columns[name].append(metric(interface))
+            timestamp = interface.timestamp.timestamp()
+            counters = tuple(counter(interface) for counter in counter_functions)
+            current[interface.name] = (timestamp, counters)
+            last = previous.get(interface.name)
+            for index, value in enumerate(counters):
+                if last is not None and timestamp > last[0] and value >= last[1][index]:
+                    rates[index].append((value - last[1][index]) / (timestamp - last[0]))
+                else:
+                    rates[index].append(None)
+        for name, values in zip(INTERFACE_COUNTERS, rates):
+            columns[name] = values
+
+        block = _Block(device_id, [interface.name for interface in interfaces],
+                       {name: _column(values) for name, values in columns.items()})
+        with self._blocks_lock:
+            self._counters[device_id] = current
+        self._store_block('interface', block)
+
+    def _store_block(self, scope: str, block: _Block) -> None:
+        with self._blocks_lock:
+            blocks = self._blocks[scope]
+            # Ghi lại ở cuối để các block giữ thứ tự theo thời điểm ghi
+            blocks.pop(block.device_id, None)
+            blocks[block.device_id] = block
+            self._changed.add(scope)
+
+    def _expire_blocks(self, scope: str, now: float) -> bool:
+        """Bỏ các block hết hạn của phạm vi, trả về True nếu có block được ghi hoặc bị bỏ từ lượt trước
+
+        Block được xếp theo thời điểm ghi nên chỉ cần lấy ra các block hết hạn ở đầu.
+        """
+        oldest = now - STALE_FACTOR * collection_interval(SCOPE_COLLECTORS[scope])
+        with self._blocks_lock:
+            blocks = self._blocks[scope]
+            expired = [device_id for device_id, _ in itertools.takewhile(
+                lambda item: item[1].recorded < oldest, blocks.items())]
+            for device_id in expired:
+                del blocks[device_id]
+            changed = bool(expired) or scope in self._changed
+            self._changed.discard(scope)
+            return changed
+
+    def evaluate(self) -> List[Tuple[str, Alert]]:
+        """Đánh giá mọi luật trên chỉ số mới nhất của toàn bộ thiết bị
+
+        Trả về các thay đổi trạng thái trong lượt này: ('raised', alert) hoặc ('resolved', alert).
+        """
+        rules = self.rules()
+        now = time.time()
+        transitions: List[Tuple[str, Alert]] = []
+        with self._state_lock:
+            if not self._seeded:
+                self._seed(rules)
+            rules_changed = rules is not self._evaluated_rules
+            self._evaluated_rules = rules
+            for scope in SCOPES:
+                if not rules[scope]:
+                    continue
+                changed = self._expire_blocks(scope, now)
+                # Không có dữ liệu mới, không có block hết hạn và không có thời gian chờ nào sắp đủ:
+                # kết quả giống lượt trước nên bỏ qua phạm vi này
+                if not (changed or rules_changed or any(self._pending.get(rule.name) for rule in rules[scope])):
+                    continue
+                with self._blocks_lock:
+                    blocks = dict(self._blocks[scope])
+                self._evaluate_scope(blocks, rules[scope], now, transitions)
+        return transitions
+
+    def _seed(self, rules: Dict[str, List[Rule]]) -> None:
+        """Nhận các cảnh báo đang mở có sẵn (nạp lại từ ảnh chụp) để luật có thể tự đóng chúng"""
+        names = {rule.name for scoped in rules.values() for rule in scoped}
+        for alert in DataStore.alerts:
+            if alert.active and alert.type in names:
+                self._firing.setdefault(alert.type, set()).add((alert.device_id, alert.subject))
+        self._seeded = True
+
+    def _evaluate_scope(self, blocks: Dict[str, _Block], rules: List[Rule], now: float,
+                        transitions: List[Tuple[str, Alert]]) -> None:
+        # Chỉ số đã hết hạn (không có trong blocks) không mở, không đóng cảnh báo
+        # và không tính vào thời gian chờ
+
+        for rule in rules:
+            condition = (rule.metric, rule.op, rule.threshold)
+            self._match_blocks([block for block in blocks.values() if condition not in block.matches],
+                               rule, condition)
+            triggered: Set[Tuple[str, str]] = set()
+            for block in blocks.values():
+                triggered.update(block.matches[condition])
+
+            pending = self._pending.setdefault(rule.name, {})
+            firing = self._firing.setdefault(rule.name, set())
+
+            # Điều kiện hết trước khi đủ thời gian chờ
+            for key in [key for key in pending if key not in triggered]:
+                del pending[key]
+
+            for key in triggered - firing:
+                since = pending.setdefault(key, now)
+                if now - since < rule.for_seconds:
+                    continue
+                block = blocks[key[0]]
+                alert = self._raise(rule, key[0], key[1], block.columns[rule.metric][block.index[key[1]]])
+                if alert is not None:
+                    transitions.append(('raised', alert))
+                elif DataStore.alerts.find_active(key[0], rule.name, key[1]) is None:
+                    # Chưa mở được cảnh báo (ví dụ thiết bị chưa có trong DataStore): giữ trong pending để thử lại
+                    continue
+                del pending[key]
+                firing.add(key)
+
+            for key in firing - triggered:
+                device_id, subject = key
+                block = blocks.get(device_id)
+                if block is None:
+                    # Không có dữ liệu mới của thiết bị: giữ cảnh báo cho tới lần thu thập thành công
+                    continue
+                row = block.index.get(subject)
+                if row is None:
+                    reason = 'no longer reported'
+                else:
+                    value = block.columns[rule.metric][row]
+                    if math.isnan(value) or not rule.cleared(value):
+                        continue
+                    reason = f"value {value:.2f}"
+                firing.discard(key)
+                alert = DataStore.alerts.find_active(device_id, rule.name, subject)
+                if alert is not None:
+                    DataStore.alerts.resolve(alert.id)
+                    logger.info(f"Alert resolved ({reason}): {alert.message}")
+                    transitions.append(('resolved', alert))
+
+    def _match_blocks(self, blocks: List[_Block], rule: Rule, condition: Tuple[str, str, float]) -> None:
+        """So sánh cột chỉ số của các block chưa có kết quả với ngưỡng của luật trong một phép so sánh"""
+        if not blocks:
+            return
+        column = array('d')
+        ends: List[int] = []
+        for block in blocks:
+            column.extend(block.columns[rule.metric])
+            ends.append(len(column))
+            block.matches[condition] = []
+
+        # Các dòng thỏa điều kiện đã được sắp tăng dần: chia lại cho từng block theo thứ tự
+        position = 0
+        start = 0
+        for row in _matches(column, rule.op, rule.threshold):
+            if row >= ends[position]:
+                position = bisect_right(ends, row, position)
+                start = ends[position - 1]
+            block = blocks[position]
+            block.matches[condition].append((block.device_id, block.subjects[row - start]))
+
+    def _raise(self, rule: Rule, device_id: str, subject: str, value: float) -> Optional[Alert]:
+        device = DataStore.devices.get(device_id)
+        if device is None:
+            return None
+        try:
+            message = rule.message.format(device=device.name, subject=subject, value=value,
+                                          threshold=rule.threshold)
+        except (KeyError, IndexError, ValueError):
+            message = f"{rule.name} on {device.name} {subject}: {value}"
+        alert = DataStore.alerts.add(device_id, rule.name, message, rule.severity, subject=subject)
+        if alert is not None:
+            logger.warning(f"Alert: {message}")
+        return alert
+
+    def expire_device(self, device_id: str, collectors: Optional[Iterable[str]] = None) -> None:
+        """Bỏ chỉ số của thiết bị khi thu thập lỗi hoặc thiết bị bị vô hiệu hóa
+
+        Args:
+            device_id: ID của thiết bị
+            collectors: Các collector bị lỗi, mặc định bỏ chỉ số của mọi phạm vi
+        """
+        scopes = [scope for scope in SCOPES if collectors is None or SCOPE_COLLECTORS[scope] in collectors]
+        with self._blocks_lock:
+            for scope in scopes:
+                if self._blocks[scope].pop(device_id, None) is not None:
+                    self._changed.add(scope)
+
+    def remove_device(self, device_id: str) -> None:
+        """Xóa chỉ số và trạng thái luật của thiết bị"""
+        with self._blocks_lock:
+            self._counters.pop(device_id, None)
+            for scope, blocks in self._blocks.items():
+                if blocks.pop(device_id, None) is not None:
+                    self._changed.add(scope)
+        with self._state_lock:
+            for pending in self._pending.values():
+                for key in [key for key in pending if key[0] == device_id]:
+                    del pending[key]
+            for firing in self._firing.values():
+                firing.difference_update([key for key in firing if key[0] == device_id])
+
+
+engine = AlertEngine()
+
+
+def evaluate() -> List[Tuple[str, Alert]]:
+    """Lượt đánh giá cảnh báo định kỳ của scheduler"""
+    started = time.perf_counter()
+    transitions = engine.evaluate()
+    if transitions:
+        persistence.mark_alerts_dirty()
+        notifications.notify(transitions)
+    logger.debug(f"Alert evaluation: {len(transitions)} transitions in "
+                 f"{(time.perf_counter() - started) * 1000:.1f} ms")
+    return transitions
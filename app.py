@@ -1,13 +1,17 @@
 import os
 import logging
-from flask import Flask
-from flask_socketio import SocketIO
+from collections import Counter
+from typing import Dict, Set
+from flask import Flask, request
+from flask_socketio import SocketIO, emit, join_room, leave_room
 from routes.views import views
 from routes.api import api
 from scheduler import start_scheduler
 import config
 from models import Site, Device, DataStore
+import persistence
 import realtime_discovery
+import reports
 import threading
 
 # Configure logging
@@ -68,6 +72,57 @@ def init_data_from_config():
 # Biến toàn cục để lưu trạng thái chế độ chính xác cao
 high_precision_mode = False
 
+def device_room(device_id: str) -> str:
+    return f"device:{device_id}"
+
+def site_room(site_id: str) -> str:
+    return f"site:{site_id}"
+
+class RoomSubscriptions:
+    """Theo dõi các phòng websocket mà mỗi client đã tham gia
+
+    Luồng phát sóng chỉ tuần tự hóa và gửi dữ liệu của thiết bị có client đang xem
+    (qua phòng của thiết bị hoặc của site chứa thiết bị).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_client: Dict[str, Set[str]] = {}
+        self._counts: Counter = Counter()
+
+    def join(self, sid: str, room: str) -> None:
+        with self._lock:
+            rooms = self._by_client.setdefault(sid, set())
+            if room not in rooms:
+                rooms.add(room)
+                self._counts[room] += 1
+
+    def leave(self, sid: str, room: str) -> None:
+        with self._lock:
+            rooms = self._by_client.get(sid)
+            if rooms is None or room not in rooms:
+                return
+            rooms.discard(room)
+            self._release(room)
+
+    def drop(self, sid: str) -> None:
+        """Bỏ mọi phòng của client khi ngắt kết nối"""
+        with self._lock:
+            for room in self._by_client.pop(sid, ()):
+                self._release(room)
+
+    def _release(self, room: str) -> None:
+        self._counts[room] -= 1
+        if self._counts[room] <= 0:
+            del self._counts[room]
+
+    def active(self) -> Set[str]:
+        """Các phòng đang có ít nhất một client"""
+        with self._lock:
+            return set(self._counts)
+
+subscriptions = RoomSubscriptions()
+
 # Hàm phát sóng dữ liệu tốc độ mạng qua WebSocket
 def emit_network_speeds():
     """Phát sóng thông tin tốc độ mạng qua websocket"""
@@ -87,10 +142,15 @@ def emit_network_speeds():
             else:
                 emit_interval = 5  # Phát dữ liệu mỗi 5 giây trong chế độ thường
             
-            # Thu thập dữ liệu interfaces cho tất cả thiết bị
-            for device_id, device in DataStore.devices.items():
+            # Chỉ phát cho thiết bị có client đang xem qua phòng thiết bị hoặc phòng site
+            active_rooms = subscriptions.active()
+            for device_id, device in list(DataStore.devices.items()):
                 if not device.enabled:
                     continue
+                rooms = [room for room in (device_room(device_id), site_room(device.site_id))
+                         if room in active_rooms]
+                if not rooms:
+                    continue
                 
                 interfaces = DataStore.interfaces.get(device_id, [])
                 if not interfaces:
@@ -114,13 +174,14 @@ def emit_network_speeds():
                         'type': getattr(iface, 'type', '')
                     })
                 
-                # Phát sóng dữ liệu qua WebSocket
+                # Phát sóng dữ liệu qua WebSocket tới các phòng đang theo dõi thiết bị
                 socketio.emit('network_speeds', {
                     'device_id': device_id, 
                     'device_name': device.name,
+                    'site_id': device.site_id,
                     'interfaces': interface_data,
                     'high_precision': high_precision_mode
-                })
+                }, to=rooms)
                 logger.debug(f"Đã phát sóng dữ liệu tốc độ mạng cho thiết bị {device.name}")
             
             # Tạm dừng để không phát quá nhiều dữ liệu
@@ -137,22 +198,25 @@ def handle_connect():
 # Sự kiện khi client ngắt kết nối
 @socketio.on('disconnect')
 def handle_disconnect():
+    subscriptions.drop(request.sid)
     logger.info(f"Client disconnected from websocket")
 
 # Sự kiện khi client tham gia vào phòng của thiết bị
 @socketio.on('join_device_room')
 def handle_join_device_room(data):
-    device_id = data.get('device_id')
+    device_id = (data or {}).get('device_id')
     if device_id:
         # Gửi thông báo lỗi nếu thiết bị không tồn tại hoặc không thể kết nối
         if device_id in DataStore.devices:
             device = DataStore.devices[device_id]
+            join_room(device_room(device_id))
+            subscriptions.join(request.sid, device_room(device_id))
             logger.info(f"Client listening for device: {device.name}")
             
             # Kiểm tra trạng thái kết nối của thiết bị
             if device.error_message:
-                # Gửi lỗi về thiết bị cho client
-                socketio.emit('device_error', {
+                # Gửi lỗi về thiết bị cho client vừa tham gia
+                emit('device_error', {
                     'device_id': device_id,
                     'message': device.error_message
                 })
@@ -160,6 +224,34 @@ def handle_join_device_room(data):
         else:
             logger.warning(f"Client tried to join non-existent device room: {device_id}")
 
+# Sự kiện khi client rời phòng của thiết bị
+@socketio.on('leave_device_room')
+def handle_leave_device_room(data):
+    device_id = (data or {}).get('device_id')
+    if device_id:
+        leave_room(device_room(device_id))
+        subscriptions.leave(request.sid, device_room(device_id))
+
+# Sự kiện khi client tham gia vào phòng của site (nhận dữ liệu của mọi thiết bị trong site)
+@socketio.on('join_site_room')
+def handle_join_site_room(data):
+    site_id = (data or {}).get('site_id')
+    if site_id:
+        if site_id in DataStore.sites:
+            join_room(site_room(site_id))
+            subscriptions.join(request.sid, site_room(site_id))
+            logger.info(f"Client listening for site: {DataStore.get_site_name(site_id)}")
+        else:
+            logger.warning(f"Client tried to join non-existent site room: {site_id}")
+
+# Sự kiện khi client rời phòng của site
+@socketio.on('leave_site_room')
+def handle_leave_site_room(data):
+    site_id = (data or {}).get('site_id')
+    if site_id:
+        leave_room(site_room(site_id))
+        subscriptions.leave(request.sid, site_room(site_id))
+
 # Sự kiện khi client thay đổi chế độ chính xác cao
 @socketio.on('set_high_precision')
 def handle_high_precision(data):
@@ -176,6 +268,11 @@ def handle_high_precision(data):
 # Khởi tạo dữ liệu và bắt đầu lập lịch thu thập
 with app.app_context():
     init_data_from_config()
+    # Nạp ảnh chụp lần chạy trước để dashboard có dữ liệu ngay
+    restored = persistence.warm_start()
+    if restored:
+        logger.info(f"Đã nạp dữ liệu của {restored} thiết bị từ snapshot")
+    reports.load()
     start_scheduler()
     # Bắt đầu tính năng phát hiện thiết bị thời gian thực
     realtime_discovery.start_discovery()
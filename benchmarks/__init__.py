@@ -0,0 +1,6 @@
+"""
+Benchmark cho các đường xử lý nóng của hệ thống giám sát
+
+Chạy từ thư mục gốc của dự án, ví dụ: python -m benchmarks.bench_interface_rates
+Bộ benchmark đầy đủ với kết quả JSON: python -m benchmarks.suite --output bench.json
+"""
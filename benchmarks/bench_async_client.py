@@ -0,0 +1,98 @@
+"""
+So sánh client RouterOS threaded (routeros_api) và async (routeros_async) khi thu thập toàn bộ collector cho nhiều thiết bị
+
+Các thiết bị ảo của fake_routeros chạy trong tiến trình, trả lời mỗi lệnh sau một độ trễ cố định
+để mô phỏng round-trip mạng. Client threaded chờ từng lệnh, client async gửi cùng lúc mọi lệnh của chu kỳ.
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import config
+from fake_routeros import FakeRouterOS, SimulatorOptions
+from mikrotik import MikrotikAPI
+from models import DataStore, Device
+
+
+def run_threaded(mikrotik_api: MikrotikAPI, device_ids: List[str], workers: int) -> float:
+    """Thu thập một vòng như scheduler: mỗi thiết bị một job trong pool luồng"""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(mikrotik_api.collect_all_data, device_ids))
+    elapsed = time.perf_counter() - started
+    failed = sum(1 for result in results if not result.get('success'))
+    if failed:
+        print(f"  threaded: {failed} thiết bị lỗi")
+    return elapsed
+
+
+def run_async(mikrotik_api: MikrotikAPI, device_ids: List[str]) -> float:
+    """Thu thập một vòng cho toàn bộ thiết bị trên một event loop"""
+    started = time.perf_counter()
+    results = mikrotik_api.collect_fleet_async(device_ids)
+    elapsed = time.perf_counter() - started
+    failed = sum(1 for result in results.values() if not result.get('success'))
+    if failed:
+        print(f"  async: {failed} thiết bị lỗi")
+    return elapsed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--devices', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.02, help='Độ trễ mỗi lệnh (giây)')
+    parser.add_argument('--interfaces', type=int, default=24)
+    parser.add_argument('--arp', type=int, default=200)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=20, help='Số luồng của pool threaded (scheduler_max_workers)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    config.CONFIG_FILE = os.path.join(tempfile.mkdtemp(prefix='bench-async-'), 'config.json')
+
+    simulator = FakeRouterOS(args.devices, SimulatorOptions(
+        interfaces=args.interfaces, arp_entries=args.arp, latency=args.latency
+    )).start()
+
+    device_ids = []
+    for device_config in simulator.device_configs():
+        DataStore.devices[device_config['id']] = Device(**device_config)
+        device_ids.append(device_config['id'])
+
+    timings: Dict[str, List[float]] = {}
+    for mode in ('threaded', 'async'):
+        with config.transaction(coalesce=False) as settings:
+            settings['api_client'] = mode
+            settings['connection_retries'] = 0
+            settings['async_max_devices'] = max(args.devices, 1)
+
+        mikrotik_api = MikrotikAPI()
+
+        def collect_round() -> float:
+            if mode == 'threaded':
+                return run_threaded(mikrotik_api, device_ids, args.workers)
+            return run_async(mikrotik_api, device_ids)
+
+        # Vòng đầu mở kết nối và tạo mẫu interface trước, không tính vào kết quả
+        collect_round()
+        commands_before = simulator.commands
+        timings[mode] = [collect_round() for _ in range(args.rounds)]
+        commands = (simulator.commands - commands_before) / args.rounds
+        best = min(timings[mode])
+        print(f"{mode:>9}: {best * 1000:9.1f} ms/vòng  {args.devices / best:9.1f} thiết bị/s  "
+              f"{commands / args.devices:5.1f} lệnh/thiết bị")
+        mikrotik_api.disconnect_all()
+
+    print(f"Tăng tốc async so với threaded: {min(timings['threaded']) / min(timings['async']):.1f}x")
+    simulator.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""
+Micro-benchmark cho collect_interfaces: tra cứu mẫu trước và tính tốc độ phải tăng tuyến tính theo số interface
+
+So sánh với cách tra cứu cũ (duyệt danh sách cho từng interface, O(n²)).
+"""
+
+import argparse
+import logging
+import sys
+import time
+from typing import List
+
+from benchmarks.synthetic import SyntheticApi
+from models import DataStore, Device, Interface
+from mikrotik import MikrotikAPI
+
+
+def bench_collect(api: MikrotikAPI, device_id: str, rounds: int) -> float:
+    """Thời gian trung bình (giây) của một lần collect_interfaces"""
+    started = time.perf_counter()
+    for _ in range(rounds):
+        api.collect_interfaces(device_id)
+    return (time.perf_counter() - started) / rounds
+
+
+def bench_legacy_lookup(interfaces: List[Interface], rounds: int) -> float:
+    """Thời gian trung bình của cách tra cứu mẫu trước cũ cho cả lô interface"""
+    names = [interface.name for interface in interfaces]
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for name in names:
+            next((i for i in interfaces if i.name == name), None)
+    return (time.perf_counter() - started) / rounds
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='100,500,1000,2000,5000,10000',
+                        help='Số interface mỗi thiết bị, phân tách bằng dấu phẩy')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--max-ratio', type=float, default=3.0,
+                        help='Tỉ lệ tối đa cho phép giữa chi phí/interface ở cỡ lớn nhất và nhỏ nhất')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    mikrotik_api = MikrotikAPI()
+    per_interface = []
+    print(f"{'interfaces':>10} {'collect ms':>12} {'us/iface':>10} {'legacy lookup ms':>18}")
+    for size in sizes:
+        device_id = f'bench-{size}'
+        DataStore.devices[device_id] = Device(id=device_id, name=device_id, host='127.0.0.1')
+        synthetic = SyntheticApi(interfaces=size)
+        mikrotik_api._local.device_id = device_id
+        mikrotik_api._local.api = synthetic
+
+        # Chu kỳ đầu chỉ tạo mẫu trước
+        mikrotik_api.collect_interfaces(device_id)
+        elapsed = bench_collect(mikrotik_api, device_id, args.rounds)
+        legacy = bench_legacy_lookup(DataStore.interfaces[device_id], 1) if size <= 5000 else float('nan')
+
+        per_interface.append(elapsed / size)
+        print(f"{size:>10} {elapsed * 1000:>12.2f} {elapsed / size * 1e6:>10.2f} {legacy * 1000:>18.2f}")
+
+        DataStore.devices.pop(device_id, None)
+        DataStore.interfaces.pop(device_id, None)
+        DataStore.interface_index.pop(device_id, None)
+        DataStore.interface_history.pop(device_id, None)
+
+    ratio = per_interface[-1] / per_interface[0]
+    print(f"Chi phí/interface tại {sizes[-1]} so với {sizes[0]}: {ratio:.2f}x")
+    if ratio > args.max_ratio:
+        print("Không đạt: chi phí mỗi interface tăng theo số interface (không tuyến tính)")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,484 @@
+"""
+Bộ benchmark cho các đường nóng: thu thập, lịch sử, phát hiện thiết bị, cảnh báo và API
+
+Mỗi trường hợp chạy trong một tiến trình con riêng để đo peak RSS độc lập, báo cáo
+thông lượng, độ trễ p50/p99 và ghi kết quả ra JSON để so sánh giữa các commit.
+
+    python -m benchmarks.suite --output bench.json
+    python -m benchmarks.suite --profile full --output new.json --compare bench.json
+    python -m benchmarks.suite --only collect_interfaces,api_arp
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Tuple
+
+# Một trường hợp trả về (thao tác cần đo, số phần tử mỗi thao tác xử lý)
+Operation = Tuple[Callable[[], Any], int]
+
+# Tiền tố MAC của dữ liệu giả lập, được nạp sẵn vào cache vendor để không tra cứu online
+SYNTHETIC_MAC_PREFIXES = ('4C5E0C', '001122', 'A0B1C2', 'D4CA6D', '0C0000')
+
+
+def _prepare_environment() -> None:
+    """Cô lập cấu hình và cache vendor của tiến trình benchmark"""
+    import config
+    from mac_vendor import mac_vendor_lookup
+
+    logging.basicConfig(level=logging.CRITICAL)
+    config.CONFIG_FILE = os.path.join(tempfile.mkdtemp(prefix='bench-suite-'), 'config.json')
+    for prefix in SYNTHETIC_MAC_PREFIXES:
+        mac_vendor_lookup.cache[prefix] = ('Synthetic', time.time())
+
+
+def _synthetic_interfaces(device_id: str, interfaces: int) -> None:
+    """Tạo danh sách interface cho thiết bị bằng chính collect_interfaces trên API giả lập"""
+    from benchmarks.synthetic import SyntheticApi
+    from mikrotik import mikrotik_api
+    from models import DataStore, Device
+
+    DataStore.devices[device_id] = Device(id=device_id, name=device_id, host='127.0.0.1')
+    mikrotik_api._local.device_id = device_id
+    mikrotik_api._local.api = SyntheticApi(interfaces=interfaces)
+    mikrotik_api.collect_interfaces(device_id)
+
+
+def _arp_entries(device_id: str, count: int) -> List[Any]:
+    from models import ArpEntry
+
+    return [
+        ArpEntry(
+            device_id=device_id,
+            address=f'10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}',
+            mac_address=f'0C:00:00:{(i >> 16) & 255:02X}:{(i >> 8) & 255:02X}:{i & 255:02X}',
+            interface='bridge',
+            dynamic=True,
+            complete=True,
+            vendor='Synthetic',
+            device_type='Unknown'
+        )
+        for i in range(count)
+    ]
+
+
+def case_collect_interfaces(interfaces: int) -> Operation:
+    """collect_interfaces trên API giả lập trong bộ nhớ"""
+    from mikrotik import mikrotik_api
+
+    _synthetic_interfaces('bench', interfaces)
+    return (lambda: mikrotik_api.collect_interfaces('bench')), interfaces
+
+
+def case_collect_all_data(devices: int, interfaces: int, arp: int, client: str) -> Operation:
+    """collect_all_data cho cả nhóm thiết bị trên fake_routeros"""
+    import config
+    from fake_routeros import FakeRouterOS, SimulatorOptions
+    from mikrotik import mikrotik_api
+    from models import DataStore, Device
+
+    with config.transaction(coalesce=False) as settings:
+        settings['api_client'] = client
+        settings['async_max_devices'] = max(devices, 1)
+
+    simulator = FakeRouterOS(devices, SimulatorOptions(interfaces=interfaces, arp_entries=arp)).start()
+    device_ids = []
+    for device_config in simulator.device_configs():
+        DataStore.devices[device_config['id']] = Device(**device_config)
+        device_ids.append(device_config['id'])
+
+    if client == 'async':
+        def collect() -> Any:
+            return mikrotik_api.collect_fleet_async(device_ids)
+    else:
+        executor = ThreadPoolExecutor(max_workers=int(config.get_setting('scheduler_max_workers', 20)))
+
+        def collect() -> Any:
+            return list(executor.map(mikrotik_api.collect_all_data, device_ids))
+
+    return collect, devices
+
+
+def case_detect_new_devices(devices: int, arp: int) -> Operation:
+    """detect_new_devices ở trạng thái ổn định (mọi MAC đã được biết)"""
+    import realtime_discovery
+    from models import DataStore
+
+    for index in range(devices):
+        device_id = f'bench-{index}'
+        DataStore.arp_entries[device_id] = _arp_entries(device_id, arp)
+    realtime_discovery.detect_new_devices()
+    return realtime_discovery.detect_new_devices, devices * arp
+
+
+def case_add_alert(alerts: int, path: str) -> Operation:
+    """AlertStore.add với `alerts` cảnh báo đang mở; path='duplicate' là cảnh báo đã tồn tại, 'new' là cảnh báo mới"""
+    from models import AlertStore, DataStore
+
+    DataStore.alerts = AlertStore()
+    for i in range(alerts):
+        DataStore.alerts.add(f'bench-{i}', 'cpu_load', 'CPU load high', 'warning')
+    if path == 'duplicate':
+        return (lambda: DataStore.alerts.add(f'bench-{alerts - 1}', 'cpu_load', 'CPU load high', 'warning')), 1
+
+    counter = itertools.count(alerts)
+    return (lambda: DataStore.alerts.add(f'bench-{next(counter)}', 'cpu_load', 'CPU load high', 'warning')), 1
+
+
+def case_evaluate_alerts(devices: int, interfaces: int, cold: bool) -> Operation:
+    """Lượt đánh giá luật cảnh báo cho cả nhóm thiết bị, 5% interface down và 1% có lỗi tăng
+
+    cold=True bỏ kết quả so sánh đã lưu trong mỗi block trước mỗi lượt, như khi mọi thiết bị vừa
+    được thu thập lại; cold=False là lượt mà các block vẫn giữ kết quả so sánh (lượt không có block
+    mới hay hết hạn được bỏ qua hoàn toàn nên cả hai trường hợp đều đánh dấu phạm vi đã thay đổi).
+    """
+    from datetime import timedelta
+
+    import alerting
+    from models import AlertStore, DataStore, Device, Interface, SystemResources
+
+    DataStore.alerts = AlertStore()
+    started = datetime.now()
+    for index in range(devices):
+        device_id = f'bench-{index}'
+        DataStore.devices[device_id] = Device(id=device_id, name=device_id, host='127.0.0.1')
+        alerting.engine.record_system(device_id, SystemResources(device_id, cpu_load=index % 100,
+                                                                 free_memory=50, total_memory=100))
+        for sample in range(2):
+            alerting.engine.record_interfaces(device_id, [
+                Interface(device_id=device_id, name=f'ether{i}', type='ether', running=i % 20 != 0,
+                          disabled=False, rx_error=sample * 1000 if i % 100 == 1 else 0,
+                          timestamp=started + timedelta(seconds=sample * 60))
+                for i in range(interfaces)
+            ])
+    blocks = [block for scoped in alerting.engine._blocks.values() for block in scoped.values()]
+
+    def evaluate() -> Any:
+        if cold:
+            for block in blocks:
+                block.matches.clear()
+        alerting.engine._changed.update(alerting.SCOPES)
+        return alerting.engine.evaluate()
+
+    return evaluate, devices * interfaces
+
+
+def case_history_append(devices: int, interfaces: int, points: int, layout: str) -> Operation:
+    """Thêm một điểm lịch sử cho mọi interface khi lịch sử đã đầy
+
+    layout='dicts' là cách lưu cũ (list dict), 'ring' là RingBuffer, 'gorilla' là CompressedRingBuffer.
+    """
+    from history import INTERFACE_DECIMALS, INTERFACE_FIELDS, make_history_buffer
+
+    now = time.time()
+    names = [f'ether{i}' for i in range(interfaces)]
+    if layout == 'dicts':
+        store: Dict[str, Dict[str, Any]] = {
+            f'bench-{d}': {
+                name: [{'timestamp': datetime.fromtimestamp(now + p).isoformat(), 'rx_byte': p, 'tx_byte': p,
+                        'rx_speed': float(p), 'tx_speed': float(p)} for p in range(points)]
+                for name in names
+            }
+            for d in range(devices)
+        }
+
+        def append() -> None:
+            stamp = datetime.now().isoformat()
+            for device_history in store.values():
+                for history in device_history.values():
+                    history.append({'timestamp': stamp, 'rx_byte': 1, 'tx_byte': 1, 'rx_speed': 1.0, 'tx_speed': 1.0})
+                    if len(history) > points:
+                        del history[:-points]
+    else:
+        store = {}
+        for d in range(devices):
+            device_history = store[f'bench-{d}'] = {}
+            for name in names:
+                mode = 'gorilla' if layout == 'gorilla' else 'array'
+                buffer = device_history[name] = make_history_buffer(INTERFACE_FIELDS, points, mode, INTERFACE_DECIMALS)
+                for p in range(points):
+                    buffer.append(now + p * 60, (p * 1000, p * 100, p * 16.667, p * 1.667))
+
+        rounds = itertools.count(points)
+
+        def append() -> None:
+            p = next(rounds)
+            stamp = now + p * 60
+            for device_history in store.values():
+                for history in device_history.values():
+                    history.append(stamp, (p * 1000, p * 100, 16.667, 1.667))
+
+    return append, devices * interfaces
+
+
+def case_report_percentile(interfaces: int) -> Operation:
+    """Báo cáo phân vị 95 tháng hiện tại cho `interfaces` interface, mỗi interface đủ một tháng mẫu 5 phút"""
+    import random
+    from reports import InterfaceUsage, ReportStore, month_of
+
+    store = ReportStore()
+    month = month_of(time.time())
+    start = time.time() - 30 * 86400
+    rng = random.Random(1)
+    for i in range(interfaces):
+        usage = store.usage.setdefault((f'bench-{i // 24}', f'ether{i % 24}'), {})
+        # Điền trực tiếp sketch thay vì gọi record 8640 lần cho mỗi interface
+        entry = usage[month] = InterfaceUsage(month)
+        for _ in range(8640):
+            value = rng.lognormvariate(13, 2)
+            entry.rx_sketch.add(value)
+            entry.tx_sketch.add(value / 4)
+        entry.samples = 8640
+        entry.slot = int(start // 300)
+
+    return (lambda: store.percentile_report(month)), interfaces
+
+
+def _api_client() -> Any:
+    """Flask test client trên app tối giản chỉ có blueprint API"""
+    from flask import Flask
+    from routes.api import api
+
+    app = Flask(__name__)
+    app.register_blueprint(api, url_prefix='/api')
+    return app.test_client()
+
+
+def _get(client: Any, url: str) -> Callable[[], Any]:
+    def request() -> Any:
+        response = client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError(f"GET {url} returned {response.status_code}")
+        return response.data
+    return request
+
+
+def case_api_interfaces(interfaces: int) -> Operation:
+    """GET /api/interfaces/<device_id>"""
+    _synthetic_interfaces('bench', interfaces)
+    return _get(_api_client(), '/api/interfaces/bench'), interfaces
+
+
+def case_api_arp(arp: int) -> Operation:
+    """GET /api/arp/<device_id>"""
+    from models import DataStore
+
+    DataStore.arp_entries['bench'] = _arp_entries('bench', arp)
+    return _get(_api_client(), '/api/arp/bench'), arp
+
+
+def case_api_alerts(alerts: int, devices: int) -> Operation:
+    """GET /api/alerts?device_id=... với cảnh báo phân bố đều trên các thiết bị"""
+    from models import AlertStore, DataStore
+
+    DataStore.alerts = AlertStore()
+    for i in range(alerts):
+        DataStore.alerts.add(f'bench-{i % devices}', 'interface_down', 'Interface down', 'error',
+                             subject=f'ether{i}')
+    return _get(_api_client(), '/api/alerts?device_id=bench-0'), alerts // devices
+
+
+# Tên trường hợp -> (hàm tạo, tham số cho profile quick, tham số bổ sung cho profile full)
+CASES: Dict[str, Tuple[Callable[..., Operation], List[Dict[str, Any]], List[Dict[str, Any]]]] = {
+    'collect_interfaces': (
+        case_collect_interfaces,
+        [{'interfaces': n} for n in (10, 100, 1000)],
+        [{'interfaces': 10000}],
+    ),
+    'collect_all_data': (
+        case_collect_all_data,
+        [{'devices': d, 'interfaces': 24, 'arp': 100, 'client': c} for d in (1, 10) for c in ('threaded', 'async')],
+        [{'devices': d, 'interfaces': 24, 'arp': a, 'client': c}
+         for d, a in ((100, 100), (10, 1000)) for c in ('threaded', 'async')],
+    ),
+    'detect_new_devices': (
+        case_detect_new_devices,
+        [{'devices': d, 'arp': a} for d, a in ((10, 100), (10, 1000))],
+        [{'devices': d, 'arp': a} for d, a in ((100, 1000), (1000, 100))],
+    ),
+    'add_alert': (
+        case_add_alert,
+        [{'alerts': n, 'path': p} for n in (100, 1000) for p in ('duplicate', 'new')],
+        [{'alerts': 10000, 'path': p} for p in ('duplicate', 'new')],
+    ),
+    'evaluate_alerts': (
+        case_evaluate_alerts,
+        [{'devices': d, 'interfaces': 100, 'cold': c} for d in (10, 100) for c in (False, True)],
+        [{'devices': 1000, 'interfaces': 100, 'cold': c} for c in (False, True)],
+    ),
+    'history_append': (
+        case_history_append,
+        [{'devices': 30, 'interfaces': 50, 'points': 288, 'layout': l} for l in ('dicts', 'ring', 'gorilla')],
+        [{'devices': 300, 'interfaces': 50, 'points': 288, 'layout': l} for l in ('dicts', 'ring', 'gorilla')],
+    ),
+    'report_percentile': (
+        case_report_percentile,
+        [{'interfaces': n} for n in (100, 1000)],
+        [{'interfaces': 10000}],
+    ),
+    'api_interfaces': (
+        case_api_interfaces,
+        [{'interfaces': n} for n in (100, 1000)],
+        [{'interfaces': 10000}],
+    ),
+    'api_arp': (
+        case_api_arp,
+        [{'arp': n} for n in (1000, 10000)],
+        [{'arp': 50000}],
+    ),
+    'api_alerts': (
+        case_api_alerts,
+        [{'alerts': n, 'devices': 10} for n in (1000, 10000)],
+        [{'alerts': 100000, 'devices': 100}],
+    ),
+}
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_case(name: str, params: Dict[str, Any], iterations: int, min_time: float) -> Dict[str, Any]:
+    """Chạy một trường hợp trong tiến trình hiện tại"""
+    _prepare_environment()
+    operation, items = CASES[name][0](**params)
+
+    # Làm nóng: lần chạy đầu mở kết nối, tạo cache...
+    operation()
+
+    latencies = []
+    started = time.perf_counter()
+    while len(latencies) < iterations or (time.perf_counter() - started < min_time and len(latencies) < iterations * 100):
+        op_started = time.perf_counter()
+        operation()
+        latencies.append(time.perf_counter() - op_started)
+    total = time.perf_counter() - started
+    latencies.sort()
+
+    return {
+        'benchmark': name,
+        'params': params,
+        'iterations': len(latencies),
+        'ops_per_sec': round(len(latencies) / total, 3),
+        'items_per_sec': round(len(latencies) * items / total, 1),
+        'p50_ms': round(_percentile(latencies, 0.50) * 1000, 4),
+        'p99_ms': round(_percentile(latencies, 0.99) * 1000, 4),
+        'max_ms': round(latencies[-1] * 1000, 4),
+        # ru_maxrss tính bằng KB trên Linux, byte trên macOS
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                             / (1048576 if sys.platform == 'darwin' else 1024), 1)
+    }
+
+
+def _run_isolated(name: str, params: Dict[str, Any], iterations: int, min_time: float) -> Dict[str, Any]:
+    """Chạy một trường hợp trong tiến trình con và đọc kết quả JSON từ stdout"""
+    command = [sys.executable, '-m', 'benchmarks.suite', '--case', name, '--params', json.dumps(params),
+               '--iterations', str(iterations), '--min-time', str(min_time)]
+    completed = subprocess.run(command, capture_output=True, text=True)
+    if completed.returncode != 0:
+        return {'benchmark': name, 'params': params, 'error': completed.stderr.strip().splitlines()[-1:]}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def _result_key(result: Dict[str, Any]) -> str:
+    return f"{result['benchmark']} {json.dumps(result['params'], sort_keys=True)}"
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, threshold: float) -> int:
+    """In tỉ lệ p50 so với kết quả cũ, trả về số trường hợp chậm đi quá ngưỡng"""
+    with open(baseline_path) as f:
+        baseline = {_result_key(result): result for result in json.load(f)['results'] if 'error' not in result}
+
+    regressions = 0
+    print(f"\nSo với {baseline_path} (p50 mới / p50 cũ):")
+    for result in results:
+        old = baseline.get(_result_key(result))
+        if old is None or 'error' in result or not old['p50_ms']:
+            continue
+        ratio = result['p50_ms'] / old['p50_ms']
+        flag = ''
+        if ratio > threshold:
+            regressions += 1
+            flag = '  <-- chậm hơn'
+        print(f"  {_result_key(result):<80} {ratio:6.2f}x{flag}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profile', choices=('quick', 'full'), default='quick')
+    parser.add_argument('--only', help='Chỉ chạy các trường hợp này (phân tách bằng dấu phẩy)')
+    parser.add_argument('--iterations', type=int, default=20, help='Số lần đo tối thiểu mỗi trường hợp')
+    parser.add_argument('--min-time', type=float, default=1.0, help='Thời gian đo tối thiểu mỗi trường hợp (giây)')
+    parser.add_argument('--output', help='Ghi kết quả JSON ra file')
+    parser.add_argument('--compare', help='File JSON kết quả cũ để so sánh')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='Tỉ lệ p50 tối đa so với kết quả cũ trước khi coi là chậm đi')
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    parser.add_argument('--params', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(args.case, json.loads(args.params), args.iterations, args.min_time)))
+        return 0
+
+    names = args.only.split(',') if args.only else list(CASES)
+    unknown = [name for name in names if name not in CASES]
+    if unknown:
+        parser.error(f"Unknown benchmark(s): {', '.join(unknown)}")
+
+    results = []
+    print(f"{'benchmark':<20} {'params':<62} {'ops/s':>10} {'items/s':>12} {'p50 ms':>10} {'p99 ms':>10} {'RSS MB':>8}")
+    for name in names:
+        _, quick, full = CASES[name]
+        for params in quick + (full if args.profile == 'full' else []):
+            result = _run_isolated(name, params, args.iterations, args.min_time)
+            results.append(result)
+            label = json.dumps(params, sort_keys=True)
+            if 'error' in result:
+                print(f"{name:<20} {label:<62} lỗi: {result['error']}")
+                continue
+            print(f"{name:<20} {label:<62} {result['ops_per_sec']:>10.1f} {result['items_per_sec']:>12.0f} "
+                  f"{result['p50_ms']:>10.3f} {result['p99_ms']:>10.3f} {result['peak_rss_mb']:>8.1f}")
+
+    report = {
+        'revision': _git_revision(),
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'profile': args.profile,
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nĐã ghi kết quả vào {args.output}")
+
+    if args.compare:
+        return 1 if compare(results, args.compare, args.threshold) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
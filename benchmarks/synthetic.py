@@ -0,0 +1,117 @@
+"""
+Dữ liệu RouterOS giả lập trong bộ nhớ để benchmark collector mà không cần thiết bị thật
+"""
+
+import random
+from typing import Any, Dict, List, Optional
+
+
+class SyntheticResource:
+    """Resource giả lập trả về dữ liệu dựng sẵn theo đường dẫn"""
+
+    def __init__(self, api: 'SyntheticApi', path: str):
+        self.api = api
+        self.path = path
+
+    def get(self, **kwargs) -> List[Dict[str, str]]:
+        self.api.calls += 1
+        return self.api.print_path(self.path)
+
+    def call(self, command: str, arguments: Optional[Dict[str, str]] = None,
+             queries: Optional[Dict[str, str]] = None) -> List[Dict[str, str]]:
+        self.api.calls += 1
+        if self.path == '/interface' and command == 'monitor-traffic':
+            names = set((arguments or {}).get('interface', '').split(','))
+            return [item for item in self.api.monitor_traffic() if item['name'] in names]
+        if self.path == '/interface/ethernet' and command == 'monitor':
+            names = (arguments or {}).get('numbers', '').split(',')
+            return [{'name': name, 'status': 'link-ok', 'rate': '1Gbps'} for name in names
+                    if name in self.api.counters]
+        return []
+
+
+class SyntheticApi:
+    """API RouterOS giả lập với số interface và ARP entry tùy chỉnh
+
+    Mỗi lần gọi /interface, counter tăng thêm một lượng ngẫu nhiên như router thật.
+    """
+
+    def __init__(self, interfaces: int = 10, arp_entries: int = 10, seed: int = 1):
+        self.calls = 0
+        self.random = random.Random(seed)
+        self.interface_names = [self._interface_name(i) for i in range(interfaces)]
+        self.counters = {name: [0, 0] for name in self.interface_names}
+        self.arp = [
+            {
+                '.id': f'*{i:X}',
+                'address': f'10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}',
+                'mac-address': '',
+                'interface': self.interface_names[i % len(self.interface_names)] if self.interface_names else '',
+                'dynamic': 'true',
+                'complete': 'true'
+            }
+            for i in range(arp_entries)
+        ]
+
+    @staticmethod
+    def _interface_name(index: int) -> str:
+        if index < 8:
+            return f'ether{index + 1}'
+        return f'vlan{index}'
+
+    def get_resource(self, path: str) -> SyntheticResource:
+        return SyntheticResource(self, path)
+
+    def get_binary_resource(self, path: str) -> SyntheticResource:
+        return SyntheticResource(self, path)
+
+    def print_path(self, path: str) -> List[Dict[str, str]]:
+        if path == '/interface':
+            return self.interfaces()
+        if path == '/interface/ethernet':
+            return [{'name': name, 'rate': '1Gbps'} for name in self.interface_names if name.startswith('ether')]
+        if path == '/system/resource':
+            return [{
+                'uptime': '1w2d', 'version': '7.15', 'cpu-load': str(self.random.randint(1, 60)),
+                'free-memory': '536870912', 'total-memory': '1073741824',
+                'free-hdd-space': '100000000', 'total-hdd-space': '134217728',
+                'architecture-name': 'arm64', 'board-name': 'CCR2004', 'platform': 'MikroTik'
+            }]
+        if path == '/system/identity':
+            return [{'name': 'synthetic'}]
+        if path == '/ip/arp':
+            return self.arp
+        if path == '/log':
+            return [{'time': '00:00:01', 'topics': 'system,info', 'message': 'synthetic log'}]
+        return []
+
+    def interfaces(self) -> List[Dict[str, str]]:
+        result = []
+        for index, name in enumerate(self.interface_names):
+            counters = self.counters[name]
+            counters[0] += self.random.randint(0, 10_000_000)
+            counters[1] += self.random.randint(0, 10_000_000)
+            result.append({
+                '.id': f'*{index:X}',
+                'name': name,
+                'type': 'ether' if name.startswith('ether') else 'vlan',
+                'running': 'true',
+                'disabled': 'false',
+                'rx-byte': str(counters[0]),
+                'tx-byte': str(counters[1]),
+                'rx-packet': str(counters[0] // 1000),
+                'tx-packet': str(counters[1] // 1000),
+                'actual-mtu': '1500',
+                'mac-address': '4C:5E:0C:00:00:01'
+            })
+        return result
+
+    def monitor_traffic(self) -> List[Dict[str, str]]:
+        return [
+            {
+                'name': name,
+                'rx-bits-per-second': str(self.random.randint(0, 1_000_000_000)),
+                'tx-bits-per-second': str(self.random.randint(0, 1_000_000_000))
+            }
+            for name in self.interface_names
+        ]
@@ -1,7 +1,13 @@
 import os
+import copy
 import json
+import atexit
+import tempfile
+import threading
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, Any, List
+from types import MappingProxyType
+from typing import Dict, Any, Iterator, List, Mapping, Optional, Sequence, Tuple
 
 # Default configuration
 DEFAULT_CONFIG = {
@@ -28,98 +34,312 @@ DEFAULT_CONFIG = {
         }
     ],
     "refresh_interval": 60,  # seconds
+    # Per-collector polling intervals in seconds, collectors not listed use refresh_interval.
+    # Names: system, interfaces, ip_addresses, arp, dhcp, firewall, wireless, capsman, logs
+    # Example: {"interfaces": 10, "system": 30, "arp": 60, "dhcp": 60, "firewall": 600, "ip_addresses": 600}
+    "collector_intervals": {},
     "interface_history_points": 288,  # 24 hours with 5-minute intervals
+    # "array" keeps raw interface history uncompressed, "gorilla" compresses it in blocks (delta-of-delta
+    # timestamps, XOR floats) so interface_history_points can be raised several times for the same memory
+    "interface_history_mode": "array",
     "system_history_points": 288,  # 24 hours with 5-minute intervals
+    # Consolidated history kept per resolution (number of buckets): 6 hours of 1m, 2 days of 5m,
+    # 31 days of 1h and a year of 1d. Set a resolution to 0 to disable it.
+    "history_rollups": {"1m": 360, "5m": 576, "1h": 744, "1d": 365},
+    # On-disk time-series store (tsdb.py) for history beyond what is kept in memory
+    "tsdb_enabled": False,
+    "tsdb_path": "data/tsdb",
+    "tsdb_retention_days": 365,  # Whole segments older than this are deleted
+    "tsdb_compact_after_days": 7,  # Daily segments older than this are merged into monthly segments
+    "tsdb_flush_interval": 60,  # Seconds between writes of buffered samples to disk
+    # Monthly 95th-percentile / traffic volume reports per interface (reports.py)
+    "reports_enabled": False,
+    "reports_path": "data/reports.json",
+    "report_months": 13,  # Months of report data kept per interface
+    "reports_save_interval": 300,  # Seconds between writes of report state to disk
+    # SQLite snapshot of the latest collected data (persistence.py), loaded again on startup
+    "snapshot_enabled": False,
+    "snapshot_path": "data/snapshot.db",
+    "snapshot_interval": 30,  # Seconds between snapshot writes (one transaction for all changed devices)
     "thresholds": {
         "cpu_load": 80,  # percentage
         "memory_usage": 80,  # percentage
         "disk_usage": 80,  # percentage
         "interface_usage": 80  # percentage
     },
+    # Additional alert rules, or overrides of the default rules built from "thresholds" (alerting.py), e.g.
+    # {"name": "interface_errors", "scope": "interface", "metric": "error_rate", "op": ">",
+    #  "threshold": 0.1, "clear": 0, "for": 120, "severity": "warning"}; "enabled": false disables a rule
+    "alert_rules": [],
+    "alert_evaluation_interval": 10,  # Seconds between fleet-wide evaluations of the alert rules
+    # Alert notifications (notifications.py). Sinks: {"type": "webhook", "url": ...} or
+    # {"type": "smtp", "host": ..., "port": 25, "sender": ..., "recipients": [...], "starttls": false,
+    #  "username": ..., "password": ...}; every sink also accepts "rate_limit" (messages per minute),
+    # "max_retries" and "min_severity"
+    "notifications_enabled": False,
+    "notification_sinks": [],
+    "notification_batch_window": 10,  # Seconds of alert changes combined into one digest per site
+    "notification_queue_size": 10000,  # Pending alert changes kept before new ones are dropped
     # Connection settings
     "use_ssl": False,  # Whether to use SSL for API connections
     "connection_timeout": 10,  # Timeout in seconds for connection attempts
     "connection_retries": 2,  # Number of retries for failed connections
-    "retry_delay": 1  # Delay in seconds between connection retries
+    "retry_delay": 1,  # Delay in seconds between connection retries
+    # Collection pipeline settings
+    "collector_workers_per_device": 3,  # Max collectors running concurrently against one device
+    "collector_workers_total": 32,  # Max collectors running concurrently across all devices
+    # "threaded" uses routeros_api, "async" pipelines every command of a cycle over one asyncio socket
+    "api_client": "threaded",
+    "async_max_devices": 256,  # Max devices polled concurrently by the async client
+    # Scheduling settings
+    "schedule_mode": "staggered",  # "staggered" spreads devices across the interval, "aligned" polls all at once
+    "schedule_jitter": 0,  # Random delay in seconds added to each scheduled run
+    "scheduler_max_workers": 20  # Size of the scheduler thread pool
 }
 
 CONFIG_FILE = 'config.json'
 
-def load_config() -> Dict[str, Any]:
-    """Load configuration from file or create with defaults"""
-    config = DEFAULT_CONFIG.copy()
+# Thời gian gom các thay đổi liên tiếp thành một lần ghi file (giây)
+WRITE_COALESCE_DELAY = 1.0
+
+# Thời gian chờ trước khi thử ghi lại khi ghi file cấu hình lỗi (giây)
+WRITE_RETRY_DELAY = 5.0
+
+# Bộ nhớ đệm cấu hình dùng chung cho toàn tiến trình
+_cache_lock = threading.RLock()
+_cache: Dict[str, Any] = {
+    'key': None,       # (mtime_ns, inode, size) của file khi được đọc
+    'config': None,    # Cấu hình đã parse (chỉ dùng nội bộ)
+    'snapshot': None,  # Bản chụp chỉ đọc trả về cho người dùng
+    'device_index': {},  # Chỉ mục thiết bị theo id của bản chụp hiện tại
+    'pending': False,  # Có thay đổi trong bộ nhớ chưa được ghi xuống file
+    'timer': None      # Timer ghi file đang chờ
+}
+
+# Transaction đang mở trên luồng hiện tại
+_tx_local = threading.local()
+
+def _file_key() -> Optional[Tuple[int, int, int]]:
+    """Định danh phiên bản file cấu hình theo mtime, inode và kích thước"""
+    try:
+        stat = os.stat(CONFIG_FILE)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_ino, stat.st_size)
+
+def _freeze(value: Any) -> Any:
+    """Chuyển dict/list lồng nhau thành dạng chỉ đọc"""
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+def _set_cache(config: Dict[str, Any], key: Optional[Tuple[int, int, int]]) -> Mapping[str, Any]:
+    """Cập nhật bộ nhớ đệm với cấu hình mới"""
+    _cache['config'] = config
+    snapshot = _freeze(config)
+    _cache['device_index'] = {d.get('id'): d for d in snapshot.get('devices', ())}
+    _cache['snapshot'] = snapshot
+    _cache['key'] = key
+    return snapshot
+
+def get_snapshot() -> Mapping[str, Any]:
+    """Lấy bản chụp cấu hình chỉ đọc, chỉ đọc lại file khi file đã thay đổi"""
+    snapshot = _cache['snapshot']
+    # Khi còn thay đổi chờ ghi, bản trong bộ nhớ là bản mới nhất
+    if snapshot is not None and _cache['pending']:
+        return snapshot
     
-    if Path(CONFIG_FILE).exists():
-        try:
-            with open(CONFIG_FILE, 'r') as f:
-                file_config = json.load(f)
-                config.update(file_config)
-        except Exception as e:
-            print(f"Error loading config: {e}")
-    else:
-        save_config(config)
+    key = _file_key()
+    if snapshot is not None and key is not None and _cache['key'] == key:
+        return snapshot
+    
+    with _cache_lock:
+        key = _file_key()
+        if _cache['snapshot'] is not None and (_cache['pending'] or (key is not None and _cache['key'] == key)):
+            return _cache['snapshot']
+        
+        config = copy.deepcopy(DEFAULT_CONFIG)
+        if key is not None:
+            try:
+                with open(CONFIG_FILE, 'r') as f:
+                    file_config = json.load(f)
+                    config.update(file_config)
+            except Exception as e:
+                print(f"Error loading config: {e}")
+        else:
+            _write_file(config)
+            key = _file_key()
+        
+        return _set_cache(config, key)
+
+def get_setting(key: str, default: Any = None) -> Any:
+    """Đọc một giá trị cấu hình từ bộ nhớ đệm"""
+    return get_snapshot().get(key, default)
+
+def load_config() -> Dict[str, Any]:
+    """Load configuration from file or create with defaults
     
-    return config
+    Trả về bản sao có thể chỉnh sửa; các đường đọc thường xuyên nên dùng get_snapshot/get_setting.
+    """
+    get_snapshot()
+    with _cache_lock:
+        return copy.deepcopy(_cache['config'])
 
-def save_config(config: Dict[str, Any]) -> None:
-    """Save configuration to file"""
+def _write_file(config: Dict[str, Any]) -> bool:
+    """Ghi cấu hình an toàn: ghi ra file tạm, fsync rồi đổi tên thay thế file cũ"""
+    directory = os.path.dirname(os.path.abspath(CONFIG_FILE))
+    fd, tmp_path = tempfile.mkstemp(prefix='.config.', suffix='.tmp', dir=directory)
     try:
-        with open(CONFIG_FILE, 'w') as f:
+        with os.fdopen(fd, 'w') as f:
             json.dump(config, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, CONFIG_FILE)
     except Exception as e:
         print(f"Error saving config: {e}")
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        return False
+    
+    # Đảm bảo thao tác đổi tên được ghi xuống đĩa
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    except OSError:
+        pass
+    return True
+
+def flush() -> None:
+    """Ghi ngay các thay đổi cấu hình đang chờ xuống file"""
+    with _cache_lock:
+        timer = _cache['timer']
+        if timer is not None:
+            timer.cancel()
+            _cache['timer'] = None
+        
+        if not _cache['pending']:
+            return
+        
+        if _write_file(_cache['config']):
+            _cache['key'] = _file_key()
+            _cache['pending'] = False
+        else:
+            # Thay đổi vẫn chỉ có trong bộ nhớ: thử ghi lại thay vì chờ lần thay đổi tiếp theo
+            _schedule_flush(WRITE_RETRY_DELAY)
 
-def get_sites() -> List[Dict[str, Any]]:
-    """Lấy danh sách các site đã cấu hình"""
-    return load_config().get('sites', [])
+def _schedule_flush(delay: float) -> None:
+    """Hẹn giờ ghi file nếu chưa có lần ghi nào đang chờ (gọi khi giữ _cache_lock)"""
+    if _cache['timer'] is None:
+        timer = threading.Timer(delay, flush)
+        timer.daemon = True
+        _cache['timer'] = timer
+        timer.start()
 
-def get_devices() -> List[Dict[str, Any]]:
-    """Lấy danh sách các thiết bị đã cấu hình"""
-    return load_config().get('devices', [])
+def _commit(config: Dict[str, Any], coalesce: bool) -> None:
+    """Áp dụng cấu hình mới cho bộ nhớ đệm và ghi file (ngay hoặc gom lại)"""
+    with _cache_lock:
+        _set_cache(config, _cache['key'])
+        _cache['pending'] = True
+        
+        if not coalesce:
+            flush()
+            return
+        
+        # Các thay đổi trong khoảng WRITE_COALESCE_DELAY được gom vào một lần ghi
+        _schedule_flush(WRITE_COALESCE_DELAY)
+
+@contextmanager
+def transaction(coalesce: bool = True) -> Iterator[Dict[str, Any]]:
+    """Gom nhiều thay đổi cấu hình và ghi file một lần khi kết thúc
+    
+    Ví dụ:
+        with config.transaction():
+            for device in devices:
+                config.add_device(device)
+    
+    Transaction lồng nhau dùng chung cấu hình của transaction ngoài cùng.
+    Nếu có lỗi, mọi thay đổi trong transaction bị hủy.
+    """
+    current = getattr(_tx_local, 'config', None)
+    if current is not None:
+        yield current
+        return
+    
+    with _cache_lock:
+        config = load_config()
+        _tx_local.config = config
+        try:
+            yield config
+        finally:
+            _tx_local.config = None
+        _commit(config, coalesce)
 
-def get_devices_by_site(site_id: str) -> List[Dict[str, Any]]:
+def save_config(config: Dict[str, Any], coalesce: bool = True) -> None:
+    """Save configuration to file"""
+    _commit(copy.deepcopy(config), coalesce)
+
+def get_sites() -> Sequence[Mapping[str, Any]]:
+    """Lấy danh sách các site đã cấu hình (chỉ đọc)"""
+    return get_snapshot().get('sites', ())
+
+def get_devices() -> Sequence[Mapping[str, Any]]:
+    """Lấy danh sách các thiết bị đã cấu hình (chỉ đọc)"""
+    return get_snapshot().get('devices', ())
+
+def get_device(device_id: str) -> Optional[Mapping[str, Any]]:
+    """Lấy cấu hình của một thiết bị theo id (chỉ đọc)"""
+    get_snapshot()
+    return _cache['device_index'].get(device_id)
+
+def get_devices_by_site(site_id: str) -> List[Mapping[str, Any]]:
     """Lấy danh sách thiết bị theo site"""
     return [d for d in get_devices() if d.get('site_id') == site_id]
 
 def add_site(site: Dict[str, Any]) -> None:
     """Thêm hoặc cập nhật một site"""
-    config = load_config()
-    # Tạo ID nếu chưa có
-    if 'id' not in site:
-        import uuid
-        site['id'] = str(uuid.uuid4())
-    
-    # Kiểm tra xem site đã tồn tại chưa
-    for i, s in enumerate(config.get('sites', [])):
-        if s['id'] == site['id']:
-            # Cập nhật site hiện có
-            config['sites'][i] = site
-            save_config(config)
-            return
-    
-    # Thêm site mới
-    if 'sites' not in config:
-        config['sites'] = []
-    config['sites'].append(site)
-    save_config(config)
+    with transaction() as config:
+        # Tạo ID nếu chưa có
+        if not site.get('id'):
+            import uuid
+            site['id'] = str(uuid.uuid4())
+        
+        # Kiểm tra xem site đã tồn tại chưa
+        for i, s in enumerate(config.get('sites', [])):
+            if s['id'] == site['id']:
+                # Cập nhật site hiện có
+                config['sites'][i] = site
+                return
+        
+        # Thêm site mới
+        if 'sites' not in config:
+            config['sites'] = []
+        config['sites'].append(site)
 
 def remove_site(site_id: str) -> None:
     """Xóa một site và tất cả thiết bị liên quan"""
-    config = load_config()
-    
-    # Xóa site
-    config['sites'] = [s for s in config.get('sites', []) if s['id'] != site_id]
-    
-    # Xóa các thiết bị trong site này
-    config['devices'] = [d for d in config.get('devices', []) if d.get('site_id') != site_id]
-    
-    save_config(config)
+    with transaction() as config:
+        # Xóa site
+        config['sites'] = [s for s in config.get('sites', []) if s['id'] != site_id]
+        
+        # Xóa các thiết bị trong site này
+        config['devices'] = [d for d in config.get('devices', []) if d.get('site_id') != site_id]
 
 def add_device(device: Dict[str, Any]) -> None:
     """Thêm hoặc cập nhật một thiết bị"""
-    config = load_config()
+    with transaction() as config:
+        _add_device(config, device)
+
+def _add_device(config: Dict[str, Any], device: Dict[str, Any]) -> None:
+    """Thêm hoặc cập nhật thiết bị trong cấu hình của transaction hiện tại"""
     # Tạo ID nếu chưa có
-    if 'id' not in device:
+    if not device.get('id'):
         import uuid
         device['id'] = str(uuid.uuid4())
     
@@ -150,23 +370,20 @@ def add_device(device: Dict[str, Any]) -> None:
         if d['id'] == device['id']:
             # Cập nhật thiết bị hiện có
             config['devices'][i] = device
-            save_config(config)
             return
     
     # Thêm thiết bị mới
     if 'devices' not in config:
         config['devices'] = []
     config['devices'].append(device)
-    save_config(config)
 
 def remove_device(device_id: str) -> None:
     """Xóa một thiết bị và làm sạch dữ liệu liên quan"""
     from models import DataStore
     
     # Xóa device khỏi cấu hình
-    config = load_config()
-    config['devices'] = [d for d in config.get('devices', []) if d['id'] != device_id]
-    save_config(config)
+    with transaction() as config:
+        config['devices'] = [d for d in config.get('devices', []) if d['id'] != device_id]
     
     # Làm sạch dữ liệu thiết bị trong DataStore
     if device_id in DataStore.devices:
@@ -179,12 +396,31 @@ def remove_device(device_id: str) -> None:
     # Xóa lịch sử hệ thống
     if device_id in DataStore.system_history:
         del DataStore.system_history[device_id]
+    DataStore.system_rollups.pop(device_id, None)
     
     # Xóa giao diện và lịch sử giao diện
     if device_id in DataStore.interfaces:
         del DataStore.interfaces[device_id]
+    if device_id in DataStore.interface_index:
+        del DataStore.interface_index[device_id]
     if device_id in DataStore.interface_history:
         del DataStore.interface_history[device_id]
+    DataStore.interface_rollups.pop(device_id, None)
+    
+    # Xóa lịch sử trên đĩa
+    import tsdb
+    store = tsdb.get_store()
+    if store is not None:
+        store.remove_device(device_id)
+    
+    import persistence
+    snapshot = persistence.get_store()
+    if snapshot is not None:
+        snapshot.remove_device(device_id)
+    
+    # Xóa số liệu báo cáo (reports.json được ghi lại ở lần lưu kế tiếp)
+    import reports
+    reports.report_store.remove_device(device_id)
     
     # Xóa các dữ liệu khác
     if device_id in DataStore.ip_addresses:
@@ -203,12 +439,18 @@ def remove_device(device_id: str) -> None:
         del DataStore.logs[device_id]
     
     # Lọc các cảnh báo liên quan đến thiết bị
-    DataStore.alerts = [a for a in DataStore.alerts if a.device_id != device_id]
+    DataStore.alerts.remove_device(device_id)
+    import alerting
+    alerting.engine.remove_device(device_id)
 
 def get_refresh_interval() -> int:
     """Get the data refresh interval in seconds"""
-    return load_config().get('refresh_interval', 60)
+    return get_setting('refresh_interval', 60)
 
-def get_thresholds() -> Dict[str, int]:
+def get_thresholds() -> Mapping[str, int]:
     """Get the alert thresholds configuration"""
-    return load_config().get('thresholds', DEFAULT_CONFIG['thresholds'])
+    return get_setting('thresholds', DEFAULT_CONFIG['thresholds'])
+
+
+# Ghi các thay đổi còn chờ trước khi tiến trình kết thúc
+atexit.register(flush)
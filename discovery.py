@@ -139,25 +139,23 @@ def add_discovered_devices(devices: List[Dict[str, Any]], site_id: str) -> Tuple
     """
     new_count = 0
     existing_count = 0
-    existing_devices = config.get_devices()
+    existing_hosts = {existing_device['host'] for existing_device in config.get_devices()}
     
-    for device_info in devices:
-        # Kiểm tra xem thiết bị đã tồn tại hay chưa (theo địa chỉ IP)
-        is_existing = False
-        for existing_device in existing_devices:
-            if existing_device['host'] == device_info['host']:
-                is_existing = True
+    # Gom toàn bộ thiết bị mới vào một lần ghi cấu hình
+    with config.transaction():
+        for device_info in devices:
+            # Kiểm tra xem thiết bị đã tồn tại hay chưa (theo địa chỉ IP)
+            if device_info['host'] in existing_hosts:
                 existing_count += 1
-                break
-        
-        if not is_existing:
-            # Thêm site_id vào thiết bị
-            device_info['site_id'] = site_id
-            
-            # Thêm vào cấu hình
-            config.add_device(device_info)
-            new_count += 1
-            logger.info(f"Đã thêm thiết bị mới: {device_info['name']} ({device_info['host']})")
+            else:
+                # Thêm site_id vào thiết bị
+                device_info['site_id'] = site_id
+                
+                # Thêm vào cấu hình
+                config.add_device(device_info)
+                existing_hosts.add(device_info['host'])
+                new_count += 1
+                logger.info(f"Đã thêm thiết bị mới: {device_info['name']} ({device_info['host']})")
     
     return new_count, existing_count
 
@@ -0,0 +1,526 @@
+"""
+Giả lập thiết bị Mikrotik nói giao thức RouterOS API để kiểm thử tải các collector
+
+Mỗi thiết bị ảo lắng nghe trên một cổng riêng (cùng địa chỉ) hoặc một địa chỉ 127.0.x.y riêng
+(cùng cổng, để discovery.scan_network quét được theo dải mạng). Kích thước bảng interface/ARP,
+độ trễ, tỉ lệ rớt kết nối và việc tràn counter 32-bit đều cấu hình được.
+
+Chạy độc lập:
+    python fake_routeros.py --devices 100 --base-port 18728
+    python fake_routeros.py --devices 254 --base-address 127.0.1.1 --port 8728 --print-devices
+"""
+
+import argparse
+import asyncio
+import binascii
+import hashlib
+import ipaddress
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from routeros_async import SentenceDecoder, encode_sentence
+
+logger = logging.getLogger(__name__)
+
+COUNTER_WRAP = 2 ** 32
+
+
+@dataclass
+class SimulatorOptions:
+    """Cấu hình chung cho các thiết bị ảo"""
+    interfaces: int = 8
+    arp_entries: int = 50
+    dhcp_leases: int = 50
+    log_entries: int = 100
+    capsman_clients: int = 0  # 0: thiết bị không có CAPsMAN, lệnh trả về lỗi như router thật
+    latency: float = 0.0  # Độ trễ mỗi lệnh (giây)
+    jitter: float = 0.0  # Độ trễ ngẫu nhiên thêm vào mỗi lệnh (giây)
+    drop_rate: float = 0.0  # Xác suất đóng kết nối thay vì trả lời một lệnh
+    counter_wrap: bool = False  # Counter byte là 32-bit và bắt đầu gần ngưỡng tràn
+    max_bps: int = 100_000_000  # Lưu lượng tối đa mỗi interface (bit/giây)
+    username: str = 'admin'
+    password: str = ''
+    legacy_login: bool = False  # Đăng nhập kiểu challenge MD5 (RouterOS trước 6.43)
+    seed: int = 1
+
+
+def _mac(prefix: int, index: int) -> str:
+    value = (prefix << 24) | (index & 0xFFFFFF)
+    return ':'.join(f'{(value >> shift) & 0xFF:02X}' for shift in range(40, -8, -8))
+
+
+class VirtualDevice:
+    """Trạng thái và dữ liệu của một router ảo"""
+
+    def __init__(self, index: int, options: SimulatorOptions):
+        self.index = index
+        self.options = options
+        self.random = random.Random(options.seed * 100003 + index)
+        self.identity = f'fake-{index}'
+        self.started = time.time()
+
+        self.interface_names = [f'ether{i + 1}' if i < 8 else f'vlan{i}' for i in range(options.interfaces)]
+        # Counter bắt đầu gần ngưỡng tràn để các chu kỳ đầu đã gặp trường hợp tràn
+        start = COUNTER_WRAP - options.max_bps if options.counter_wrap else 0
+        self.counters = {name: [start, start] for name in self.interface_names}
+        self.rates = {name: (self.random.randint(0, options.max_bps), self.random.randint(0, options.max_bps))
+                      for name in self.interface_names}
+        self.counters_updated = time.monotonic()
+
+        self.arp = [
+            {
+                '.id': f'*{i + 1:X}',
+                'address': f'10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}',
+                'mac-address': _mac(0x4C5E0C, i),
+                'interface': self.interface_names[i % len(self.interface_names)] if self.interface_names else 'bridge',
+                'dynamic': 'true',
+                'complete': 'true'
+            }
+            for i in range(options.arp_entries)
+        ]
+        self.leases = [
+            {
+                '.id': f'*{i + 1:X}',
+                'address': f'192.168.{(i >> 8) & 255}.{i & 255}',
+                'mac-address': _mac(0x001122, i),
+                'client-id': f'1:{_mac(0x001122, i).lower()}',
+                'host-name': f'host-{i}',
+                'status': 'bound',
+                'expires-after': '9m58s'
+            }
+            for i in range(options.dhcp_leases)
+        ]
+        self.logs = [
+            {
+                '.id': f'*{i + 1:X}',
+                'time': time.strftime('%H:%M:%S', time.localtime(self.started - (options.log_entries - i))),
+                'topics': 'system,info',
+                'message': f'simulated event {i}'
+            }
+            for i in range(options.log_entries)
+        ]
+        self.capsman = [
+            {
+                '.id': f'*{i + 1:X}',
+                'interface': f'cap{i % 4 + 1}',
+                'radio-name': f'cap-radio-{i % 4}',
+                'mac-address': _mac(0xA0B1C2, i),
+                'remote-cap-mac': _mac(0xD4CA6D, i % 4),
+                'signal-strength': str(-40 - i % 40),
+                'tx-rate': '144',
+                'rx-rate': '130',
+                'tx-bytes': str(i * 1000),
+                'rx-bytes': str(i * 2000),
+                'uptime': '1h2m3s',
+                'ssid': 'fake-wifi',
+                'channel': '2412/20-Ce/gn',
+                'comment': '',
+                'status': 'running'
+            }
+            for i in range(options.capsman_clients)
+        ]
+
+        self.handlers: Dict[str, Callable[[Dict[str, str]], List[Dict[str, str]]]] = {
+            '/system/resource/print': self.system_resource,
+            '/system/identity/print': lambda args: [{'name': self.identity}],
+            '/interface/print': self.interface_print,
+            '/interface/ethernet/print': self.ethernet_print,
+            '/interface/monitor-traffic': self.monitor_traffic,
+            '/interface/ethernet/monitor': self.ethernet_monitor,
+            '/ip/address/print': self.ip_address_print,
+            '/ip/arp/print': lambda args: self.arp,
+            '/ip/dhcp-server/lease/print': lambda args: self.leases,
+            '/ip/firewall/filter/print': lambda args: [],
+            '/interface/wireless/registration-table/print': lambda args: [],
+            '/log/print': lambda args: self.logs,
+        }
+        if options.capsman_clients:
+            self.handlers['/caps-man/registration-table/print'] = lambda args: self.capsman
+
+    def _advance_counters(self) -> None:
+        """Tăng counter theo thời gian thực đã trôi qua và lưu lượng của từng interface"""
+        now = time.monotonic()
+        elapsed = now - self.counters_updated
+        self.counters_updated = now
+        for name, counters in self.counters.items():
+            rx_bps, tx_bps = self.rates[name]
+            counters[0] += int(rx_bps / 8 * elapsed)
+            counters[1] += int(tx_bps / 8 * elapsed)
+            if self.options.counter_wrap:
+                counters[0] %= COUNTER_WRAP
+                counters[1] %= COUNTER_WRAP
+
+    def system_resource(self, args: Dict[str, str]) -> List[Dict[str, str]]:
+        uptime = int(time.time() - self.started)
+        return [{
+            'uptime': f'{uptime // 3600}h{uptime // 60 % 60}m{uptime % 60}s',
+            'version': '7.15.3 (stable)',
+            'cpu-load': str(self.random.randint(1, 95)),
+            'free-memory': str(self.random.randint(100, 900) * 1048576),
+            'total-memory': str(1024 * 1048576),
+            'free-hdd-space': str(self.random.randint(10, 120) * 1048576),
+            'total-hdd-space': str(128 * 1048576),
+            'architecture-name': 'arm64',
+            'board-name': 'CCR2004-16G-2S+',
+            'platform': 'MikroTik'
+        }]
+
+    def interface_print(self, args: Dict[str, str]) -> List[Dict[str, str]]:
+        self._advance_counters()
+        rows = []
+        for index, name in enumerate(self.interface_names):
+            rx, tx = self.counters[name]
+            rows.append({
+                '.id': f'*{index + 1:X}',
+                'name': name,
+                'type': 'ether' if name.startswith('ether') else 'vlan',
+                'mtu': '1500',
+                'actual-mtu': '1500',
+                'mac-address': _mac(0x4C5E0C, 0x100000 + index),
+                'rx-byte': str(rx),
+                'tx-byte': str(tx),
+                'rx-packet': str(rx // 1000),
+                'tx-packet': str(tx // 1000),
+                'rx-drop': '0',
+                'tx-drop': '0',
+                'rx-error': '0',
+                'tx-error': '0',
+                'running': 'true',
+                'disabled': 'false',
+                'last-link-up-time': time.strftime('%b/%d/%Y %H:%M:%S', time.localtime(self.started))
+            })
+        return rows
+
+    def ethernet_print(self, args: Dict[str, str]) -> List[Dict[str, str]]:
+        return [
+            {'.id': f'*{index + 1:X}', 'name': name, 'speed': '1Gbps', 'rx-bytes': str(self.counters[name][0]),
+             'tx-bytes': str(self.counters[name][1])}
+            for index, name in enumerate(self.interface_names) if name.startswith('ether')
+        ]
+
+    def ethernet_monitor(self, args: Dict[str, str]) -> List[Dict[str, str]]:
+        rows = []
+        for name in args.get('numbers', '').split(','):
+            if not name.startswith('ether') or name not in self.rates:
+                raise KeyError('no such item')
+            rows.append({
+                'name': name,
+                'status': 'link-ok',
+                'auto-negotiation': 'done',
+                'rate': '1Gbps',
+                'full-duplex': 'yes'
+            })
+        return rows
+
+    def monitor_traffic(self, args: Dict[str, str]) -> List[Dict[str, str]]:
+        rows = []
+        for name in args.get('interface', '').split(','):
+            if name not in self.rates:
+                raise KeyError('no such item')
+            rx_bps, tx_bps = self.rates[name]
+            rows.append({
+                'name': name,
+                'rx-bits-per-second': str(rx_bps),
+                'tx-bits-per-second': str(tx_bps),
+                'rx-packets-per-second': str(rx_bps // 8000),
+                'tx-packets-per-second': str(tx_bps // 8000)
+            })
+        return rows
+
+    def ip_address_print(self, args: Dict[str, str]) -> List[Dict[str, str]]:
+        subnet = self.index & 0xFFFF
+        return [{
+            '.id': '*1',
+            'address': f'10.{subnet >> 8}.{subnet & 0xFF}.254/24',
+            'network': f'10.{subnet >> 8}.{subnet & 0xFF}.0',
+            'interface': self.interface_names[0] if self.interface_names else 'bridge',
+            'disabled': 'false',
+            'dynamic': 'false'
+        }]
+
+    def execute(self, command: str, args: Dict[str, str], queries: Dict[str, str]) -> List[Dict[str, str]]:
+        """Thực thi một lệnh, ném KeyError nếu lệnh không tồn tại"""
+        handler = self.handlers.get(command)
+        if handler is None:
+            raise KeyError('no such command prefix')
+        rows = handler(args)
+        if queries:
+            rows = [row for row in rows if all(row.get(key) == value for key, value in queries.items())]
+        proplist = args.get('.proplist')
+        if proplist:
+            keys = proplist.split(',')
+            rows = [{key: row[key] for key in keys if key in row} for row in rows]
+        return rows
+
+
+class _Session:
+    """Một kết nối API tới thiết bị ảo"""
+
+    def __init__(self, device: VirtualDevice, writer: asyncio.StreamWriter):
+        self.device = device
+        self.writer = writer
+        self.logged_in = False
+        self.challenge: Optional[bytes] = None
+
+    def send(self, tag: Optional[str], *sentences: List[str]) -> None:
+        suffix = [f'.tag={tag}'] if tag is not None else []
+        self.writer.write(b''.join(encode_sentence(words + suffix) for words in sentences))
+
+    def send_rows(self, tag: Optional[str], rows: List[Dict[str, str]]) -> None:
+        sentences = [['!re'] + [f'={key}={value}' for key, value in row.items()] for row in rows]
+        sentences.append(['!done'])
+        self.send(tag, *sentences)
+
+    def trap(self, tag: Optional[str], message: str) -> None:
+        self.send(tag, ['!trap', f'=message={message}'], ['!done'])
+
+    def login(self, tag: Optional[str], args: Dict[str, str]) -> None:
+        options = self.device.options
+        if 'response' in args and self.challenge is not None:
+            expected = hashlib.md5(b'\x00' + options.password.encode('utf-8') + self.challenge).hexdigest()
+            valid = args.get('name') == options.username and args['response'] == '00' + expected
+        elif options.legacy_login or 'password' not in args:
+            self.challenge = os.urandom(16)
+            self.send(tag, ['!done', f'=ret={binascii.hexlify(self.challenge).decode()}'])
+            return
+        else:
+            valid = args.get('name') == options.username and args.get('password') == options.password
+
+        if valid:
+            self.logged_in = True
+            self.send(tag, ['!done'])
+        else:
+            self.trap(tag, 'invalid user name or password (6)')
+
+
+class FakeRouterOS:
+    """Nhóm thiết bị ảo chạy trên một event loop riêng
+
+    Args:
+        count: Số thiết bị ảo
+        host: Địa chỉ lắng nghe khi dùng nhiều cổng
+        base_port: Cổng của thiết bị đầu tiên, các thiết bị tiếp theo dùng cổng kế tiếp (0: cổng ngẫu nhiên)
+        base_address: Nếu có, mỗi thiết bị dùng một địa chỉ kế tiếp từ địa chỉ này với cùng cổng `port`
+        port: Cổng dùng chung khi đặt base_address
+    """
+
+    def __init__(self, count: int = 1, options: Optional[SimulatorOptions] = None, host: str = '127.0.0.1',
+                 base_port: int = 0, base_address: Optional[str] = None, port: int = 8728):
+        self.options = options or SimulatorOptions()
+        self.devices = [VirtualDevice(index, self.options) for index in range(count)]
+        self.host = host
+        self.base_port = base_port
+        self.base_address = base_address
+        self.port = port
+        self.endpoints: List[Tuple[str, int]] = []
+        self.commands = 0
+        self.drops = 0
+        self.random = random.Random(self.options.seed)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._servers: List[asyncio.AbstractServer] = []
+        self._thread: Optional[threading.Thread] = None
+
+    def _bind_address(self, index: int) -> Tuple[str, int]:
+        if self.base_address:
+            return str(ipaddress.ip_address(self.base_address) + index), self.port
+        return self.host, (self.base_port + index) if self.base_port else 0
+
+    async def serve(self) -> None:
+        """Mở socket lắng nghe cho toàn bộ thiết bị ảo"""
+        for index, device in enumerate(self.devices):
+            host, port = self._bind_address(index)
+            server = await asyncio.start_server(
+                lambda reader, writer, device=device: self._handle(device, reader, writer),
+                host, port, backlog=1024, reuse_address=True
+            )
+            self._servers.append(server)
+            self.endpoints.append((host, server.sockets[0].getsockname()[1]))
+
+    def start(self) -> 'FakeRouterOS':
+        """Chạy các thiết bị ảo trên một luồng nền, trả về sau khi đã lắng nghe xong"""
+        ready = threading.Event()
+        errors: List[BaseException] = []
+
+        def run() -> None:
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            try:
+                self.loop.run_until_complete(self.serve())
+            except BaseException as e:
+                errors.append(e)
+                ready.set()
+                return
+            ready.set()
+            self.loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name='fake-routeros', daemon=True)
+        self._thread.start()
+        ready.wait()
+        if errors:
+            raise errors[0]
+        return self
+
+    def stop(self) -> None:
+        """Dừng toàn bộ thiết bị ảo"""
+        if self.loop is None:
+            return
+
+        async def shutdown() -> None:
+            for server in self._servers:
+                server.close()
+            # Dừng các phiên đang mở để server đóng được hoàn toàn
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for server in self._servers:
+                await server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result(10)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        if self._thread is not None:
+            self._thread.join(10)
+        self.loop.close()
+        self.loop = None
+
+    def device_configs(self, username: Optional[str] = None, password: Optional[str] = None,
+                       site_id: str = 'default') -> List[Dict[str, object]]:
+        """Cấu hình thiết bị (định dạng config.json) cho các thiết bị ảo"""
+        return [
+            {
+                'id': f'fake-{index}',
+                'name': device.identity,
+                'host': host,
+                'port': port,
+                'username': username if username is not None else self.options.username,
+                'password': password if password is not None else self.options.password,
+                'site_id': site_id,
+                'enabled': True,
+                'use_ssl': False
+            }
+            for index, (device, (host, port)) in enumerate(zip(self.devices, self.endpoints))
+        ]
+
+    async def _handle(self, device: VirtualDevice, reader: asyncio.StreamReader,
+                      writer: asyncio.StreamWriter) -> None:
+        session = _Session(device, writer)
+        decoder = SentenceDecoder()
+        tasks = set()
+        try:
+            while not writer.is_closing():
+                data = await reader.read(65536)
+                if not data:
+                    break
+                for words in decoder.feed(data):
+                    if not words:
+                        continue
+                    task = asyncio.ensure_future(self._reply(session, words))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def _reply(self, session: _Session, words: List[str]) -> None:
+        self.commands += 1
+        command = words[0]
+        args: Dict[str, str] = {}
+        queries: Dict[str, str] = {}
+        tag = None
+        for word in words[1:]:
+            if word.startswith('='):
+                key, _, value = word[1:].partition('=')
+                args[key] = value
+            elif word.startswith('?'):
+                key, _, value = word[1:].partition('=')
+                queries[key] = value
+            elif word.startswith('.tag='):
+                tag = word[5:]
+
+        if command == '/login':
+            session.login(tag, args)
+            return
+        if not session.logged_in:
+            session.trap(tag, 'not logged in')
+            return
+
+        options = session.device.options
+        delay = options.latency + (self.random.uniform(0, options.jitter) if options.jitter else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+
+        if options.drop_rate and self.random.random() < options.drop_rate:
+            self.drops += 1
+            session.writer.close()
+            return
+
+        if command == '/quit':
+            session.send(tag, ['!fatal', 'session terminated on request'])
+            session.writer.close()
+            return
+
+        try:
+            rows = session.device.execute(command, args, queries)
+        except KeyError as e:
+            session.trap(tag, e.args[0])
+            return
+        session.send_rows(tag, rows)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Fake RouterOS API devices')
+    parser.add_argument('--devices', type=int, default=10)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--base-port', type=int, default=18728)
+    parser.add_argument('--base-address', help='Mỗi thiết bị một địa chỉ kế tiếp (ví dụ 127.0.1.1) với cùng --port')
+    parser.add_argument('--port', type=int, default=8728)
+    parser.add_argument('--interfaces', type=int, default=8)
+    parser.add_argument('--arp', type=int, default=50)
+    parser.add_argument('--dhcp', type=int, default=50)
+    parser.add_argument('--logs', type=int, default=100)
+    parser.add_argument('--capsman', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--drop-rate', type=float, default=0.0)
+    parser.add_argument('--counter-wrap', action='store_true')
+    parser.add_argument('--legacy-login', action='store_true')
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='')
+    parser.add_argument('--print-devices', action='store_true', help='In danh sách thiết bị dạng config.json')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    options = SimulatorOptions(
+        interfaces=args.interfaces, arp_entries=args.arp, dhcp_leases=args.dhcp, log_entries=args.logs,
+        capsman_clients=args.capsman, latency=args.latency, jitter=args.jitter, drop_rate=args.drop_rate,
+        counter_wrap=args.counter_wrap, username=args.username, password=args.password,
+        legacy_login=args.legacy_login
+    )
+    simulator = FakeRouterOS(args.devices, options, host=args.host, base_port=args.base_port,
+                             base_address=args.base_address, port=args.port).start()
+
+    if args.print_devices:
+        print(json.dumps(simulator.device_configs(), indent=2))
+    first, last = simulator.endpoints[0], simulator.endpoints[-1]
+    logger.info(f"Running {len(simulator.endpoints)} fake devices from {first[0]}:{first[1]} to {last[0]}:{last[1]}")
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        simulator.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""
+Mã hóa khối chuỗi thời gian kiểu Gorilla (Facebook, VLDB 2015)
+
+Timestamp được lưu theo mili-giây bằng delta-of-delta, mỗi cột giá trị float64 được XOR với
+giá trị trước đó và chỉ ghi các bit có nghĩa. Chuỗi lấy mẫu đều đặn và counter tăng chậm
+hoặc đứng yên chỉ tốn vài bit mỗi điểm.
+
+BlockEncoder ghi từng điểm ngay khi thêm vào (không giữ dữ liệu thô), decode_block giải mã
+cả khối một lần khi đọc.
+"""
+
+import struct
+from array import array
+from typing import List, Sequence, Tuple
+
+_DOUBLE = struct.Struct('<d')
+_UINT64 = struct.Struct('<Q')
+
+_MASK64 = (1 << 64) - 1
+
+# Các khoảng của delta-of-delta: (mã tiền tố, số bit của mã, số bit giá trị, giá trị nhỏ nhất, lớn nhất)
+_DOD_BUCKETS: Tuple[Tuple[int, int, int, int, int], ...] = (
+    (0b10, 2, 7, -63, 64),
+    (0b110, 3, 9, -255, 256),
+    (0b1110, 4, 12, -2047, 2048),
+    (0b11110, 5, 32, -(1 << 31), (1 << 31) - 1),
+)
+
+
+def _float_bits(value: float) -> int:
+    return _UINT64.unpack(_DOUBLE.pack(value))[0]
+
+
+def _bits_float(bits: int) -> float:
+    return _DOUBLE.unpack(_UINT64.pack(bits))[0]
+
+
+class BitWriter:
+    """Ghi các nhóm bit liên tiếp vào bytearray"""
+
+    __slots__ = ('buffer', 'accumulator', 'pending')
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.accumulator = 0
+        self.pending = 0  # Số bit trong accumulator chưa ghi ra buffer
+
+    def write(self, value: int, bits: int) -> None:
+        self.accumulator = (self.accumulator << bits) | (value & ((1 << bits) - 1))
+        self.pending += bits
+        if self.pending >= 32:
+            # Ghi theo từng 4 byte để giảm số lần thao tác trên bytearray
+            whole = self.pending // 8
+            self.pending -= whole * 8
+            self.buffer += (self.accumulator >> self.pending).to_bytes(whole, 'big')
+            self.accumulator &= (1 << self.pending) - 1
+
+    def getvalue(self) -> bytes:
+        """Nội dung đã ghi, byte cuối được đệm bit 0"""
+        if not self.pending:
+            return bytes(self.buffer)
+        tail_bytes = (self.pending + 7) // 8
+        tail = self.accumulator << (tail_bytes * 8 - self.pending)
+        return bytes(self.buffer) + tail.to_bytes(tail_bytes, 'big')
+
+    def nbytes(self) -> int:
+        return len(self.buffer) + (self.pending + 7) // 8
+
+
+class BitReader:
+    """Đọc các nhóm bit từ dữ liệu của BitWriter"""
+
+    __slots__ = ('value', 'remaining')
+
+    def __init__(self, data: bytes):
+        self.value = int.from_bytes(data, 'big')
+        self.remaining = len(data) * 8
+
+    def read(self, bits: int) -> int:
+        self.remaining -= bits
+        return (self.value >> self.remaining) & ((1 << bits) - 1)
+
+    def read_bit(self) -> int:
+        self.remaining -= 1
+        return (self.value >> self.remaining) & 1
+
+
+class BlockEncoder:
+    """Mã hóa tăng dần một khối gồm timestamp và `columns` cột float
+
+    Args:
+        columns: Số cột giá trị của mỗi điểm
+    """
+
+    __slots__ = ('columns', 'writer', 'count', 'first_timestamp', 'last_timestamp', '_timestamp', '_delta',
+                 '_values', '_leading', '_trailing')
+
+    def __init__(self, columns: int):
+        self.columns = columns
+        self.writer = BitWriter()
+        self.count = 0
+        self.first_timestamp = 0.0
+        self.last_timestamp = 0.0
+        self._timestamp = 0
+        self._delta = 0
+        self._values = [0] * columns
+        # Vùng bit có nghĩa của giá trị XOR trước đó; leading = -1 khi chưa có
+        self._leading = [-1] * columns
+        self._trailing = [0] * columns
+
+    def append(self, timestamp: float, values: Sequence[float]) -> None:
+        writer = self.writer
+        milliseconds = round(timestamp * 1000)
+        if not self.count:
+            writer.write(milliseconds, 64)
+            for i, value in enumerate(values):
+                bits = _float_bits(value)
+                writer.write(bits, 64)
+                self._values[i] = bits
+            self._timestamp = milliseconds
+            self.first_timestamp = timestamp
+            self.last_timestamp = timestamp
+            self.count = 1
+            return
+
+        delta = milliseconds - self._timestamp
+        self._write_dod(delta - self._delta)
+        self._timestamp = milliseconds
+        self._delta = delta
+        self.last_timestamp = timestamp
+        self.count += 1
+
+        previous = self._values
+        leadings = self._leading
+        trailings = self._trailing
+        for i, value in enumerate(values):
+            bits = _float_bits(value)
+            xor = bits ^ previous[i]
+            previous[i] = bits
+            if not xor:
+                writer.write(0, 1)
+                continue
+
+            leading = min(64 - xor.bit_length(), 31)
+            trailing = (xor & -xor).bit_length() - 1
+            if leadings[i] >= 0 and leading >= leadings[i] and trailing >= trailings[i]:
+                # Nằm trong vùng bit có nghĩa của lần trước: '10' + các bit trong vùng
+                meaningful = 64 - leadings[i] - trailings[i]
+                writer.write(0b10, 2)
+                writer.write(xor >> trailings[i], meaningful)
+            else:
+                # Vùng mới: '11' + 5 bit số bit 0 đầu + 6 bit độ dài (64 ghi thành 0) + các bit có nghĩa
+                meaningful = 64 - leading - trailing
+                writer.write(0b11, 2)
+                writer.write(leading, 5)
+                writer.write(meaningful & 63, 6)
+                writer.write(xor >> trailing, meaningful)
+                leadings[i] = leading
+                trailings[i] = trailing
+
+    def _write_dod(self, dod: int) -> None:
+        writer = self.writer
+        if not dod:
+            writer.write(0, 1)
+            return
+        for prefix, prefix_bits, value_bits, low, high in _DOD_BUCKETS:
+            if low <= dod <= high:
+                writer.write(prefix, prefix_bits)
+                writer.write(dod - low, value_bits)
+                return
+        writer.write(0b11111, 5)
+        writer.write(dod & _MASK64, 64)
+
+    def getvalue(self) -> bytes:
+        return self.writer.getvalue()
+
+    def nbytes(self) -> int:
+        return self.writer.nbytes()
+
+
+def decode_block(data: bytes, count: int, columns: int) -> Tuple[array, List[array]]:
+    """Giải mã `count` điểm của một khối, trả về (timestamps, các cột) dạng array('d')"""
+    timestamps = array('d')
+    values = [array('d') for _ in range(columns)]
+    if not count:
+        return timestamps, values
+
+    reader = BitReader(data)
+    read = reader.read
+    read_bit = reader.read_bit
+
+    milliseconds = read(64)
+    timestamps.append(milliseconds / 1000)
+    previous = []
+    for column in values:
+        bits = read(64)
+        previous.append(bits)
+        column.append(_bits_float(bits))
+    leadings = [0] * columns
+    trailings = [0] * columns
+
+    delta = 0
+    for _ in range(count - 1):
+        if read_bit():
+            for prefix, prefix_bits, value_bits, low, high in _DOD_BUCKETS:
+                if not read_bit():
+                    delta += read(value_bits) + low
+                    break
+            else:
+                dod = read(64)
+                delta += dod - (1 << 64) if dod >> 63 else dod
+        milliseconds += delta
+        timestamps.append(milliseconds / 1000)
+
+        for i, column in enumerate(values):
+            if read_bit():
+                if read_bit():
+                    leadings[i] = read(5)
+                    meaningful = read(6) or 64
+                    trailings[i] = 64 - leadings[i] - meaningful
+                else:
+                    meaningful = 64 - leadings[i] - trailings[i]
+                previous[i] ^= read(meaningful) << trailings[i]
+            column.append(_bits_float(previous[i]))
+    return timestamps, values
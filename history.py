@@ -0,0 +1,732 @@
+"""
+Bộ đệm vòng dạng cột cho lịch sử interface và tài nguyên hệ thống
+
+Mỗi cột là một array số, thời gian lưu dạng epoch (giây). Thêm điểm mới là O(1) và ghi đè
+điểm cũ nhất khi đầy; đọc theo khoảng thời gian trả về memoryview trên chính vùng nhớ
+của bộ đệm (không sao chép).
+
+CompressedRingBuffer là lựa chọn thay cho RingBuffer, nén dữ liệu thô theo khối kiểu Gorilla
+(gorilla.py) để giữ nhiều điểm hơn với cùng dung lượng bộ nhớ.
+
+Ngoài dữ liệu thô, RollupSet gộp dữ liệu theo các độ phân giải 1m/5m/1h/1d (kiểu RRD) với
+min/max/avg/last, để biểu đồ dài ngày không cần giữ toàn bộ mẫu thô.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from datetime import datetime
+from itertools import chain
+from math import ceil
+from typing import Any, Deque, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
+
+from gorilla import BlockEncoder, decode_block
+
+# Các cột của lịch sử interface và lịch sử tài nguyên hệ thống
+INTERFACE_FIELDS: Tuple[str, ...] = ('rx_byte', 'tx_byte', 'rx_speed', 'tx_speed')
+SYSTEM_FIELDS: Tuple[str, ...] = ('cpu_load', 'free_memory', 'total_memory', 'memory_usage')
+
+# Các cột được gộp theo độ phân giải (tập con của cột thô mà biểu đồ sử dụng)
+INTERFACE_ROLLUP_FIELDS: Tuple[str, ...] = ('rx_speed', 'tx_speed')
+SYSTEM_ROLLUP_FIELDS: Tuple[str, ...] = ('cpu_load', 'memory_usage')
+
+# Độ phân giải gộp và độ dài mỗi khoảng (giây)
+ROLLUP_STEPS: Dict[str, int] = {'1m': 60, '5m': 300, '1h': 3600, '1d': 86400}
+
+# Giá trị thống kê của mỗi khoảng; avg giữ nguyên tên cột để tương thích với dữ liệu thô
+ROLLUP_STATS: Tuple[str, ...] = ('min', 'max', 'avg', 'last')
+
+# Số điểm tối đa trả về khi tự chọn độ phân giải
+DEFAULT_MAX_POINTS = 1000
+
+# Cách lưu lịch sử thô: 'array' (RingBuffer) hoặc 'gorilla' (CompressedRingBuffer)
+HISTORY_MODES = ('array', 'gorilla')
+
+# Tốc độ interface được làm tròn tới 3 chữ số thập phân khi thu thập (counter là số nguyên)
+INTERFACE_DECIMALS: Dict[str, int] = {'rx_speed': 3, 'tx_speed': 3}
+
+# Số điểm mỗi khối nén; khối đầy được đóng lại và bỏ nguyên khối khi vượt dung lượng
+DEFAULT_BLOCK_SIZE = 120
+
+# Số khoảng tối đa của một truy vấn có step; step nhỏ hơn span / MAX_QUERY_POINTS được nới ra
+MAX_QUERY_POINTS = 10000
+
+
+def _percentile_95(values: Sequence[float]) -> float:
+    # Nearest-rank, cùng cách tính với các báo cáo phân vị
+    ordered = sorted(values)
+    return ordered[max(0, ceil(len(ordered) * 0.95) - 1)]
+
+
+# Hàm gộp giá trị của một khoảng; mỗi hàm nhận một array đã cắt sẵn nên vòng lặp chạy trong C
+AGGREGATIONS = {
+    'avg': lambda values: sum(values) / len(values),
+    'max': max,
+    'min': min,
+    'p95': _percentile_95,
+}
+
+# Cột của mức gộp dùng cho từng kiểu gộp (p95 tính trên giá trị trung bình của các khoảng)
+ROLLUP_AGGREGATION_COLUMNS = {'avg': '{}', 'max': '{}_max', 'min': '{}_min', 'p95': '{}'}
+
+# Phương pháp giảm số điểm cho biểu đồ, giữ nguyên các điểm gốc được chọn
+DOWNSAMPLE_METHODS = ('lttb', 'minmax')
+
+
+class _LogicalTimestamps(Sequence):
+    """Truy cập timestamp theo thứ tự thời gian để tìm kiếm nhị phân trên bộ đệm vòng"""
+
+    def __init__(self, buffer: 'RingBuffer'):
+        self.buffer = buffer
+
+    def __len__(self) -> int:
+        return self.buffer.size
+
+    def __getitem__(self, index: int) -> float:
+        buffer = self.buffer
+        return buffer.timestamps[(buffer.start + index) % buffer.capacity]
+
+
+class HistoryWindow:
+    """Một khoảng dữ liệu của RingBuffer, mỗi cột gồm một hoặc hai memoryview liên tiếp theo thời gian
+
+    Các memoryview trỏ vào vùng nhớ của bộ đệm: điểm mới ghi đè lên điểm cũ nhất sẽ thay đổi
+    dữ liệu của window, dùng to_records() hoặc column() khi cần bản sao ổn định.
+    """
+
+    def __init__(self, fields: Tuple[str, ...], timestamps: Tuple[memoryview, ...],
+                 columns: Dict[str, Tuple[memoryview, ...]]):
+        self.fields = fields
+        self.timestamps = timestamps
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return sum(len(segment) for segment in self.timestamps)
+
+    def iter_column(self, name: str) -> Iterator[float]:
+        """Duyệt giá trị của một cột ('timestamp' cho thời gian) theo thứ tự thời gian"""
+        segments = self.timestamps if name == 'timestamp' else self.columns[name]
+        return chain.from_iterable(segments)
+
+    def column(self, name: str) -> array:
+        """Sao chép một cột ra array liên tục"""
+        segments = self.timestamps if name == 'timestamp' else self.columns[name]
+        result = array(segments[0].format if segments else 'd')
+        for segment in segments:
+            result.frombytes(segment.tobytes())
+        return result
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """Chuyển thành danh sách dict với timestamp ISO như định dạng API cũ"""
+        names = ('timestamp',) + self.fields
+        iterators = [self.iter_column(name) for name in names]
+        records = []
+        for values in zip(*iterators):
+            record = dict(zip(names, values))
+            record['timestamp'] = datetime.fromtimestamp(values[0]).isoformat()
+            records.append(record)
+        return records
+
+
+class RingBuffer:
+    """Bộ đệm vòng dạng cột dung lượng cố định
+
+    Các cột tăng dần tới dung lượng rồi mới quay vòng, nên bộ đệm ít dữ liệu không chiếm
+    trọn vùng nhớ. Khi chưa đầy, start luôn là 0. array không thể nới rộng khi đang có
+    memoryview (window) trỏ vào nên lúc đó các cột được chuyển sang bản sao; window cũ vẫn
+    đọc được dữ liệu tại thời điểm tạo.
+
+    Args:
+        fields: Tên các cột số
+        capacity: Số điểm tối đa, điểm cũ nhất bị ghi đè khi đầy
+        typecode: Kiểu array của các cột giá trị ('d' float64, 'f' float32); timestamp luôn là float64
+    """
+
+    __slots__ = ('fields', 'capacity', 'typecode', 'timestamps', 'columns', '_arrays', 'start', 'size')
+
+    def __init__(self, fields: Sequence[str], capacity: int, typecode: str = 'd'):
+        self.fields = tuple(fields)
+        self.capacity = max(1, int(capacity))
+        self.typecode = typecode
+        self.timestamps = array('d')
+        self.columns = {name: array(typecode) for name in self.fields}
+        # Các cột theo thứ tự fields, dùng cho append
+        self._arrays = tuple(self.columns.values())
+        self.start = 0
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def append(self, timestamp: float, values: Sequence[float]) -> None:
+        """Thêm một điểm, values theo thứ tự của fields"""
+        if self.size < self.capacity:
+            try:
+                self._grow(timestamp, values)
+            except BufferError:
+                # Một window đang giữ memoryview trên các cột hiện tại (luồng API đọc lịch sử)
+                self._detach()
+                self._grow(timestamp, values)
+            self.size += 1
+            return
+
+        index = self.start
+        self.start = index + 1 if index + 1 < self.capacity else 0
+        self.timestamps[index] = timestamp
+        for column, value in zip(self._arrays, values):
+            column[index] = value
+
+    def _grow(self, timestamp: float, values: Sequence[float]) -> None:
+        self.timestamps.append(timestamp)
+        for column, value in zip(self._arrays, values):
+            column.append(value)
+
+    def _detach(self) -> None:
+        """Thay các cột bằng bản sao gồm đúng `size` điểm (bỏ phần đã ghi dở của lần append lỗi)"""
+        self.timestamps = self.timestamps[:self.size]
+        self.columns = {name: column[:self.size] for name, column in self.columns.items()}
+        self._arrays = tuple(self.columns[name] for name in self.fields)
+
+    def append_record(self, timestamp: float, record: Dict[str, float]) -> None:
+        """Thêm một điểm từ dict, cột thiếu được ghi 0"""
+        self.append(timestamp, [record.get(name, 0.0) for name in self.fields])
+
+    def first_timestamp(self) -> Optional[float]:
+        return self.timestamps[self.start] if self.size else None
+
+    def last_timestamp(self) -> Optional[float]:
+        return self.timestamps[(self.start + self.size - 1) % self.capacity] if self.size else None
+
+    def _segments(self, data: array, first: int, last: int) -> Tuple[memoryview, ...]:
+        """memoryview của các điểm logic [first, last) trên vùng nhớ vật lý"""
+        if first >= last:
+            return ()
+        view = memoryview(data)
+        begin = (self.start + first) % self.capacity
+        end = begin + (last - first)
+        if end <= self.capacity:
+            return (view[begin:end],)
+        return (view[begin:], view[:end - self.capacity])
+
+    def window(self, start: Optional[float] = None, end: Optional[float] = None) -> HistoryWindow:
+        """Lấy các điểm có timestamp trong [start, end] mà không sao chép dữ liệu
+
+        Timestamp phải tăng dần theo thứ tự thêm vào để tìm kiếm nhị phân đúng.
+        """
+        logical = _LogicalTimestamps(self)
+        first = 0 if start is None else bisect_left(logical, start)
+        last = self.size if end is None else bisect_right(logical, end)
+        return HistoryWindow(
+            self.fields,
+            self._segments(self.timestamps, first, last),
+            {name: self._segments(data, first, last) for name, data in self.columns.items()}
+        )
+
+    def to_records(self, start: Optional[float] = None, end: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Danh sách dict với timestamp ISO, dùng cho API"""
+        return self.window(start, end).to_records()
+
+    def resize(self, capacity: int) -> None:
+        """Đổi dung lượng, giữ lại các điểm mới nhất"""
+        capacity = max(1, int(capacity))
+        if capacity == self.capacity:
+            return
+        window = self.window()
+        keep = min(self.size, capacity)
+        self.timestamps = array('d', window.column('timestamp')[self.size - keep:])
+        columns = {name: array(self.typecode, window.column(name)[self.size - keep:]) for name in self.fields}
+        self.columns = columns
+        self._arrays = tuple(columns[name] for name in self.fields)
+        self.capacity = capacity
+        self.start = 0
+        self.size = keep
+
+    def nbytes(self) -> int:
+        """Dung lượng bộ nhớ của dữ liệu (byte)"""
+        return sum(len(column) * column.itemsize for column in (self.timestamps,) + self._arrays)
+
+
+class CompressedRingBuffer:
+    """Lịch sử thô nén theo khối Gorilla, cùng giao diện đọc/ghi với RingBuffer
+
+    Điểm mới được mã hóa ngay vào khối đang mở; khối đủ block_size điểm được đóng lại.
+    Khối cũ nhất chỉ bị bỏ khi các khối còn lại vẫn đủ `capacity` điểm, nên bộ đệm giữ
+    từ capacity tới capacity + block_size - 1 điểm. Đọc một khoảng thời gian giải mã
+    các khối giao với khoảng đó. Timestamp được làm tròn tới mili-giây.
+
+    Giá trị thập phân (như tốc độ đã làm tròn 3 chữ số) có phần định trị gần như ngẫu nhiên nên
+    XOR nén kém; `decimals` cho phép lưu các cột đó dưới dạng số nguyên đã nhân 10^decimals,
+    không mất dữ liệu nếu giá trị vốn đã được làm tròn tới số chữ số đó.
+
+    Args:
+        fields: Tên các cột số
+        capacity: Số điểm tối thiểu được giữ lại khi đã đầy
+        block_size: Số điểm mỗi khối
+        decimals: Số chữ số thập phân được giữ theo tên cột (mặc định lưu nguyên float)
+    """
+
+    __slots__ = ('fields', 'capacity', 'block_size', 'decimals', 'blocks', 'encoder', 'sealed_size', '_scales')
+
+    typecode = 'd'
+
+    def __init__(self, fields: Sequence[str], capacity: int, block_size: int = DEFAULT_BLOCK_SIZE,
+                 decimals: Optional[Mapping[str, int]] = None):
+        self.fields = tuple(fields)
+        self.capacity = max(1, int(capacity))
+        self.block_size = max(2, int(block_size))
+        self.decimals = dict(decimals or {})
+        # Hệ số nhân của từng cột, None khi lưu nguyên float
+        self._scales = tuple(10 ** self.decimals[name] if name in self.decimals else None for name in self.fields)
+        # Các khối đã đóng: (timestamp đầu, timestamp cuối, số điểm, dữ liệu nén)
+        self.blocks: Deque[Tuple[float, float, int, bytes]] = deque()
+        self.encoder = BlockEncoder(len(self.fields))
+        self.sealed_size = 0
+
+    @property
+    def size(self) -> int:
+        return self.sealed_size + self.encoder.count
+
+    def __len__(self) -> int:
+        return self.size
+
+    def append(self, timestamp: float, values: Sequence[float]) -> None:
+        """Thêm một điểm, values theo thứ tự của fields"""
+        encoder = self.encoder
+        if self.decimals:
+            values = [value if scale is None else round(value * scale)
+                      for value, scale in zip(values, self._scales)]
+        encoder.append(timestamp, values)
+        if encoder.count >= self.block_size:
+            self.blocks.append((encoder.first_timestamp, encoder.last_timestamp, encoder.count, encoder.getvalue()))
+            self.sealed_size += encoder.count
+            self.encoder = BlockEncoder(len(self.fields))
+            self._evict()
+
+    def append_record(self, timestamp: float, record: Dict[str, float]) -> None:
+        """Thêm một điểm từ dict, cột thiếu được ghi 0"""
+        self.append(timestamp, [record.get(name, 0.0) for name in self.fields])
+
+    def _evict(self) -> None:
+        while self.blocks and self.size - self.blocks[0][2] >= self.capacity:
+            self.sealed_size -= self.blocks.popleft()[2]
+
+    def first_timestamp(self) -> Optional[float]:
+        if self.blocks:
+            return self.blocks[0][0]
+        return self.encoder.first_timestamp if self.encoder.count else None
+
+    def last_timestamp(self) -> Optional[float]:
+        if self.encoder.count:
+            return self.encoder.last_timestamp
+        return self.blocks[-1][1] if self.blocks else None
+
+    def window(self, start: Optional[float] = None, end: Optional[float] = None) -> HistoryWindow:
+        """Giải mã các điểm có timestamp trong [start, end]; dữ liệu trả về là bản sao"""
+        columns = len(self.fields)
+        parts = [block for block in self.blocks
+                 if (start is None or block[1] >= start) and (end is None or block[0] <= end)]
+        encoder = self.encoder
+        if encoder.count and (start is None or encoder.last_timestamp >= start) and \
+                (end is None or encoder.first_timestamp <= end):
+            parts.append((encoder.first_timestamp, encoder.last_timestamp, encoder.count, encoder.getvalue()))
+
+        timestamps = array('d')
+        data = [array('d') for _ in range(columns)]
+        for _, _, count, payload in parts:
+            block_timestamps, block_values = decode_block(payload, count, columns)
+            timestamps.extend(block_timestamps)
+            for column, values in zip(data, block_values):
+                column.extend(values)
+        for column, scale in zip(data, self._scales):
+            if scale is not None:
+                for i, value in enumerate(column):
+                    column[i] = value / scale
+
+        first = 0 if start is None else bisect_left(timestamps, start)
+        last = len(timestamps) if end is None else bisect_right(timestamps, end)
+        return HistoryWindow(
+            self.fields,
+            (memoryview(timestamps)[first:last],),
+            {name: (memoryview(column)[first:last],) for name, column in zip(self.fields, data)}
+        )
+
+    def to_records(self, start: Optional[float] = None, end: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Danh sách dict với timestamp ISO, dùng cho API"""
+        return self.window(start, end).to_records()
+
+    def resize(self, capacity: int) -> None:
+        """Đổi dung lượng; khi giảm, bỏ các khối cũ không còn cần"""
+        self.capacity = max(1, int(capacity))
+        self._evict()
+
+    def nbytes(self) -> int:
+        """Dung lượng bộ nhớ của dữ liệu nén (byte)"""
+        return sum(len(block[3]) for block in self.blocks) + self.encoder.nbytes()
+
+
+# Bộ đệm lịch sử thô theo cách lưu
+HistoryBuffer = Union[RingBuffer, CompressedRingBuffer]
+
+
+def make_history_buffer(fields: Sequence[str], capacity: int, mode: str = 'array',
+                        decimals: Optional[Mapping[str, int]] = None) -> HistoryBuffer:
+    """Tạo bộ đệm lịch sử thô theo cách lưu ('array' hoặc 'gorilla'); decimals chỉ dùng cho 'gorilla'"""
+    if mode == 'gorilla':
+        return CompressedRingBuffer(fields, capacity, decimals=decimals)
+    return RingBuffer(fields, capacity)
+
+
+def convert_history_buffer(buffer: HistoryBuffer, mode: str,
+                           decimals: Optional[Mapping[str, int]] = None) -> HistoryBuffer:
+    """Chuyển bộ đệm sang cách lưu khác, giữ nguyên các điểm hiện có"""
+    converted = make_history_buffer(buffer.fields, buffer.capacity, mode, decimals)
+    window = buffer.window()
+    columns = [window.iter_column(name) for name in buffer.fields]
+    for timestamp, *values in zip(window.iter_column('timestamp'), *columns):
+        converted.append(timestamp, values)
+    return converted
+
+
+class Rollup:
+    """Gộp dữ liệu thô thành các khoảng `step` giây, lưu min/max/avg/last của từng cột
+
+    Khoảng đang gộp dở được trả về như điểm cuối cùng khi đọc.
+    """
+
+    __slots__ = ('name', 'step', 'fields', 'buffer', 'slot', 'count', 'minimums', 'maximums', 'sums', 'lasts')
+
+    def __init__(self, name: str, step: int, fields: Sequence[str], capacity: int):
+        self.name = name
+        self.step = step
+        self.fields = tuple(fields)
+        columns = []
+        for field in self.fields:
+            columns.extend(field if stat == 'avg' else f'{field}_{stat}' for stat in ROLLUP_STATS)
+        # float32 đủ chính xác cho giá trị đã gộp và giảm một nửa bộ nhớ
+        self.buffer = RingBuffer(columns, capacity, typecode='f')
+        self.slot: Optional[int] = None
+        self.count = 0
+        self.minimums: List[float] = []
+        self.maximums: List[float] = []
+        self.sums: List[float] = []
+        self.lasts: List[float] = []
+
+    def add(self, timestamp: float, values: Sequence[float]) -> None:
+        slot = int(timestamp // self.step)
+        if slot != self.slot:
+            self._flush()
+            self.slot = slot
+            self.count = 1
+            self.minimums = list(values)
+            self.maximums = list(values)
+            self.sums = list(values)
+            self.lasts = list(values)
+            return
+
+        self.count += 1
+        for i, value in enumerate(values):
+            if value < self.minimums[i]:
+                self.minimums[i] = value
+            if value > self.maximums[i]:
+                self.maximums[i] = value
+            self.sums[i] += value
+        self.lasts = list(values)
+
+    def _pending_values(self) -> List[float]:
+        values = []
+        for i in range(len(self.fields)):
+            values.extend((self.minimums[i], self.maximums[i], self.sums[i] / self.count, self.lasts[i]))
+        return values
+
+    def _flush(self) -> None:
+        if self.slot is not None and self.count:
+            self.buffer.append(float(self.slot * self.step), self._pending_values())
+
+    def first_timestamp(self) -> Optional[float]:
+        first = self.buffer.first_timestamp()
+        if first is None and self.slot is not None:
+            return float(self.slot * self.step)
+        return first
+
+    def window(self, start: Optional[float] = None, end: Optional[float] = None) -> HistoryWindow:
+        """Giống RingBuffer.window, kèm khoảng đang gộp dở như điểm cuối cùng"""
+        window = self.buffer.window(start, end)
+        if self.slot is not None and self.count:
+            timestamp = float(self.slot * self.step)
+            if (start is None or timestamp >= start) and (end is None or timestamp <= end):
+                window.timestamps += (memoryview(array('d', [timestamp])),)
+                for name, value in zip(self.buffer.fields, self._pending_values()):
+                    window.columns[name] += (memoryview(array('f', [value])),)
+        return window
+
+    def records(self, start: Optional[float] = None, end: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Các khoảng đã gộp trong [start, end], kèm khoảng đang gộp dở"""
+        records = self.buffer.to_records(start, end)
+        if self.slot is not None and self.count:
+            timestamp = float(self.slot * self.step)
+            if (start is None or timestamp >= start) and (end is None or timestamp <= end):
+                record = dict(zip(self.buffer.fields, self._pending_values()))
+                record['timestamp'] = datetime.fromtimestamp(timestamp).isoformat()
+                records.append(record)
+        return records
+
+    def resize(self, capacity: int) -> None:
+        self.buffer.resize(capacity)
+
+
+class RollupSet:
+    """Các mức gộp của một chuỗi lịch sử, sắp xếp từ mịn tới thô
+
+    Args:
+        fields: Các cột được gộp
+        retention: Số khoảng giữ lại theo tên độ phân giải, ví dụ {'1m': 360, '1h': 744}
+    """
+
+    __slots__ = ('fields', 'rollups', 'retention')
+
+    def __init__(self, fields: Sequence[str], retention: Mapping[str, int]):
+        self.fields = tuple(fields)
+        self.retention = dict(retention)
+        self.rollups = [
+            Rollup(name, ROLLUP_STEPS[name], self.fields, points)
+            for name, points in self._enabled(retention)
+        ]
+
+    @staticmethod
+    def _enabled(retention: Mapping[str, int]) -> List[Tuple[str, int]]:
+        """Các độ phân giải được bật (số khoảng > 0), từ mịn tới thô"""
+        return [
+            (name, points) for name, points in sorted(retention.items(), key=lambda item: ROLLUP_STEPS.get(item[0], 0))
+            if name in ROLLUP_STEPS and points > 0
+        ]
+
+    def add(self, timestamp: float, values: Sequence[float]) -> None:
+        """Thêm một mẫu thô, values theo thứ tự của fields"""
+        for rollup in self.rollups:
+            rollup.add(timestamp, values)
+
+    def configure(self, retention: Mapping[str, int]) -> None:
+        """Áp dụng cấu hình giữ lại mới: đổi dung lượng các mức đã có, thêm mức vừa bật và bỏ mức bị tắt"""
+        if retention == self.retention:
+            return
+        self.retention = dict(retention)
+        existing = {rollup.name: rollup for rollup in self.rollups}
+        rollups = []
+        for name, points in self._enabled(retention):
+            rollup = existing.get(name)
+            if rollup is None:
+                rollup = Rollup(name, ROLLUP_STEPS[name], self.fields, points)
+            else:
+                rollup.resize(points)
+            rollups.append(rollup)
+        # Thay cả danh sách một lần để luồng đọc luôn thấy danh sách đầy đủ
+        self.rollups = rollups
+
+
+def aggregate_window(window: Any, fields: Sequence[str], step: float, agg: str = 'avg',
+                     columns: Optional[Mapping[str, str]] = None) -> List[Dict[str, Any]]:
+    """Gộp dữ liệu của window thành các khoảng `step` giây (căn theo epoch) bằng hàm gộp `agg`
+
+    window là bất kỳ đối tượng nào có column(name) trả về dãy theo thứ tự thời gian, cắt được
+    bằng slice (HistoryWindow, tsdb.SeriesWindow). columns ánh xạ tên trường sang cột nguồn nếu khác tên.
+    Mỗi khoảng chỉ cần một lần tìm kiếm nhị phân và một lần cắt cho mỗi cột.
+    """
+    reduce = AGGREGATIONS[agg]
+    timestamps = window.column('timestamp')
+    sources = [window.column(columns.get(name, name) if columns else name) for name in fields]
+    records = []
+    index = 0
+    count = len(timestamps)
+    while index < count:
+        slot_start = timestamps[index] // step * step
+        next_index = bisect_left(timestamps, slot_start + step, index)
+        record: Dict[str, Any] = {'timestamp': datetime.fromtimestamp(slot_start).isoformat()}
+        for name, source in zip(fields, sources):
+            record[name] = reduce(source[index:next_index])
+        records.append(record)
+        index = next_index
+    return records
+
+
+def _lttb_indices(timestamps: Sequence[float], series: List[Sequence[float]], threshold: int) -> List[int]:
+    """Largest-Triangle-Three-Buckets trên nhiều chuỗi cùng trục thời gian
+
+    Diện tích tam giác của mỗi chuỗi được chuẩn hóa theo biên độ của chuỗi rồi cộng lại,
+    để đỉnh của chuỗi nhỏ (ví dụ tx bên cạnh rx) cũng được giữ.
+    """
+    count = len(timestamps)
+    if threshold >= count:
+        return list(range(count))
+    threshold = max(threshold, 3)
+
+    base = timestamps[0]
+    scales = []
+    for values in series:
+        spread = max(values) - min(values)
+        scales.append(1.0 / spread if spread else 0.0)
+
+    every = (count - 2) / (threshold - 2)
+    selected = [0]
+    a = 0
+    for bucket in range(threshold - 2):
+        # Điểm trung bình của khoảng kế tiếp (đỉnh thứ ba của tam giác)
+        next_start = int((bucket + 1) * every) + 1
+        next_end = min(int((bucket + 2) * every) + 1, count)
+        length = next_end - next_start
+        average_x = sum(timestamps[next_start:next_end]) / length - base
+        ax = timestamps[a] - base
+
+        # Diện tích (x2) theo điểm j là |p*y_j + q*x_j + r| với p, q, r cố định trong khoảng
+        terms = []
+        for values, scale in zip(series, scales):
+            if scale:
+                ay = values[a]
+                average_y = sum(values[next_start:next_end]) / length
+                p = (ax - average_x) * scale
+                q = (average_y - ay) * scale
+                terms.append((values, p, q, -p * ay - q * ax))
+
+        # Cắt từng khoảng một lần để vòng lặp không truy cập cả cột theo chỉ số
+        first = int(bucket * every) + 1
+        last = int((bucket + 1) * every) + 1
+        parts = [(values[first:last], p, q, r) for values, p, q, r in terms]
+        best = first
+        best_area = -1.0
+        for offset, x in enumerate(timestamps[first:last]):
+            x -= base
+            area = 0.0
+            for values, p, q, r in parts:
+                area += abs(p * values[offset] + q * x + r)
+            if area > best_area:
+                best_area = area
+                best = first + offset
+        selected.append(best)
+        a = best
+
+    selected.append(count - 1)
+    return selected
+
+
+def _minmax_indices(timestamps: Sequence[float], series: List[Sequence[float]], threshold: int) -> List[int]:
+    """Chia trục thời gian thành các khoảng đều nhau, giữ điểm nhỏ nhất và lớn nhất của từng chuỗi"""
+    count = len(timestamps)
+    if threshold >= count:
+        return list(range(count))
+
+    buckets = max(1, threshold // (2 * max(1, len(series))))
+    begin = timestamps[0]
+    width = (timestamps[-1] - begin) / buckets or 1.0
+    selected = set()
+    first = 0
+    for bucket in range(1, buckets + 1):
+        last = count if bucket == buckets else bisect_left(timestamps, begin + bucket * width, first)
+        if last > first:
+            for values in series:
+                part = values[first:last]
+                selected.add(first + part.index(min(part)))
+                selected.add(first + part.index(max(part)))
+        first = last
+    return sorted(selected)
+
+
+def downsample_window(window: Any, shape_fields: Sequence[str], max_points: int, method: str = 'lttb',
+                      columns: Optional[Mapping[str, str]] = None) -> List[Dict[str, Any]]:
+    """Chọn tối đa max_points điểm gốc của window sao cho giữ được hình dạng của shape_fields
+
+    window là bất kỳ đối tượng nào có fields và column(name) (HistoryWindow, tsdb.SeriesWindow).
+    Các bản ghi trả về chứa mọi cột của window tại các điểm được chọn; chỉ các điểm này được đọc
+    theo chỉ số nên cột của tsdb.SeriesWindow không bị sao chép toàn bộ.
+    """
+    timestamps = window.column('timestamp')
+    series = [window.column(columns.get(name, name) if columns else name) for name in shape_fields]
+    if method == 'lttb':
+        indices = _lttb_indices(timestamps, series, max_points)
+    else:
+        indices = _minmax_indices(timestamps, series, max_points)
+
+    names = tuple(window.fields)
+    data = [window.column(name) for name in names]
+    records = []
+    for index in indices:
+        record: Dict[str, Any] = {'timestamp': datetime.fromtimestamp(timestamps[index]).isoformat()}
+        for name, values in zip(names, data):
+            record[name] = values[index]
+        records.append(record)
+    return records
+
+
+def _covers(source: Any, start: Optional[float]) -> bool:
+    first = source.first_timestamp()
+    return first is not None and (start is None or first <= start)
+
+
+def _query_step(raw: RingBuffer, rollups: Optional[RollupSet], start: Optional[float], end: Optional[float],
+                step: float, agg: str) -> Tuple[str, List[Dict[str, Any]]]:
+    """Truy vấn có step: gộp từ nguồn thô nhất mà vẫn mịn hơn step và còn phủ tới start"""
+    all_rollups = rollups.rollups if rollups is not None else []
+    source: Any = None
+    if start is not None:
+        source = next((rollup for rollup in reversed(all_rollups) if rollup.step <= step and _covers(rollup, start)),
+                      None)
+        if source is None and not _covers(raw, start):
+            # Không nguồn đủ mịn nào phủ tới start: dùng nguồn có dữ liệu lâu nhất
+            source = min([raw] + all_rollups, key=lambda item: item.first_timestamp() or float('inf'))
+
+    if source is None or source is raw:
+        return 'raw', aggregate_window(raw.window(start, end), raw.fields, step, agg)
+    columns = {name: ROLLUP_AGGREGATION_COLUMNS[agg].format(name) for name in source.fields}
+    return source.name, aggregate_window(source.window(start, end), source.fields, step, agg, columns)
+
+
+def _query_downsample(raw: RingBuffer, rollups: Optional[RollupSet], start: Optional[float], end: Optional[float],
+                      max_points: int, method: str) -> Tuple[str, List[Dict[str, Any]]]:
+    """Giảm số điểm từ nguồn mịn nhất còn phủ tới start; với mức gộp, hình dạng lấy theo cột _max"""
+    all_rollups = rollups.rollups if rollups is not None else []
+    source: Any = raw
+    if start is not None and not _covers(raw, start):
+        source = next((rollup for rollup in all_rollups if _covers(rollup, start)), None)
+        if source is None:
+            source = min([raw] + all_rollups, key=lambda item: item.first_timestamp() or float('inf'))
+
+    if source is raw:
+        shape = rollups.fields if rollups is not None else raw.fields
+        return 'raw', downsample_window(raw.window(start, end), shape, max_points, method)
+    columns = {name: f'{name}_max' for name in source.fields}
+    return source.name, downsample_window(source.window(start, end), source.fields, max_points, method, columns)
+
+
+def query_history(raw: RingBuffer, rollups: Optional[RollupSet], start: Optional[float] = None,
+                  end: Optional[float] = None, max_points: int = DEFAULT_MAX_POINTS,
+                  step: Optional[float] = None, agg: str = 'avg',
+                  downsample: Optional[str] = None) -> Tuple[str, List[Dict[str, Any]]]:
+    """Chọn độ phân giải phù hợp với khoảng thời gian và trả về (tên độ phân giải, bản ghi)
+
+    Dùng dữ liệu thô nếu nó còn phủ tới `start` và không vượt quá max_points điểm,
+    nếu không thì dùng mức gộp mịn nhất thỏa mãn cả hai điều kiện. Không có start thì trả về dữ liệu thô.
+    Với step, dữ liệu được gộp thành các khoảng step giây bằng hàm agg (avg, max, min, p95).
+    Với downsample (lttb, minmax), trả về tối đa max_points điểm gốc giữ hình dạng của các cột đã gộp.
+    """
+    if step is not None:
+        return _query_step(raw, rollups, start, end, step, agg)
+    if downsample is not None:
+        return _query_downsample(raw, rollups, start, end, max_points, downsample)
+
+    if start is None or rollups is None or not rollups.rollups:
+        return 'raw', raw.to_records(start, end)
+
+    span = (end if end is not None else raw.last_timestamp() or start) - start
+    first = raw.first_timestamp()
+    if first is not None and first <= start and len(raw.window(start, end)) <= max_points:
+        return 'raw', raw.to_records(start, end)
+
+    for rollup in rollups.rollups:
+        first = rollup.first_timestamp()
+        if first is not None and first <= start and span / rollup.step <= max_points:
+            return rollup.name, rollup.records(start, end)
+
+    # Không mức nào phủ hết khoảng thời gian: dùng mức mịn nhất không vượt quá số điểm
+    for rollup in rollups.rollups:
+        if span / rollup.step <= max_points:
+            return rollup.name, rollup.records(start, end)
+    coarsest = rollups.rollups[-1]
+    return coarsest.name, coarsest.records(start, end)
@@ -1,7 +1,12 @@
+import asyncio
 import logging
 import socket
 import random
-from typing import Dict, List, Any, Optional, Tuple
+import queue
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Any, Optional, Tuple
 from datetime import datetime, timedelta
 import time
 import traceback
@@ -17,30 +22,131 @@ except ImportError:
     class RouterOsApiError(Exception): pass
     routeros_api = None
 
+import alerting
+import reports
+import routeros_async
+import tsdb
+from history import (
+    CompressedRingBuffer, INTERFACE_DECIMALS, INTERFACE_FIELDS, INTERFACE_ROLLUP_FIELDS, SYSTEM_FIELDS,
+    SYSTEM_ROLLUP_FIELDS, RingBuffer, RollupSet, convert_history_buffer, make_history_buffer
+)
 from models import (
     Device, SystemResources, Interface, IPAddress, 
     ArpEntry, DHCPLease, FirewallRule, WirelessClient,
-    CapsmanRegistration, LogEntry, Alert, DataStore
+    CapsmanRegistration, LogEntry, DataStore
 )
 import config
 
 logger = logging.getLogger(__name__)
 
+# Tốc độ liên kết trong kết quả /interface/ethernet/monitor, ví dụ '1Gbps', '2.5Gbps'
+LINK_RATE_PATTERN = re.compile(r'^(\d+(?:\.\d+)?)\s*([KMGT]?)bps$', re.IGNORECASE)
+LINK_RATE_UNITS = {'': 1, 'K': 10 ** 3, 'M': 10 ** 6, 'G': 10 ** 9, 'T': 10 ** 12}
+
+class _SlotLimiter:
+    """Giới hạn số tác vụ chạy đồng thời, giới hạn có thể đổi khi đang có tác vụ giữ chỗ
+
+    Các chỗ đang giữ vẫn được tính theo giới hạn mới: khi giảm giới hạn, tác vụ mới chờ tới khi
+    số chỗ đang giữ xuống dưới giới hạn.
+    """
+
+    def __init__(self, limit: int):
+        self._condition = threading.Condition()
+        self._limit = limit
+        self._active = 0
+
+    def resize(self, limit: int) -> None:
+        with self._condition:
+            if limit != self._limit:
+                self._limit = limit
+                self._condition.notify_all()
+
+    def acquire(self) -> None:
+        with self._condition:
+            while self._active >= self._limit:
+                self._condition.wait()
+            self._active += 1
+
+    def release(self) -> None:
+        with self._condition:
+            self._active -= 1
+            self._condition.notify()
+
+    def __enter__(self) -> '_SlotLimiter':
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.release()
+
+
 class MikrotikAPI:
+    # Các collector của một chu kỳ thu thập, độc lập với nhau nên có thể chạy song song
+    COLLECTORS: Tuple[Tuple[str, str], ...] = (
+        ("system", "collect_system_resources"),
+        ("interfaces", "collect_interfaces"),
+        ("ip_addresses", "collect_ip_addresses"),
+        ("arp", "collect_arp"),
+        ("dhcp", "collect_dhcp_leases"),
+        ("firewall", "collect_firewall_rules"),
+        ("wireless", "collect_wireless_clients"),
+        ("capsman", "collect_capsman_registrations"),
+        ("logs", "collect_logs"),
+    )
+
+    # Các lệnh print mà mỗi collector đọc, được gửi trước cùng lúc khi dùng client async
+    COLLECTOR_PATHS: Dict[str, Tuple[str, ...]] = {
+        "system": ("/system/resource", "/system/identity"),
+        "interfaces": ("/interface",),
+        "ip_addresses": ("/ip/address",),
+        "arp": ("/ip/arp",),
+        "dhcp": ("/ip/dhcp-server/lease",),
+        "firewall": ("/ip/firewall/filter",),
+        "wireless": ("/interface/wireless/registration-table",),
+        "capsman": ("/caps-man/registration-table",),
+        "logs": ("/log",),
+    }
+
     def __init__(self):
         self.connections: Dict[str, Any] = {}
+        # Kết nối API mà collector đang chạy trên luồng hiện tại được cấp phát
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Giới hạn số collector chạy đồng thời trên toàn bộ các thiết bị
+        self._fleet_slots = _SlotLimiter(32)
+        # Thống kê chu kỳ thu thập interface gần nhất của từng thiết bị
+        self.interface_cycle_stats: Dict[str, Dict[str, Any]] = {}
+        # Tốc độ liên kết (bit/s) theo thiết bị và tên interface, kèm trạng thái liên kết lúc đọc:
+        # name -> ((running, last_link_up_time), tốc độ)
+        self.link_speeds: Dict[str, Dict[str, Tuple[Tuple[bool, str], int]]] = {}
+        # Kết nối AsyncRouterOsApi theo thiết bị, chỉ được dùng trên event loop của routeros_async
+        self.async_connections: Dict[str, routeros_async.AsyncRouterOsApi] = {}
+        # Khóa mở/đóng kết nối theo thiết bị; khóa async chỉ dùng trên event loop của routeros_async
+        self._device_locks: Dict[str, threading.Lock] = {}
+        self._async_connect_locks: Dict[str, asyncio.Lock] = {}
+    
+    def _device_lock(self, device_id: str) -> threading.Lock:
+        with self._lock:
+            return self._device_locks.setdefault(device_id, threading.Lock())
         
     def connect(self, device: Device) -> Tuple[bool, Optional[str]]:
         """Connect to a Mikrotik device"""
-        if device.id in self.connections:
-            # Already connected
-            return True, None
-        
+        # Các job của cùng thiết bị có thể gọi connect() cùng lúc: chỉ một luồng mở kết nối,
+        # luồng còn lại dùng lại kết nối đã lưu
+        with self._device_lock(device.id):
+            if device.id in self.connections:
+                # Already connected
+                return True, None
+            return self._connect(device)
+    
+    def _connect(self, device: Device) -> Tuple[bool, Optional[str]]:
+        """Mở kết nối tới thiết bị, gọi khi đang giữ khóa của thiết bị"""
         # Get global settings or use device-specific settings
-        global_use_ssl = config.load_config().get('use_ssl', False)
-        connection_timeout = config.load_config().get('connection_timeout', 10)
-        max_retries = config.load_config().get('connection_retries', 2)
-        retry_delay = config.load_config().get('retry_delay', 1)
+        settings = config.get_snapshot()
+        global_use_ssl = settings.get('use_ssl', False)
+        connection_timeout = settings.get('connection_timeout', 10)
+        max_retries = settings.get('connection_retries', 2)
+        retry_delay = settings.get('retry_delay', 1)
         
         # Device-specific SSL setting takes precedence over global
         use_ssl = device.use_ssl if hasattr(device, 'use_ssl') else global_use_ssl
@@ -56,22 +162,20 @@ class MikrotikAPI:
                 logger.info(f"Connecting to {device.name} ({device.host}) on port {device.port}" + 
                             f" with SSL {'enabled' if use_ssl else 'disabled'}")
                 
-                connection = routeros_api.RouterOsApiPool(
-                    host=device.host,
-                    port=device.port,
-                    username=device.username,
-                    password=device.password,
-                    plaintext_login=not use_ssl,
-                    use_ssl=use_ssl
-                )
-                
-                # Try to get the API connection
-                api = connection.get_api()
+                connection, api = self._open_connection(device, use_ssl)
                 
                 # If successful, store the connection
+                idle_apis: queue.Queue = queue.Queue()
+                idle_apis.put(api)
                 self.connections[device.id] = {
                     'connection': connection,
-                    'api': api
+                    'api': api,
+                    'use_ssl': use_ssl,
+                    # Các kết nối phụ dùng cho collector song song
+                    'extra_connections': [],
+                    'idle_apis': idle_apis,
+                    'opened': 1,
+                    'grow_failed': False
                 }
                 device.last_connected = datetime.now()
                 device.error_message = None
@@ -115,17 +219,40 @@ class MikrotikAPI:
         DataStore.devices[device.id] = device
         return False, last_error
     
+    def _open_connection(self, device: Device, use_ssl: bool) -> Tuple[Any, Any]:
+        """Open a new RouterOS API connection to a device"""
+        connection = routeros_api.RouterOsApiPool(
+            host=device.host,
+            port=device.port,
+            username=device.username,
+            password=device.password,
+            plaintext_login=not use_ssl,
+            use_ssl=use_ssl
+        )
+        
+        # Try to get the API connection
+        api = connection.get_api()
+        return connection, api
+    
     def disconnect(self, device_id: str) -> None:
         """Disconnect from a device and update its status"""
         from models import DataStore
         
-        if device_id in self.connections:
+        with self._device_lock(device_id):
+            entry = self.connections.pop(device_id, None)
+        if entry is not None:
             try:
-                self.connections[device_id]['connection'].disconnect()
+                for connection in [entry['connection']] + entry.get('extra_connections', []):
+                    connection.disconnect()
             except Exception as e:
                 logger.error(f"Error disconnecting from device {device_id}: {e}")
-            finally:
-                del self.connections[device_id]
+        
+        if device_id in self.async_connections:
+            client = self.async_connections.pop(device_id)
+            try:
+                routeros_async.run_coroutine(client.close(), timeout=5)
+            except Exception as e:
+                logger.error(f"Error closing async connection to device {device_id}: {e}")
         
         # Cập nhật trạng thái thiết bị
         if device_id in DataStore.devices:
@@ -134,15 +261,88 @@ class MikrotikAPI:
     
     def disconnect_all(self) -> None:
         """Disconnect from all devices"""
-        for device_id in list(self.connections.keys()):
+        for device_id in set(self.connections) | set(self.async_connections):
             self.disconnect(device_id)
     
     def get_api(self, device_id: str) -> Optional[Any]:
         """Get the API connection for a device"""
+        # Collector chạy trong pipeline dùng kết nối được cấp phát riêng cho luồng
+        if getattr(self._local, 'device_id', None) == device_id:
+            return self._local.api
         if device_id in self.connections:
             return self.connections[device_id]['api']
         return None
     
+    def _acquire_api(self, device: Device, limit: int,
+                     timeout: float) -> Tuple[Optional[Dict[str, Any]], Optional[Any]]:
+        """Lấy một kết nối rảnh của thiết bị, mở thêm kết nối nếu chưa đạt giới hạn
+        
+        Trả về (entry, api) để kết nối được trả đúng về entry đã cấp phát dù thiết bị bị
+        ngắt/kết nối lại giữa chu kỳ. Ném queue.Empty nếu chờ quá `timeout` giây.
+        """
+        entry = self.connections.get(device.id)
+        if not entry:
+            return None, None
+        
+        try:
+            return entry, entry['idle_apis'].get_nowait()
+        except queue.Empty:
+            pass
+        
+        with self._lock:
+            grow = not entry['grow_failed'] and entry['opened'] < limit
+            if grow:
+                entry['opened'] += 1
+        
+        if grow:
+            try:
+                connection, api = self._open_connection(device, entry['use_ssl'])
+                with self._lock:
+                    entry['extra_connections'].append(connection)
+                return entry, api
+            except Exception as e:
+                # Thiết bị không cho mở thêm phiên API, dùng chung các kết nối hiện có
+                logger.debug(f"Could not open extra connection to {device.host}: {e}")
+                with self._lock:
+                    entry['opened'] -= 1
+                    entry['grow_failed'] = True
+        
+        return entry, entry['idle_apis'].get(timeout=timeout)
+    
+    @staticmethod
+    def _release_api(entry: Dict[str, Any], api: Any) -> None:
+        """Trả kết nối về danh sách rảnh của entry đã cấp phát nó"""
+        entry['idle_apis'].put(api)
+    
+    def _get_fleet_slots(self, size: int) -> _SlotLimiter:
+        """Bộ giới hạn số collector chạy đồng thời trên toàn hệ thống, cập nhật theo cấu hình hiện hành"""
+        self._fleet_slots.resize(size)
+        return self._fleet_slots
+    
+    def _run_collector(self, device: Device, method_name: str, fleet_slots: _SlotLimiter,
+                       per_device: int, timeout: float) -> Tuple[bool, float]:
+        """Chạy một collector với kết nối riêng, trả về (thành công, thời gian chạy)"""
+        with fleet_slots:
+            started = time.perf_counter()
+            try:
+                entry, api = self._acquire_api(device, per_device, timeout)
+            except queue.Empty:
+                logger.error(f"Collector {method_name} on {device.id} timed out waiting for a connection")
+                return False, time.perf_counter() - started
+            self._local.device_id = device.id
+            self._local.api = api
+            try:
+                ok = getattr(self, method_name)(device.id) is not None
+            except Exception as e:
+                logger.error(f"Collector {method_name} failed on {device.id}: {e}")
+                ok = False
+            finally:
+                self._local.device_id = None
+                self._local.api = None
+                if api is not None:
+                    self._release_api(entry, api)
+            return ok, time.perf_counter() - started
+    
     def collect_system_resources(self, device_id: str) -> Optional[SystemResources]:
         """Collect system resources from a device"""
         api = self.get_api(device_id)
@@ -173,28 +373,39 @@ class MikrotikAPI:
             
             DataStore.system_resources[device_id] = system_resources
             
-            # Add to history
-            if device_id not in DataStore.system_history:
-                DataStore.system_history[device_id] = []
+            # Add to history (bộ đệm vòng giữ tối đa system_history_points điểm)
+            max_points = config.get_setting('system_history_points', 288)
+            history = DataStore.system_history.get(device_id)
+            if history is None:
+                history = DataStore.system_history[device_id] = RingBuffer(SYSTEM_FIELDS, max_points)
+            elif history.capacity != max_points:
+                history.resize(max_points)
             
-            history_item = {
-                'timestamp': system_resources.timestamp.isoformat(),
-                'cpu_load': system_resources.cpu_load,
-                'free_memory': system_resources.free_memory,
-                'total_memory': system_resources.total_memory,
-                'memory_usage': ((system_resources.total_memory - system_resources.free_memory) / 
-                                system_resources.total_memory * 100) if system_resources.total_memory > 0 else 0
-            }
+            memory_usage = ((system_resources.total_memory - system_resources.free_memory) / 
+                            system_resources.total_memory * 100) if system_resources.total_memory > 0 else 0
+            timestamp = system_resources.timestamp.timestamp()
+            values = (
+                system_resources.cpu_load,
+                system_resources.free_memory,
+                system_resources.total_memory,
+                memory_usage
+            )
+            history.append(timestamp, values)
             
-            DataStore.system_history[device_id].append(history_item)
+            store = tsdb.get_store()
+            if store is not None:
+                store.append('system', device_id, tsdb.SYSTEM_SERIES, timestamp, values)
             
-            # Keep limited history points
-            max_points = config.load_config().get('system_history_points', 288)
-            if len(DataStore.system_history[device_id]) > max_points:
-                DataStore.system_history[device_id] = DataStore.system_history[device_id][-max_points:]
+            retention = config.get_setting('history_rollups', {})
+            rollups = DataStore.system_rollups.get(device_id)
+            if rollups is None:
+                rollups = DataStore.system_rollups[device_id] = RollupSet(SYSTEM_ROLLUP_FIELDS, retention)
+            else:
+                rollups.configure(retention)
+            rollups.add(timestamp, (system_resources.cpu_load, memory_usage))
             
-            # Check thresholds for alerts
-            self._check_resource_thresholds(device_id, system_resources)
+            # Ghi chỉ số cho lượt đánh giá cảnh báo định kỳ (alerting.evaluate)
+            alerting.engine.record_system(device_id, system_resources)
             
             return system_resources
             
@@ -209,213 +420,40 @@ class MikrotikAPI:
             return None
         
         try:
+            # Số lượt gọi API (round-trip) trong chu kỳ thu thập này
+            api_calls = 0
+            
             interface_resource = api.get_resource('/interface')
             interfaces_data = interface_resource.get()
+            api_calls += 1
             
-            # Get interface statistics
-            stats_resource = api.get_resource('/interface/ethernet')
-            stats_data = {item.get('.id'): item for item in stats_resource.get()}
+            now = datetime.now()
+            interfaces = [self._parse_interface(device_id, iface_data, now) for iface_data in interfaces_data]
+            previous = DataStore.interface_index.get(device_id, {})
             
-            interfaces = []
-            for iface_data in interfaces_data:
-                name = iface_data.get('name', '')
-                
-                # Get previous interface data if exists
-                prev_interface = next((i for i in DataStore.interfaces.get(device_id, []) if i.name == name), None)
-                
-                interface = Interface(
-                    device_id=device_id,
-                    name=name,
-                    type=iface_data.get('type', ''),
-                    running=iface_data.get('running', 'false') == 'true',
-                    disabled=iface_data.get('disabled', 'false') == 'true',
-                    rx_byte=int(iface_data.get('rx-byte', 0)),
-                    tx_byte=int(iface_data.get('tx-byte', 0)),
-                    rx_packet=int(iface_data.get('rx-packet', 0)),
-                    tx_packet=int(iface_data.get('tx-packet', 0)),
-                    rx_error=int(iface_data.get('rx-error', 0)),
-                    tx_error=int(iface_data.get('tx-error', 0)),
-                    rx_drop=int(iface_data.get('rx-drop', 0)),
-                    tx_drop=int(iface_data.get('tx-drop', 0)),
-                    last_link_down_time=iface_data.get('last-link-down-time', ''),
-                    last_link_up_time=iface_data.get('last-link-up-time', ''),
-                    actual_mtu=int(iface_data.get('actual-mtu', 0)),
-                    mac_address=iface_data.get('mac-address', ''),
-                    timestamp=datetime.now()
-                )
-                
-                # Calculate speed (bytes per second)
-                if prev_interface:
-                    time_diff = (interface.timestamp - prev_interface.timestamp).total_seconds()
-                    if time_diff > 0:
-                        interface.prev_rx_byte = prev_interface.rx_byte
-                        interface.prev_tx_byte = prev_interface.tx_byte
-                        # Calculate speed in bytes per second
-                        rx_diff = interface.rx_byte - prev_interface.rx_byte
-                        tx_diff = interface.tx_byte - prev_interface.tx_byte
-                        
-                        # Tính toán tốc độ trong bytes/second
-                        interface.rx_speed = rx_diff / time_diff if rx_diff >= 0 else 0
-                        interface.tx_speed = tx_diff / time_diff if tx_diff >= 0 else 0
-                        
-                        # Thử lấy tốc độ thực tế từ giao diện Mikrotik nếu có
-                        try:
-                            # Thử lấy thông tin tốc độ từ giao diện Ethernet hoặc phần cứng
-                            if iface_data.get('type') == 'ether':
-                                eth_resource = api.get_resource('/interface/ethernet')
-                                eth_data = eth_resource.get(name=interface.name)
-                                if eth_data and len(eth_data) > 0:
-                                    # Lấy tốc độ hiện tại nếu có
-                                    rate = eth_data[0].get('rate', None)
-                                    if rate:
-                                        logger.debug(f"Retrieved actual rate for {interface.name}: {rate}")
-                            
-                            # Đặt biến để kiểm soát luồng
-                            monitor_traffic_success = False
-                            
-                            # Thử lấy dữ liệu từ MikroTik API monitor-traffic (API chuyên biệt cho tốc độ thời gian thực)
-                            try:
-                                # Ghi log chuẩn bị sử dụng monitor-traffic API
-                                logger.debug(f"Using monitor-traffic API for {interface.name}")
-                                
-                                # Phương pháp mới không sử dụng thông số 'interface' trực tiếp mà lọc theo tên sau khi gọi API
-                                # Sử dụng monitor-traffic API - đây là API chuyên biệt của MikroTik để theo dõi lưu lượng mạng thời gian thực
-                                monitor_resource = api.get_resource('/interface/monitor-traffic')
-                                
-                                # Thực hiện lệnh monitor-traffic không có tham số interface
-                                monitor_params = {
-                                    'once': 'true'
-                                }
-                                
-                                # Thực hiện lệnh monitor-traffic
-                                monitor_result = monitor_resource.call(**monitor_params)
-                                
-                                # Ghi log số lượng kết quả nhận được cho việc debug
-                                logger.debug(f"Monitor traffic returned {len(monitor_result) if monitor_result else 0} results")
-                                
-                                # Tìm interface phù hợp trong kết quả
-                                monitor_traffic_success = False
-                                if monitor_result and len(monitor_result) > 0:
-                                    # Tìm kiếm dữ liệu của interface cụ thể trong kết quả
-                                    for traffic_item in monitor_result:
-                                        if traffic_item.get('name') == interface.name:
-                                            # Lấy tốc độ rx/tx từ kết quả
-                                            rx_bits_per_second = int(traffic_item.get('rx-bits-per-second', 0))
-                                            tx_bits_per_second = int(traffic_item.get('tx-bits-per-second', 0))
-                                            
-                                            # Chuyển đổi từ bits/second sang bytes/second (1 byte = 8 bits)
-                                            interface.rx_speed = rx_bits_per_second / 8
-                                            interface.tx_speed = tx_bits_per_second / 8
-                                            
-                                            # Ghi log để debug
-                                            logger.debug(f"Retrieved real-time speed for {interface.name} using monitor-traffic API")
-                                            logger.debug(f"RX: {rx_bits_per_second} bps = {interface.rx_speed} Bps, TX: {tx_bits_per_second} bps = {interface.tx_speed} Bps")
-                                            
-                                            # Đánh dấu là đã lấy dữ liệu thành công từ API chuyên biệt
-                                            monitor_traffic_success = True
-                                            break
-                                    
-                                    if not monitor_traffic_success:
-                                        logger.debug(f"monitor-traffic API did not return data for {interface.name}, falling back to calculated speeds")
-                                else:
-                                    logger.debug(f"monitor-traffic API did not return valid data, falling back to calculated speeds")
-                            except Exception as monitor_error:
-                                # Nếu có lỗi khi sử dụng API chuyên biệt, ghi log và tiếp tục với phương pháp tính toán thông thường
-                                logger.debug(f"Failed to use monitor-traffic API for {interface.name}: {monitor_error}")
-                                logger.debug(f"Falling back to calculated speeds for {interface.name}")
-                            
-                            # Nếu API chuyên biệt không thành công, sử dụng phương pháp tính toán từ dữ liệu counter
-                            if not monitor_traffic_success:
-                                # Logs để gỡ lỗi
-                                logger.debug(f"Using calculated speeds for {interface.name}")
-                                logger.debug(f"Interface {interface.name}: RX bytes = {interface.rx_byte}, TX bytes = {interface.tx_byte}")
-                                logger.debug(f"Interface {interface.name}: Previous RX bytes = {interface.prev_rx_byte}, Previous TX bytes = {interface.prev_tx_byte}")
-                                
-                                # Lấy khoảng thời gian refresh từ cấu hình
-                                time_diff = config.get_refresh_interval()  # Lấy refresh interval từ cấu hình
-                                
-                                # Lấy thời gian chính xác đến mili giây
-                                now = datetime.now()
-                                time_diff_ms = time_diff
-                                
-                                # Nếu có timestamp trước đó, tính thời gian chính xác hơn
-                                if hasattr(interface, 'last_calculation_time') and interface.last_calculation_time:
-                                    time_diff_ms = (now - interface.last_calculation_time).total_seconds()
-                                
-                                # Cập nhật timestamp cho lần tính tiếp theo
-                                interface.last_calculation_time = now
-                                
-                                # Tính tốc độ RX (bytes/second) với độ chính xác cao hơn
-                                rx_diff = interface.rx_byte - interface.prev_rx_byte if interface.prev_rx_byte > 0 else 0
-                                if rx_diff < 0:  # Trường hợp counter bị reset
-                                    rx_diff = interface.rx_byte
-                                
-                                # Dùng time_diff_ms chính xác nếu có, ngược lại dùng khoảng thời gian từ cấu hình
-                                actual_time_diff = time_diff_ms if time_diff_ms > 0 else time_diff
-                                
-                                # Tính tốc độ với nhiều thập phân hơn và làm tròn để tránh hiện tượng giá trị 0
-                                if actual_time_diff > 0:
-                                    interface.rx_speed = round(rx_diff / actual_time_diff, 3)
-                                    
-                                    # Đảm bảo giá trị nhỏ không bị làm tròn thành 0
-                                    if rx_diff > 0 and interface.rx_speed < 0.001:
-                                        interface.rx_speed = 0.001  # Giá trị tối thiểu để hiển thị
-                                else:
-                                    interface.rx_speed = 0
-                                
-                                # Tính tốc độ TX (bytes/second) với độ chính xác cao hơn
-                                tx_diff = interface.tx_byte - interface.prev_tx_byte if interface.prev_tx_byte > 0 else 0
-                                if tx_diff < 0:  # Trường hợp counter bị reset
-                                    tx_diff = interface.tx_byte
-                                
-                                # Tính tốc độ với nhiều thập phân hơn
-                                if actual_time_diff > 0:
-                                    interface.tx_speed = round(tx_diff / actual_time_diff, 3)
-                                    
-                                    # Đảm bảo giá trị nhỏ không bị làm tròn thành 0
-                                    if tx_diff > 0 and interface.tx_speed < 0.001:
-                                        interface.tx_speed = 0.001  # Giá trị tối thiểu để hiển thị
-                                else:
-                                    interface.tx_speed = 0
-                                
-                                # Ghi log kết quả tính toán
-                                logger.debug(f"Calculated speeds for {interface.name}: RX={interface.rx_speed} bytes/s, TX={interface.tx_speed} bytes/s")
-                        except Exception as e:
-                            # Nếu không lấy được tốc độ thực tế, sử dụng tốc độ tính toán
-                            logger.debug(f"Failed to retrieve real-time speed for {interface.name}: {e}")
-                            # Đặt tốc độ = 0 nếu có lỗi
-                            interface.rx_speed = 0
-                            interface.tx_speed = 0
-                
-                interfaces.append(interface)
-                
-                # Add to interface history for charts
-                if device_id not in DataStore.interface_history:
-                    DataStore.interface_history[device_id] = {}
-                
-                if interface.name not in DataStore.interface_history[device_id]:
-                    DataStore.interface_history[device_id][interface.name] = []
-                
-                # Add current data point to history
-                history_item = {
-                    'timestamp': interface.timestamp.isoformat(),
-                    'rx_byte': interface.rx_byte,
-                    'tx_byte': interface.tx_byte,
-                    'rx_speed': interface.rx_speed,
-                    'tx_speed': interface.tx_speed
-                }
-                
-                DataStore.interface_history[device_id][interface.name].append(history_item)
-                
-                # Keep limited history points
-                max_points = config.load_config().get('interface_history_points', 288)
-                if len(DataStore.interface_history[device_id][interface.name]) > max_points:
-                    DataStore.interface_history[device_id][interface.name] = DataStore.interface_history[device_id][interface.name][-max_points:]
+            # Lấy tốc độ thời gian thực của mọi interface đã có mẫu trước đó bằng một lệnh monitor-traffic
+            sampled_names = [interface.name for interface in interfaces if interface.name in previous]
+            traffic, sample_calls = self._sample_traffic(api, sampled_names)
+            api_calls += sample_calls
+            
+            self._compute_interface_rates(interfaces, previous, traffic)
             
-            DataStore.interfaces[device_id] = interfaces
+            # Tốc độ liên kết (cache tới khi liên kết lên/xuống) và mức sử dụng
+            api_calls += self._update_link_speeds(api, device_id, interfaces)
             
-            # Check for alerts
-            self._check_interface_alerts(device_id, interfaces)
+            self._append_interface_history(device_id, interfaces)
+            
+            DataStore.set_interfaces(device_id, interfaces)
+            self.interface_cycle_stats[device_id] = {
+                'api_calls': api_calls,
+                'interfaces': len(interfaces),
+                'sampled': len(traffic),
+                'timestamp': datetime.now().isoformat()
+            }
+            logger.debug(f"Collected {len(interfaces)} interfaces from {device_id} in {api_calls} API calls")
+            
+            # Ghi chỉ số cho lượt đánh giá cảnh báo định kỳ (alerting.evaluate)
+            alerting.engine.record_interfaces(device_id, interfaces)
             
             return interfaces
             
@@ -423,6 +461,203 @@ class MikrotikAPI:
             logger.error(f"Error collecting interfaces from {device_id}: {e}")
             return None
     
+    def _parse_interface(self, device_id: str, iface_data: Dict[str, Any], timestamp: datetime) -> Interface:
+        """Tạo đối tượng Interface từ dữ liệu /interface của RouterOS"""
+        return Interface(
+            device_id=device_id,
+            name=iface_data.get('name', ''),
+            type=iface_data.get('type', ''),
+            running=iface_data.get('running', 'false') == 'true',
+            disabled=iface_data.get('disabled', 'false') == 'true',
+            rx_byte=int(iface_data.get('rx-byte', 0)),
+            tx_byte=int(iface_data.get('tx-byte', 0)),
+            rx_packet=int(iface_data.get('rx-packet', 0)),
+            tx_packet=int(iface_data.get('tx-packet', 0)),
+            rx_error=int(iface_data.get('rx-error', 0)),
+            tx_error=int(iface_data.get('tx-error', 0)),
+            rx_drop=int(iface_data.get('rx-drop', 0)),
+            tx_drop=int(iface_data.get('tx-drop', 0)),
+            last_link_down_time=iface_data.get('last-link-down-time', ''),
+            last_link_up_time=iface_data.get('last-link-up-time', ''),
+            actual_mtu=int(iface_data.get('actual-mtu', 0)),
+            mac_address=iface_data.get('mac-address', ''),
+            timestamp=timestamp
+        )
+    
+    def _compute_interface_rates(self, interfaces: List[Interface], previous: Dict[str, Interface],
+                                 traffic: Dict[str, Tuple[float, float]]) -> None:
+        """Tính tốc độ (bytes/s) cho cả lô interface trong một lần duyệt"""
+        for interface in interfaces:
+            prev_interface = previous.get(interface.name)
+            if not prev_interface:
+                continue
+            
+            time_diff = (interface.timestamp - prev_interface.timestamp).total_seconds()
+            if time_diff <= 0:
+                continue
+            
+            interface.prev_rx_byte = prev_interface.rx_byte
+            interface.prev_tx_byte = prev_interface.tx_byte
+            
+            speeds = traffic.get(interface.name)
+            if speeds:
+                # Tốc độ thời gian thực từ monitor-traffic
+                interface.rx_speed, interface.tx_speed = speeds
+            else:
+                # monitor-traffic không trả về interface này, tính từ counter
+                interface.rx_speed = self._counter_speed(interface.rx_byte, interface.prev_rx_byte, time_diff)
+                interface.tx_speed = self._counter_speed(interface.tx_byte, interface.prev_tx_byte, time_diff)
+    
+    def _append_interface_history(self, device_id: str, interfaces: List[Interface]) -> None:
+        """Thêm điểm dữ liệu của cả lô interface vào lịch sử biểu đồ"""
+        max_points = config.get_setting('interface_history_points', 288)
+        mode = config.get_setting('interface_history_mode', 'array')
+        buffer_class = CompressedRingBuffer if mode == 'gorilla' else RingBuffer
+        retention = config.get_setting('history_rollups', {})
+        device_history = DataStore.interface_history.setdefault(device_id, {})
+        device_rollups = DataStore.interface_rollups.setdefault(device_id, {})
+        store = tsdb.get_store()
+        
+        for interface in interfaces:
+            history = device_history.get(interface.name)
+            if history is None:
+                history = device_history[interface.name] = make_history_buffer(
+                    INTERFACE_FIELDS, max_points, mode, INTERFACE_DECIMALS
+                )
+            elif type(history) is not buffer_class:
+                # Đổi cách lưu khi cấu hình thay đổi, giữ lại các điểm đã có
+                history = device_history[interface.name] = convert_history_buffer(history, mode, INTERFACE_DECIMALS)
+            if history.capacity != max_points:
+                history.resize(max_points)
+            
+            rollups = device_rollups.get(interface.name)
+            if rollups is None:
+                rollups = device_rollups[interface.name] = RollupSet(INTERFACE_ROLLUP_FIELDS, retention)
+            else:
+                rollups.configure(retention)
+            
+            timestamp = interface.timestamp.timestamp()
+            values = (
+                interface.rx_byte,
+                interface.tx_byte,
+                interface.rx_speed,
+                interface.tx_speed
+            )
+            history.append(timestamp, values)
+            rollups.add(timestamp, (interface.rx_speed, interface.tx_speed))
+            if store is not None:
+                store.append('interfaces', device_id, interface.name, timestamp, values)
+        
+        # Số liệu phân vị 95 và lưu lượng theo tháng cho báo cáo tính cước
+        reports.record_interfaces(device_id, interfaces)
+    
+    def _sample_traffic(self, api: Any, names: List[str]) -> Tuple[Dict[str, Tuple[float, float]], int]:
+        """Lấy tốc độ rx/tx (bytes/s) của nhiều interface bằng một lệnh monitor-traffic
+        
+        Returns:
+            Tuple[Dict[str, Tuple[float, float]], int]: (tốc độ theo tên interface, số lượt gọi API)
+        """
+        if not names:
+            return {}, 0
+        
+        try:
+            monitor_result = api.get_resource('/interface').call(
+                'monitor-traffic', {'interface': ','.join(names), 'once': ''}
+            )
+        except Exception as monitor_error:
+            # Nếu có lỗi khi sử dụng API chuyên biệt, sẽ tính tốc độ từ counter
+            logger.debug(f"Failed to use monitor-traffic API: {monitor_error}")
+            return {}, 1
+        
+        speeds = {}
+        for traffic_item in monitor_result or []:
+            name = traffic_item.get('name')
+            if not name:
+                continue
+            # Chuyển đổi từ bits/second sang bytes/second (1 byte = 8 bits)
+            rx_bits_per_second = int(traffic_item.get('rx-bits-per-second', 0))
+            tx_bits_per_second = int(traffic_item.get('tx-bits-per-second', 0))
+            speeds[name] = (rx_bits_per_second / 8, tx_bits_per_second / 8)
+        
+        logger.debug(f"Monitor traffic returned {len(speeds)} of {len(names)} interfaces")
+        return speeds, 1
+    
+    def _update_link_speeds(self, api: Any, device_id: str, interfaces: List[Interface]) -> int:
+        """Gán link_speed và utilization cho cả lô interface, trả về số lượt gọi API
+        
+        Tốc độ của các interface ethernet đang chạy được đọc bằng một lệnh /interface/ethernet/monitor
+        cho mọi interface chưa có trong cache hoặc đã lên/xuống kể từ lần đọc trước.
+        """
+        cached = self.link_speeds.get(device_id, {})
+        stale = self._stale_links(device_id, interfaces)
+        stale_names = set(stale)
+        speeds: Dict[str, Tuple[Tuple[bool, str], int]] = {
+            interface.name: cached[interface.name] for interface in interfaces
+            if interface.running and interface.name in cached and interface.name not in stale_names
+        }
+        
+        api_calls = 0
+        if stale:
+            try:
+                monitor_result = api.get_resource('/interface/ethernet').call(
+                    'monitor', {'numbers': ','.join(stale), 'once': ''}
+                )
+                api_calls = 1
+            except Exception as monitor_error:
+                # Đọc lại ở chu kỳ sau
+                logger.debug(f"Failed to read link rate from {device_id}: {monitor_error}")
+                monitor_result = []
+            states = {interface.name: (interface.running, interface.last_link_up_time) for interface in interfaces}
+            for item in monitor_result or []:
+                name = item.get('name')
+                if name in states:
+                    speeds[name] = (states[name], self._parse_link_rate(item.get('rate', '')))
+        self.link_speeds[device_id] = speeds
+        
+        for interface in interfaces:
+            entry = speeds.get(interface.name)
+            if entry is None or not entry[1]:
+                continue
+            interface.link_speed = entry[1]
+            interface.utilization = round(max(interface.rx_speed, interface.tx_speed) * 8 / entry[1] * 100, 2)
+        return api_calls
+    
+    def _stale_links(self, device_id: str, interfaces: Iterable[Interface]) -> List[str]:
+        """Tên các interface ethernet đang chạy cần đọc lại tốc độ liên kết"""
+        cached = self.link_speeds.get(device_id, {})
+        stale = []
+        for interface in interfaces:
+            if interface.type != 'ether' or not interface.running:
+                continue
+            entry = cached.get(interface.name)
+            if entry is None or entry[0] != (interface.running, interface.last_link_up_time):
+                stale.append(interface.name)
+        return stale
+    
+    @staticmethod
+    def _parse_link_rate(rate: str) -> int:
+        """Chuyển tốc độ liên kết của RouterOS ('100Mbps', '2.5Gbps') sang bit/s, 0 khi không rõ"""
+        match = LINK_RATE_PATTERN.match(rate.strip())
+        if not match:
+            return 0
+        return int(float(match.group(1)) * LINK_RATE_UNITS[match.group(2).upper()])
+    
+    @staticmethod
+    def _counter_speed(current: int, previous: int, time_diff: float) -> float:
+        """Tính tốc độ (bytes/s) từ hai giá trị counter liên tiếp"""
+        if time_diff <= 0:
+            return 0
+        
+        diff = current - previous if previous > 0 else 0
+        if diff < 0:  # Trường hợp counter bị reset
+            diff = current
+        
+        speed = round(diff / time_diff, 3)
+        # Đảm bảo giá trị nhỏ không bị làm tròn thành 0
+        if diff > 0 and speed < 0.001:
+            speed = 0.001
+        return speed
+    
     def collect_ip_addresses(self, device_id: str) -> Optional[List[IPAddress]]:
         """Collect IP addresses from a device"""
         api = self.get_api(device_id)
@@ -991,8 +1226,13 @@ class MikrotikAPI:
             DataStore.logs[device_id] = [error_log]
             return [error_log]
     
-    def collect_all_data(self, device_id: str) -> Dict[str, bool]:
-        """Collect all data from a device"""
+    def collect_all_data(self, device_id: str, collectors: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Collect all data from a device
+        
+        Args:
+            device_id: ID của thiết bị
+            collectors: Tên các collector cần chạy (xem COLLECTORS), mặc định chạy tất cả
+        """
         device = DataStore.devices.get(device_id)
         if not device or not device.enabled:
             return {
@@ -1000,6 +1240,18 @@ class MikrotikAPI:
                 "error": "Device not found or disabled"
             }
         
+        settings = config.get_snapshot()
+        selected = [(name, method_name) for name, method_name in self.COLLECTORS
+                    if collectors is None or name in collectors]
+        
+        if settings.get('api_client', 'threaded') == 'async':
+            timeout = float(settings.get('connection_timeout', 10))
+            try:
+                prefetched = routeros_async.run_coroutine(self._prefetch_async(device, selected, timeout))
+            except Exception as e:
+                prefetched = e
+            return self._collect_prefetched(device, selected, prefetched)
+        
         # Try to connect if not already connected
         if device_id not in self.connections:
             success, error_message = self.connect(device)
@@ -1009,116 +1261,173 @@ class MikrotikAPI:
                     "error": error_message or "Failed to connect"
                 }
         
-        results = {
-            "system": self.collect_system_resources(device_id) is not None,
-            "interfaces": self.collect_interfaces(device_id) is not None,
-            "ip_addresses": self.collect_ip_addresses(device_id) is not None,
-            "arp": self.collect_arp(device_id) is not None,
-            "dhcp": self.collect_dhcp_leases(device_id) is not None,
-            "firewall": self.collect_firewall_rules(device_id) is not None,
-            "wireless": self.collect_wireless_clients(device_id) is not None,
-            "capsman": self.collect_capsman_registrations(device_id) is not None,
-            "logs": self.collect_logs(device_id) is not None
-        }
+        # Giới hạn số collector chạy song song trên một thiết bị và trên toàn hệ thống
+        per_device = max(1, int(settings.get('collector_workers_per_device', 3)))
+        fleet_slots = self._get_fleet_slots(max(1, int(settings.get('collector_workers_total', 32))))
+        timeout = float(settings.get('connection_timeout', 10))
+        
+        started = time.perf_counter()
+        outcomes: Dict[str, Tuple[bool, float]] = {}
+        
+        if per_device == 1 or len(selected) == 1:
+            for name, method_name in selected:
+                outcomes[name] = self._run_collector(device, method_name, fleet_slots, per_device, timeout)
+        else:
+            workers = min(per_device, len(selected))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"collect-{device_id}") as executor:
+                futures = {
+                    name: executor.submit(self._run_collector, device, method_name, fleet_slots,
+                                          per_device, timeout)
+                    for name, method_name in selected
+                }
+                for name, future in futures.items():
+                    outcomes[name] = future.result()
+        
+        results = {name: ok for name, (ok, _) in outcomes.items()}
+        timings = {name: round(elapsed, 4) for name, (_, elapsed) in outcomes.items()}
         
         return {
             "success": all(results.values()),
-            "results": results
+            "results": results,
+            "timings": timings,
+            "duration": round(time.perf_counter() - started, 4),
+            "interface_api_calls": self.interface_cycle_stats.get(device_id, {}).get('api_calls')
         }
     
-    def _check_resource_thresholds(self, device_id: str, resources: SystemResources) -> None:
-        """Check system resources against thresholds and generate alerts"""
-        thresholds = config.get_thresholds()
-        device = DataStore.devices.get(device_id)
-        if not device:
-            return
-        
-        # Check CPU load
-        if resources.cpu_load > thresholds.get('cpu_load', 80):
-            self._add_alert(
-                device_id=device_id,
-                alert_type='cpu_load',
-                message=f"High CPU load on {device.name}: {resources.cpu_load}%",
-                severity='warning'
-            )
+    async def _prefetch_async(self, device: Device, selected: List[Tuple[str, str]],
+                              timeout: float) -> Tuple[Dict[str, routeros_async.Command], Dict[str, Any]]:
+        """Gửi mọi lệnh đọc của các collector đã chọn trên một kết nối async và chờ tất cả phản hồi
         
-        # Check memory usage
-        if resources.total_memory > 0:
-            memory_usage = (resources.total_memory - resources.free_memory) / resources.total_memory * 100
-            if memory_usage > thresholds.get('memory_usage', 80):
-                self._add_alert(
-                    device_id=device_id,
-                    alert_type='memory_usage',
-                    message=f"High memory usage on {device.name}: {memory_usage:.2f}%",
-                    severity='warning'
-                )
+        Returns:
+            Tuple: (các lệnh đã gửi, kết quả theo khóa lệnh)
+        """
+        client = self.async_connections.get(device.id)
+        if client is None or client.closed:
+            # Hai lượt thu thập cùng thiết bị chờ nhau, lượt sau dùng lại client vừa được mở
+            lock = self._async_connect_locks.setdefault(device.id, asyncio.Lock())
+            async with lock:
+                client = self.async_connections.get(device.id)
+                if client is None or client.closed:
+                    settings = config.get_snapshot()
+                    use_ssl = device.use_ssl if hasattr(device, 'use_ssl') else settings.get('use_ssl', False)
+                    client = await routeros_async.AsyncRouterOsApi.connect(
+                        device.host, device.port, device.username, device.password,
+                        use_ssl=use_ssl, timeout=timeout
+                    )
+                    self.async_connections[device.id] = client
         
-        # Check disk usage
-        if resources.total_hdd > 0:
-            disk_usage = (resources.total_hdd - resources.free_hdd) / resources.total_hdd * 100
-            if disk_usage > thresholds.get('disk_usage', 80):
-                self._add_alert(
-                    device_id=device_id,
-                    alert_type='disk_usage',
-                    message=f"High disk usage on {device.name}: {disk_usage:.2f}%",
-                    severity='warning'
-                )
-    
-    def _check_interface_alerts(self, device_id: str, interfaces: List[Interface]) -> None:
-        """Check interfaces for issues and generate alerts"""
-        device = DataStore.devices.get(device_id)
-        if not device:
-            return
+        commands: Dict[str, routeros_async.Command] = {}
+        for name, _ in selected:
+            for path in self.COLLECTOR_PATHS.get(name, ()):
+                commands[routeros_async.command_key(path)] = (path, 'print', None)
         
-        for interface in interfaces:
-            # Check if interface is down (not running and not disabled)
-            if not interface.running and not interface.disabled and interface.type != 'bridge':
-                self._add_alert(
-                    device_id=device_id,
-                    alert_type='interface_down',
-                    message=f"Interface {interface.name} on {device.name} is down",
-                    severity='error'
-                )
-            
-            # Check for interface errors
-            if interface.rx_error > 0 or interface.tx_error > 0:
-                self._add_alert(
-                    device_id=device_id,
-                    alert_type='interface_errors',
-                    message=f"Interface {interface.name} on {device.name} has errors (RX: {interface.rx_error}, TX: {interface.tx_error})",
-                    severity='warning'
+        # Tên interface đã biết từ chu kỳ trước cho phép gửi monitor-traffic cùng lúc với các lệnh print
+        if any(name == 'interfaces' for name, _ in selected):
+            previous = DataStore.interface_index.get(device.id, {})
+            if previous:
+                commands[routeros_async.command_key('/interface', 'monitor-traffic')] = (
+                    '/interface', 'monitor-traffic', {'interface': ','.join(previous), 'once': ''}
                 )
-            
-            # Check for interface drops
-            if interface.rx_drop > 0 or interface.tx_drop > 0:
-                self._add_alert(
-                    device_id=device_id,
-                    alert_type='interface_drops',
-                    message=f"Interface {interface.name} on {device.name} has packet drops (RX: {interface.rx_drop}, TX: {interface.tx_drop})",
-                    severity='info'
+            # Liên kết cần đọc tốc độ theo trạng thái của chu kỳ trước; nếu trạng thái mới khác đi,
+            # _update_link_speeds gửi trực tiếp lệnh monitor cho danh sách mới (PrefetchedApi.call)
+            stale = self._stale_links(device.id, previous.values())
+            if stale:
+                commands[routeros_async.command_key('/interface/ethernet', 'monitor')] = (
+                    '/interface/ethernet', 'monitor', {'numbers': ','.join(stale), 'once': ''}
                 )
+        
+        results = await client.call_many(commands)
+        if client.closed:
+            self.async_connections.pop(device.id, None)
+            raise routeros_async.RouterOsConnectionError(f"Connection to {device.host} was lost")
+        return commands, results
     
-    def _add_alert(self, device_id: str, alert_type: str, message: str, severity: str) -> None:
-        """Add an alert to the alerts list"""
-        # Check if similar alert already exists
-        for alert in DataStore.alerts:
-            if (alert.device_id == device_id and 
-                alert.type == alert_type and 
-                alert.active and not alert.resolved):
-                # Alert already exists
-                return
+    def _collect_prefetched(self, device: Device, selected: List[Tuple[str, str]],
+                            prefetched: Any) -> Dict[str, Any]:
+        """Chạy các collector trên dữ liệu đã lấy trước bằng client async"""
+        if isinstance(prefetched, Exception):
+            if isinstance(prefetched, routeros_async.RouterOsConnectionError):
+                error_message = str(prefetched)
+            else:
+                error_message = f"Failed to collect from {device.host}: {prefetched}"
+            logger.error(error_message)
+            device.error_message = error_message
+            device.last_connected = None
+            return {
+                "success": False,
+                "error": error_message
+            }
         
-        # Add new alert
-        alert = Alert(
-            device_id=device_id,
-            type=alert_type,
-            message=message,
-            severity=severity
+        commands, results = prefetched
+        api = routeros_async.PrefetchedApi(
+            results, error_class=RouterOsApiError, commands=commands,
+            client=self.async_connections.get(device.id),
+            timeout=float(config.get_snapshot().get('connection_timeout', 10))
         )
-        DataStore.alerts.append(alert)
+        started = time.perf_counter()
+        outcomes: Dict[str, Tuple[bool, float]] = {}
+        for name, method_name in selected:
+            collector_started = time.perf_counter()
+            self._local.device_id = device.id
+            self._local.api = api
+            try:
+                ok = getattr(self, method_name)(device.id) is not None
+            except Exception as e:
+                logger.error(f"Collector {method_name} failed on {device.id}: {e}")
+                ok = False
+            finally:
+                self._local.device_id = None
+                self._local.api = None
+            outcomes[name] = (ok, time.perf_counter() - collector_started)
+        
+        device.last_connected = datetime.now()
+        device.error_message = None
+        results = {name: ok for name, (ok, _) in outcomes.items()}
+        
+        return {
+            "success": all(results.values()),
+            "results": results,
+            "timings": {name: round(elapsed, 4) for name, (_, elapsed) in outcomes.items()},
+            "duration": round(time.perf_counter() - started, 4),
+            "interface_api_calls": self.interface_cycle_stats.get(device.id, {}).get('api_calls')
+        }
+    
+    def collect_fleet_async(self, device_ids: List[str],
+                            collectors: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """Thu thập dữ liệu của nhiều thiết bị cùng lúc trên một event loop
+        
+        Mọi thiết bị được gửi lệnh đồng thời, sau đó các collector phân tích kết quả tuần tự.
+        
+        Returns:
+            Dict[str, Dict[str, Any]]: Kết quả collect_all_data theo device_id
+        """
+        settings = config.get_snapshot()
+        timeout = float(settings.get('connection_timeout', 10))
+        concurrency = max(1, int(settings.get('async_max_devices', 256)))
+        selected = [(name, method_name) for name, method_name in self.COLLECTORS
+                    if collectors is None or name in collectors]
+        
+        devices = []
+        results: Dict[str, Dict[str, Any]] = {}
+        for device_id in device_ids:
+            device = DataStore.devices.get(device_id)
+            if device and device.enabled:
+                devices.append(device)
+            else:
+                results[device_id] = {"success": False, "error": "Device not found or disabled"}
+        
+        async def fetch_all() -> List[Any]:
+            slots = asyncio.Semaphore(concurrency)
+            
+            async def fetch(device: Device) -> Any:
+                async with slots:
+                    return await self._prefetch_async(device, selected, timeout)
+            
+            return await asyncio.gather(*(fetch(device) for device in devices), return_exceptions=True)
         
-        # Log the alert
-        logger.warning(f"Alert: {message}")
+        for device, prefetched in zip(devices, routeros_async.run_coroutine(fetch_all())):
+            results[device.id] = self._collect_prefetched(device, selected, prefetched)
+        return results
 
 # Initialize the Mikrotik API
 mikrotik_api = MikrotikAPI()
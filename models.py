@@ -1,7 +1,12 @@
+import itertools
+import threading
+from collections import deque
 from dataclasses import dataclass, field
-from typing import Dict, List, Any, Optional
+from typing import Deque, Dict, Iterable, Iterator, List, Any, Optional, Tuple
 from datetime import datetime
 
+from history import HistoryBuffer, RingBuffer, RollupSet
+
 @dataclass
 class Site:
     id: str
@@ -71,6 +76,8 @@ class Interface:
     prev_tx_byte: int = 0
     rx_speed: float = 0.0
     tx_speed: float = 0.0
+    link_speed: int = 0  # Tốc độ liên kết (bit/s) đọc từ /interface/ethernet/monitor, 0 khi không rõ
+    utilization: float = 0.0  # Mức sử dụng (%) theo hướng bận hơn so với link_speed
 
 @dataclass
 class IPAddress:
@@ -173,6 +180,124 @@ class Alert:
     active: bool = True
     resolved: bool = False
     resolved_time: Optional[datetime] = None
+    subject: str = ''  # Đối tượng của cảnh báo trên thiết bị, ví dụ tên interface
+    id: int = 0
+
+class AlertStore:
+    """Kho cảnh báo với ID ổn định và chỉ mục theo (thiết bị, loại, đối tượng)
+
+    Cảnh báo đang mở được chỉ mục theo khóa (device_id, type, subject) để kiểm tra trùng lặp
+    và theo thiết bị để lọc. Cảnh báo đã xử lý được xếp theo thời điểm xử lý nên cleanup()
+    chỉ lấy ra các cảnh báo hết hạn ở đầu hàng đợi thay vì dựng lại toàn bộ danh sách.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._alerts: Dict[int, Alert] = {}  # Theo thứ tự tạo
+        self._active: Dict[Tuple[str, str, str], Alert] = {}
+        self._by_device: Dict[str, Dict[int, Alert]] = {}
+        self._resolved: Deque[Alert] = deque()
+        self._ids = itertools.count(1)
+
+    def add(self, device_id: str, alert_type: str, message: str, severity: str,
+            subject: str = '') -> Optional[Alert]:
+        """Tạo cảnh báo mới, trả về None nếu cảnh báo cùng khóa vẫn đang mở"""
+        key = (device_id, alert_type, subject)
+        with self._lock:
+            if key in self._active:
+                return None
+            alert = Alert(device_id=device_id, type=alert_type, message=message, severity=severity,
+                          subject=subject, id=next(self._ids))
+            self._insert(alert)
+            return alert
+
+    def _insert(self, alert: Alert) -> None:
+        self._alerts[alert.id] = alert
+        self._by_device.setdefault(alert.device_id, {})[alert.id] = alert
+        if alert.active:
+            self._active[(alert.device_id, alert.type, alert.subject)] = alert
+
+    def get(self, alert_id: int) -> Optional[Alert]:
+        return self._alerts.get(alert_id)
+
+    def find_active(self, device_id: str, alert_type: str, subject: str = '') -> Optional[Alert]:
+        """Cảnh báo đang mở theo khóa (thiết bị, loại, đối tượng)"""
+        return self._active.get((device_id, alert_type, subject))
+
+    def resolve(self, alert_id: int) -> Optional[Alert]:
+        """Đánh dấu cảnh báo đã xử lý, trả về None nếu không tồn tại"""
+        with self._lock:
+            alert = self._alerts.get(alert_id)
+            if alert is None or not alert.active:
+                return alert
+            alert.active = False
+            alert.resolved = True
+            alert.resolved_time = datetime.now()
+            key = (alert.device_id, alert.type, alert.subject)
+            if self._active.get(key) is alert:
+                del self._active[key]
+            self._resolved.append(alert)
+            return alert
+
+    def for_device(self, device_id: str) -> List[Alert]:
+        """Các cảnh báo của thiết bị theo thứ tự tạo"""
+        with self._lock:
+            return list(self._by_device.get(device_id, {}).values())
+
+    def remove_device(self, device_id: str) -> None:
+        """Xóa mọi cảnh báo của thiết bị"""
+        with self._lock:
+            for alert in self._by_device.pop(device_id, {}).values():
+                del self._alerts[alert.id]
+                key = (alert.device_id, alert.type, alert.subject)
+                if self._active.get(key) is alert:
+                    del self._active[key]
+            # Phần tử trong _resolved được bỏ qua khi cleanup() gặp lại
+
+    def cleanup(self, max_age: float = 86400) -> int:
+        """Xóa các cảnh báo đã xử lý lâu hơn `max_age` giây, trả về số cảnh báo đã xóa"""
+        now = datetime.now()
+        removed = 0
+        with self._lock:
+            resolved = self._resolved
+            while resolved and (now - resolved[0].resolved_time).total_seconds() >= max_age:
+                alert = resolved.popleft()
+                if self._alerts.pop(alert.id, None) is None:
+                    continue
+                device_alerts = self._by_device.get(alert.device_id)
+                if device_alerts is not None:
+                    device_alerts.pop(alert.id, None)
+                    if not device_alerts:
+                        del self._by_device[alert.device_id]
+                removed += 1
+        return removed
+
+    def restore(self, alerts: Iterable[Alert]) -> None:
+        """Nạp lại cảnh báo đã lưu (giữ nguyên ID, cấp ID mới cho cảnh báo chưa có)"""
+        with self._lock:
+            alerts = list(alerts)
+            next_id = max([alert.id for alert in alerts] + [0] + list(self._alerts)) + 1
+            resolved = []
+            for alert in alerts:
+                if not alert.active and alert.resolved_time is None:
+                    continue
+                if not alert.id or alert.id in self._alerts:
+                    alert.id = next_id
+                    next_id += 1
+                self._insert(alert)
+                if not alert.active:
+                    resolved.append(alert)
+            resolved.extend(self._resolved)
+            resolved.sort(key=lambda alert: alert.resolved_time)
+            self._resolved = deque(resolved)
+            self._ids = itertools.count(max(next_id, next(self._ids)))
+
+    def __iter__(self) -> Iterator[Alert]:
+        with self._lock:
+            return iter(list(self._alerts.values()))
+
+    def __len__(self) -> int:
+        return len(self._alerts)
 
 # In-memory data store
 class DataStore:
@@ -180,6 +305,8 @@ class DataStore:
     devices: Dict[str, Device] = {}
     system_resources: Dict[str, SystemResources] = {}
     interfaces: Dict[str, List[Interface]] = {}
+    # Chỉ mục interface theo thiết bị và tên interface, luôn đồng bộ với interfaces
+    interface_index: Dict[str, Dict[str, Interface]] = {}
     ip_addresses: Dict[str, List[IPAddress]] = {}
     arp_entries: Dict[str, List[ArpEntry]] = {}
     dhcp_leases: Dict[str, List[DHCPLease]] = {}
@@ -187,13 +314,30 @@ class DataStore:
     wireless_clients: Dict[str, List[WirelessClient]] = {}
     capsman_registrations: Dict[str, List[CapsmanRegistration]] = {}
     logs: Dict[str, List[LogEntry]] = {}
-    alerts: List[Alert] = []
+    alerts: AlertStore = AlertStore()
     
     # Interface traffic history for charts (last 24 hours with 5-minute intervals)
-    interface_history: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+    # Bộ đệm vòng dạng cột theo thiết bị và tên interface (xem history.INTERFACE_FIELDS),
+    # RingBuffer hoặc CompressedRingBuffer tùy interface_history_mode
+    interface_history: Dict[str, Dict[str, HistoryBuffer]] = {}
     
-    # System resource history
-    system_history: Dict[str, List[Dict[str, Any]]] = {}
+    # System resource history (xem history.SYSTEM_FIELDS)
+    system_history: Dict[str, RingBuffer] = {}
+    
+    # Lịch sử đã gộp theo độ phân giải 1m/5m/1h/1d, cùng khóa với interface_history và system_history
+    interface_rollups: Dict[str, Dict[str, RollupSet]] = {}
+    system_rollups: Dict[str, RollupSet] = {}
+    
+    @classmethod
+    def set_interfaces(cls, device_id: str, interfaces: List[Interface]) -> None:
+        """Lưu danh sách interface của thiết bị và cập nhật chỉ mục theo tên"""
+        cls.interfaces[device_id] = interfaces
+        cls.interface_index[device_id] = {interface.name: interface for interface in interfaces}
+    
+    @classmethod
+    def get_interface(cls, device_id: str, name: str) -> Optional[Interface]:
+        """Lấy interface của thiết bị theo tên"""
+        return cls.interface_index.get(device_id, {}).get(name)
     
     @classmethod
     def get_devices_by_site(cls, site_id: str) -> List[Device]:
@@ -0,0 +1,385 @@
+"""
+Gửi thông báo cảnh báo qua webhook và email (SMTP)
+
+Các thay đổi trạng thái cảnh báo (mở/đóng) được đưa vào một hàng đợi có giới hạn bằng notify(),
+không bao giờ chặn luồng gọi; khi hàng đợi đầy sự kiện bị bỏ và ghi log. Luồng nền gom các sự kiện
+trong notification_batch_window giây thành một bản tổng hợp cho mỗi site (50 interface down
+ở cùng một site là một thông báo), rồi chuyển cho từng sink.
+
+Mỗi sink có luồng và hàng đợi riêng để sink chậm không làm trễ sink khác, giới hạn số thông báo
+mỗi phút (token bucket; các bản tổng hợp chờ trong lúc bị giới hạn được gộp thành một thông báo)
+và thử lại với thời gian chờ tăng dần khi gửi lỗi.
+"""
+
+import json
+import logging
+import queue
+import smtplib
+import threading
+import time
+from dataclasses import dataclass, field
+from email.message import EmailMessage
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+import requests
+
+import config
+from models import Alert, DataStore
+
+logger = logging.getLogger(__name__)
+
+SEVERITY_ORDER = {'info': 0, 'warning': 1, 'error': 2, 'critical': 3}
+
+# Thời gian chờ trước lần thử lại đầu tiên và tối đa giữa hai lần thử (giây)
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+
+# Thời gian chờ của một lần gửi (giây)
+SEND_TIMEOUT = 10
+
+
+@dataclass
+class Digest:
+    """Các thay đổi trạng thái cảnh báo của một site trong một lượt gom"""
+    site_id: str
+    site_name: str
+    events: List[Tuple[str, Alert]] = field(default_factory=list)
+
+    def counts(self) -> Dict[str, int]:
+        counts = {'raised': 0, 'resolved': 0}
+        for event, _ in self.events:
+            counts[event] = counts.get(event, 0) + 1
+        return counts
+
+    def subject(self) -> str:
+        if len(self.events) == 1:
+            event, alert = self.events[0]
+            prefix = 'RESOLVED' if event == 'resolved' else alert.severity.upper()
+            return f"[{prefix}] {alert.message}"
+        counts = self.counts()
+        parts = [f"{count} {event}" for event, count in counts.items() if count]
+        return f"{self.site_name}: {len(self.events)} alerts ({', '.join(parts)})"
+
+    def text(self) -> str:
+        lines = [self.subject(), '']
+        for event, alert in self.events:
+            device = DataStore.devices.get(alert.device_id)
+            lines.append(f"{event.upper():9} {alert.severity:8} {device.name if device else alert.device_id}"
+                         f"{' ' + alert.subject if alert.subject else ''}: {alert.message}")
+        return '\n'.join(lines)
+
+    def payload(self) -> Dict[str, Any]:
+        return {
+            'site_id': self.site_id,
+            'site_name': self.site_name,
+            'summary': self.subject(),
+            **self.counts(),
+            'events': [
+                {
+                    'event': event,
+                    'id': alert.id,
+                    'device_id': alert.device_id,
+                    'type': alert.type,
+                    'subject': alert.subject,
+                    'severity': alert.severity,
+                    'message': alert.message,
+                    'created': alert.created.isoformat() if alert.created else None,
+                    'resolved_time': alert.resolved_time.isoformat() if alert.resolved_time else None
+                }
+                for event, alert in self.events
+            ]
+        }
+
+
+def build_digests(events: Iterable[Tuple[str, Alert]]) -> List[Digest]:
+    """Gom các sự kiện theo site của thiết bị"""
+    digests: Dict[str, Digest] = {}
+    for event, alert in events:
+        device = DataStore.devices.get(alert.device_id)
+        site_id = device.site_id if device else 'default'
+        digest = digests.get(site_id)
+        if digest is None:
+            digest = digests[site_id] = Digest(site_id, DataStore.get_site_name(site_id))
+        digest.events.append((event, alert))
+    return list(digests.values())
+
+
+class Sink:
+    """Nơi nhận thông báo, chạy trên luồng riêng với hàng đợi, giới hạn tốc độ và thử lại
+
+    Args:
+        spec: Cấu hình sink (type, rate_limit, max_retries, min_severity và các trường riêng của loại sink)
+    """
+
+    kind = ''
+
+    def __init__(self, spec: Mapping[str, Any]):
+        self.spec = spec
+        self.name = spec.get('name') or f"{self.kind}:{self.target()}"
+        self.rate_limit = float(spec.get('rate_limit', 30))  # Số thông báo mỗi phút
+        self.max_retries = int(spec.get('max_retries', 5))
+        self.min_severity = SEVERITY_ORDER.get(spec.get('min_severity', 'info'), 0)
+        self._queue: 'queue.Queue[Optional[Digest]]' = queue.Queue(maxsize=int(spec.get('queue_size', 1000)))
+        self._tokens = max(1.0, self.rate_limit / 60 * 10)  # Cho phép dồn tối đa 10 giây
+        self._capacity = self._tokens
+        self._refilled = time.monotonic()
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name=f"notify-{self.name}", daemon=True)
+        self._thread.start()
+
+    def target(self) -> str:
+        return ''
+
+    def send(self, digest: Digest) -> None:
+        """Gửi một thông báo, ném exception khi lỗi"""
+        raise NotImplementedError
+
+    def submit(self, digest: Digest) -> None:
+        events = [(event, alert) for event, alert in digest.events
+                  if SEVERITY_ORDER.get(alert.severity, 0) >= self.min_severity]
+        if not events:
+            return
+        try:
+            self._queue.put_nowait(Digest(digest.site_id, digest.site_name, events))
+        except queue.Full:
+            self.dropped += 1
+            logger.warning(f"Notification sink {self.name} queue full, dropping digest for {digest.site_name}")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+    def _take_token(self) -> bool:
+        """Chờ tới khi giới hạn tốc độ cho phép gửi thêm một thông báo, trả về True nếu đã phải chờ"""
+        rate = self.rate_limit / 60
+        waited = False
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self._capacity, self._tokens + (now - self._refilled) * rate)
+            self._refilled = now
+            if self._tokens >= 1 or rate <= 0:
+                self._tokens -= 1
+                return waited
+            time.sleep((1 - self._tokens) / rate)
+            waited = True
+
+    def _run(self) -> None:
+        while True:
+            digest = self._queue.get()
+            if digest is None:
+                return
+            if not self._take_token():
+                self._deliver(digest)
+                continue
+            # Gộp các bản tổng hợp đã dồn lại trong lúc chờ giới hạn tốc độ
+            stopping = False
+            while True:
+                try:
+                    pending = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if pending is None:
+                    stopping = True
+                    break
+                if pending.site_id != digest.site_id:
+                    digest = Digest('', 'Multiple sites', digest.events)
+                digest.events.extend(pending.events)
+            self._deliver(digest)
+            if stopping:
+                return
+
+    def _deliver(self, digest: Digest) -> None:
+        delay = RETRY_BASE_DELAY
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.send(digest)
+                self.sent += 1
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.failed += 1
+                    logger.error(f"Notification to {self.name} failed after {attempt + 1} attempts: {e}")
+                    return
+                logger.warning(f"Notification to {self.name} failed ({e}), retrying in {delay:g}s")
+                time.sleep(delay)
+                delay = min(delay * 2, RETRY_MAX_DELAY)
+
+
+class WebhookSink(Sink):
+    """POST JSON tới một URL (url, headers tùy chọn)"""
+
+    kind = 'webhook'
+
+    def target(self) -> str:
+        return self.spec.get('url', '')
+
+    def send(self, digest: Digest) -> None:
+        payload = digest.payload()
+        payload['text'] = digest.text()
+        response = requests.post(self.spec['url'], data=json.dumps(payload),
+                                 headers={'Content-Type': 'application/json', **dict(self.spec.get('headers', {}))},
+                                 timeout=SEND_TIMEOUT)
+        response.raise_for_status()
+
+
+class SmtpSink(Sink):
+    """Gửi email (host, port, sender, recipients, username/password và starttls tùy chọn)"""
+
+    kind = 'smtp'
+
+    def target(self) -> str:
+        return f"{self.spec.get('host', 'localhost')}:{self.spec.get('port', 25)}"
+
+    def send(self, digest: Digest) -> None:
+        message = EmailMessage()
+        message['Subject'] = digest.subject()
+        message['From'] = self.spec.get('sender', 'mikrotik-monitor@localhost')
+        message['To'] = ', '.join(self.spec.get('recipients', ()))
+        message.set_content(digest.text())
+        with smtplib.SMTP(self.spec.get('host', 'localhost'), int(self.spec.get('port', 25)),
+                          timeout=SEND_TIMEOUT) as smtp:
+            if self.spec.get('starttls'):
+                smtp.starttls()
+            if self.spec.get('username'):
+                smtp.login(self.spec['username'], self.spec.get('password', ''))
+            smtp.send_message(message)
+
+
+SINK_TYPES = {sink.kind: sink for sink in (WebhookSink, SmtpSink)}
+
+
+class NotificationDispatcher:
+    """Hàng đợi sự kiện có giới hạn và luồng gom sự kiện thành bản tổng hợp theo site
+
+    Args:
+        queue_size: Số sự kiện tối đa đang chờ
+        batch_window: Thời gian gom sự kiện (giây) tính từ sự kiện đầu tiên của lượt
+    """
+
+    def __init__(self, queue_size: int = 10000, batch_window: float = 10.0):
+        self.batch_window = batch_window
+        self._queue: 'queue.Queue[Optional[Tuple[str, Alert]]]' = queue.Queue(maxsize=queue_size)
+        self._sinks: List[Sink] = []
+        self._sinks_source: Any = None
+        self._sinks_lock = threading.Lock()
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name='notify-dispatcher', daemon=True)
+        self._thread.start()
+
+    def configure(self, specs: Any) -> None:
+        """Dựng lại các sink khi cấu hình notification_sinks thay đổi"""
+        if specs is self._sinks_source:
+            return
+        sinks = []
+        for spec in specs or ():
+            sink_class = SINK_TYPES.get(spec.get('type'))
+            if sink_class is None:
+                logger.error(f"Unknown notification sink type: {spec.get('type')}")
+                continue
+            sinks.append(sink_class(spec))
+        with self._sinks_lock:
+            old, self._sinks = self._sinks, sinks
+            self._sinks_source = specs
+        for sink in old:
+            threading.Thread(target=sink.stop, daemon=True).start()
+
+    def notify(self, events: Iterable[Tuple[str, Alert]]) -> None:
+        """Đưa sự kiện vào hàng đợi, không bao giờ chặn"""
+        for event in events:
+            try:
+                self._queue.put_nowait(event)
+            except queue.Full:
+                self.dropped += 1
+                if self.dropped % 100 == 1:
+                    logger.warning(f"Notification queue full, {self.dropped} events dropped so far")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Gửi nốt các sự kiện đang chờ rồi dừng các luồng"""
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        with self._sinks_lock:
+            sinks = list(self._sinks)
+        for sink in sinks:
+            sink.stop(timeout)
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            events = [first]
+            deadline = time.monotonic() + self.batch_window
+            stopping = False
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    event = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if event is None:
+                    stopping = True
+                    break
+                events.append(event)
+            self._dispatch(events)
+            if stopping:
+                return
+
+    def _dispatch(self, events: List[Tuple[str, Alert]]) -> None:
+        with self._sinks_lock:
+            sinks = list(self._sinks)
+        if not sinks:
+            return
+        for digest in build_digests(events):
+            for sink in sinks:
+                sink.submit(digest)
+
+
+_dispatcher: Optional[NotificationDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher() -> Optional[NotificationDispatcher]:
+    """Bộ gửi thông báo dùng chung của tiến trình, None khi notifications_enabled tắt"""
+    global _dispatcher
+    settings = config.get_snapshot()
+    if not settings.get('notifications_enabled', False):
+        return None
+
+    dispatcher = _dispatcher
+    if dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = NotificationDispatcher(
+                    int(settings.get('notification_queue_size', 10000)),
+                    float(settings.get('notification_batch_window', 10))
+                )
+            dispatcher = _dispatcher
+    dispatcher.batch_window = float(settings.get('notification_batch_window', 10))
+    dispatcher.configure(settings.get('notification_sinks', ()))
+    return dispatcher
+
+
+def notify(events: Iterable[Tuple[str, Alert]]) -> None:
+    """Gửi thông báo cho các thay đổi trạng thái cảnh báo ('raised'/'resolved', alert)"""
+    events = list(events)
+    if not events:
+        return
+    dispatcher = get_dispatcher()
+    if dispatcher is not None:
+        dispatcher.notify(events)
+
+
+def stop() -> None:
+    """Gửi nốt thông báo đang chờ khi dừng ứng dụng"""
+    if _dispatcher is not None:
+        _dispatcher.stop()
@@ -0,0 +1,292 @@
+"""
+Lưu ảnh chụp mới nhất của DataStore vào SQLite để khởi động lại không mất dữ liệu
+
+Ảnh chụp gồm trạng thái thiết bị, tài nguyên hệ thống, interface, ARP, DHCP, log và cảnh báo.
+Các collector chỉ đánh dấu thiết bị đã thay đổi (mark_dirty); job định kỳ gọi flush() để ghi
+mọi thiết bị đã thay đổi trong một transaction. Khi khởi động, warm_start() nạp lại ảnh chụp
+vào DataStore để dashboard có dữ liệu ngay trước lần thu thập đầu tiên.
+"""
+
+import dataclasses
+import logging
+import os
+import sqlite3
+import threading
+import typing
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Type
+
+import config
+from models import Alert, ArpEntry, DataStore, DHCPLease, Interface, LogEntry, SystemResources
+
+logger = logging.getLogger(__name__)
+
+# Bảng theo thiết bị: tên bảng -> (lớp dữ liệu, thuộc tính của DataStore)
+# system_resources giữ một đối tượng cho mỗi thiết bị, các bảng còn lại giữ danh sách
+DEVICE_TABLES: Dict[str, Tuple[Type[Any], str]] = {
+    'system_resources': (SystemResources, 'system_resources'),
+    'interfaces': (Interface, 'interfaces'),
+    'arp_entries': (ArpEntry, 'arp_entries'),
+    'dhcp_leases': (DHCPLease, 'dhcp_leases'),
+    'logs': (LogEntry, 'logs'),
+}
+
+# Trạng thái kết nối của thiết bị (thông tin cấu hình vẫn lấy từ config.json)
+DEVICE_STATUS_COLUMNS = ('id', 'last_connected', 'error_message')
+
+
+def _is_datetime(annotation: Any) -> bool:
+    return annotation is datetime or datetime in typing.get_args(annotation)
+
+
+class _Table:
+    """Ánh xạ giữa một dataclass và bảng SQLite có cùng tên cột"""
+
+    def __init__(self, name: str, cls: Type[Any]):
+        self.name = name
+        self.cls = cls
+        self.columns = tuple(f.name for f in dataclasses.fields(cls))
+        # Hàm chuyển đổi giá trị khi đọc lại, theo kiểu khai báo của trường
+        self._decoders: List[Optional[Callable[[Any], Any]]] = []
+        for f in dataclasses.fields(cls):
+            if _is_datetime(f.type):
+                self._decoders.append(lambda value: datetime.fromisoformat(value) if value else None)
+            elif f.type is bool:
+                self._decoders.append(bool)
+            else:
+                self._decoders.append(None)
+        self.insert_sql = (f'INSERT INTO {name} ({", ".join(self.columns)}) '
+                           f'VALUES ({", ".join("?" for _ in self.columns)})')
+
+    def create(self, conn: sqlite3.Connection) -> None:
+        """Tạo bảng; nếu cột đã đổi (dataclass thay đổi giữa các phiên bản) thì tạo lại bảng"""
+        existing = tuple(row[1] for row in conn.execute(f'PRAGMA table_info({self.name})'))
+        if existing and existing != self.columns:
+            logger.info(f"Snapshot table {self.name} schema changed, recreating")
+            conn.execute(f'DROP TABLE {self.name}')
+        conn.execute(f'CREATE TABLE IF NOT EXISTS {self.name} ({", ".join(self.columns)})')
+        if 'device_id' in self.columns:
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {self.name}_device ON {self.name} (device_id)')
+
+    def row(self, item: Any) -> Tuple[Any, ...]:
+        values = []
+        for column in self.columns:
+            value = getattr(item, column)
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            values.append(value)
+        return tuple(values)
+
+    def load(self, row: Tuple[Any, ...]) -> Any:
+        values = [decode(value) if decode is not None and value is not None else value
+                  for decode, value in zip(self._decoders, row)]
+        return self.cls(*values)
+
+
+class SnapshotStore:
+    """Ảnh chụp DataStore trong SQLite (WAL), ghi theo lô
+
+    Args:
+        path: Đường dẫn file SQLite
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._lock = threading.Lock()
+        self._dirty: Set[str] = set()
+        self._alerts_dirty = False
+        self._dirty_lock = threading.Lock()
+
+        self.tables = {name: _Table(name, cls) for name, (cls, _) in DEVICE_TABLES.items()}
+        self.alerts = _Table('alerts', Alert)
+        with self._lock:
+            for table in list(self.tables.values()) + [self.alerts]:
+                table.create(self._conn)
+            self._conn.execute(
+                f'CREATE TABLE IF NOT EXISTS device_status ({", ".join(DEVICE_STATUS_COLUMNS)}, PRIMARY KEY (id))'
+            )
+
+    def mark_dirty(self, device_id: str) -> None:
+        """Đánh dấu dữ liệu của thiết bị cần ghi ở lần flush tiếp theo"""
+        with self._dirty_lock:
+            self._dirty.add(device_id)
+
+    def mark_alerts_dirty(self) -> None:
+        """Đánh dấu danh sách cảnh báo cần ghi lại ở lần flush tiếp theo"""
+        with self._dirty_lock:
+            self._alerts_dirty = True
+
+    def flush(self) -> int:
+        """Ghi mọi thiết bị đã thay đổi trong một transaction, trả về số thiết bị đã ghi"""
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, set()
+            alerts_dirty, self._alerts_dirty = self._alerts_dirty, False
+        if not dirty and not alerts_dirty:
+            return 0
+
+        # Lấy tham chiếu tới dữ liệu hiện tại; collector thay cả danh sách chứ không sửa tại chỗ
+        status_rows = []
+        table_rows: Dict[str, List[Tuple[Any, ...]]] = {name: [] for name in self.tables}
+        for device_id in dirty:
+            device = DataStore.devices.get(device_id)
+            if device is not None:
+                status_rows.append((
+                    device_id,
+                    device.last_connected.isoformat() if device.last_connected else None,
+                    device.error_message
+                ))
+            for name, (_, attribute) in DEVICE_TABLES.items():
+                value = getattr(DataStore, attribute).get(device_id)
+                if value is None:
+                    continue
+                items = value if isinstance(value, list) else [value]
+                table = self.tables[name]
+                table_rows[name].extend(table.row(item) for item in items)
+        alert_rows = [self.alerts.row(alert) for alert in list(DataStore.alerts)] if alerts_dirty else None
+
+        deleted = [(device_id,) for device_id in dirty]
+        with self._lock:
+            try:
+                self._conn.execute('BEGIN')
+                for name, table in self.tables.items():
+                    self._conn.executemany(f'DELETE FROM {name} WHERE device_id = ?', deleted)
+                    self._conn.executemany(table.insert_sql, table_rows[name])
+                self._conn.executemany(
+                    f'INSERT OR REPLACE INTO device_status ({", ".join(DEVICE_STATUS_COLUMNS)}) VALUES (?, ?, ?)',
+                    status_rows
+                )
+                if alert_rows is not None:
+                    self._conn.execute('DELETE FROM alerts')
+                    self._conn.executemany(self.alerts.insert_sql, alert_rows)
+                self._conn.execute('COMMIT')
+            except sqlite3.Error as e:
+                self._conn.execute('ROLLBACK')
+                logger.error(f"Error writing snapshot to {self.path}: {e}")
+                # Giữ lại đánh dấu để thử lại ở lần flush sau
+                with self._dirty_lock:
+                    self._dirty.update(dirty)
+                    self._alerts_dirty = self._alerts_dirty or alerts_dirty
+                return 0
+        return len(dirty)
+
+    def remove_device(self, device_id: str) -> None:
+        """Xóa dữ liệu của thiết bị khỏi ảnh chụp"""
+        with self._dirty_lock:
+            self._dirty.discard(device_id)
+            self._alerts_dirty = True
+        with self._lock:
+            try:
+                self._conn.execute('BEGIN')
+                for name in self.tables:
+                    self._conn.execute(f'DELETE FROM {name} WHERE device_id = ?', (device_id,))
+                self._conn.execute('DELETE FROM device_status WHERE id = ?', (device_id,))
+                self._conn.execute('COMMIT')
+            except sqlite3.Error as e:
+                self._conn.execute('ROLLBACK')
+                logger.error(f"Error removing device {device_id} from snapshot {self.path}: {e}")
+
+    def warm_start(self) -> int:
+        """Nạp ảnh chụp vào DataStore cho các thiết bị đang có trong DataStore.devices
+
+        Chỉ điền các mục chưa có dữ liệu, trả về số thiết bị đã được nạp.
+        """
+        known = DataStore.devices
+        restored: Set[str] = set()
+        with self._lock:
+            for device_id, last_connected, error_message in self._conn.execute(
+                    f'SELECT {", ".join(DEVICE_STATUS_COLUMNS)} FROM device_status'):
+                device = known.get(device_id)
+                if device is None:
+                    continue
+                if device.last_connected is None and last_connected:
+                    device.last_connected = datetime.fromisoformat(last_connected)
+                if device.error_message is None:
+                    device.error_message = error_message
+
+            for name, (_, attribute) in DEVICE_TABLES.items():
+                table = self.tables[name]
+                grouped: Dict[str, List[Any]] = {}
+                for row in self._conn.execute(f'SELECT {", ".join(table.columns)} FROM {name} ORDER BY rowid'):
+                    item = table.load(row)
+                    if item.device_id in known:
+                        grouped.setdefault(item.device_id, []).append(item)
+
+                target = getattr(DataStore, attribute)
+                for device_id, items in grouped.items():
+                    if device_id in target:
+                        continue
+                    if name == 'system_resources':
+                        target[device_id] = items[-1]
+                    elif name == 'interfaces':
+                        DataStore.set_interfaces(device_id, items)
+                    else:
+                        target[device_id] = items
+                    restored.add(device_id)
+
+            if not DataStore.alerts:
+                DataStore.alerts.restore(
+                    alert for alert in (self.alerts.load(row) for row in self._conn.execute(
+                        f'SELECT {", ".join(self.alerts.columns)} FROM alerts ORDER BY rowid'))
+                    if alert.device_id in known
+                )
+        return len(restored)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_store: Optional[SnapshotStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> Optional[SnapshotStore]:
+    """Kho ảnh chụp dùng chung của tiến trình, None khi snapshot_enabled tắt"""
+    global _store
+    if not config.get_setting('snapshot_enabled', False):
+        return None
+
+    path = config.get_setting('snapshot_path', 'data/snapshot.db')
+    store = _store
+    if store is not None and store.path == path:
+        return store
+
+    with _store_lock:
+        if _store is None or _store.path != path:
+            if _store is not None:
+                _store.flush()
+                _store.close()
+            _store = SnapshotStore(path)
+        return _store
+
+
+def mark_dirty(device_id: str) -> None:
+    """Đánh dấu thiết bị cần ghi vào ảnh chụp (không làm gì khi tính năng tắt)"""
+    store = get_store()
+    if store is not None:
+        store.mark_dirty(device_id)
+
+
+def mark_alerts_dirty() -> None:
+    """Đánh dấu danh sách cảnh báo cần ghi vào ảnh chụp khi cảnh báo được mở, đóng hoặc dọn dẹp"""
+    store = get_store()
+    if store is not None:
+        store.mark_alerts_dirty()
+
+
+def warm_start() -> int:
+    """Nạp ảnh chụp vào DataStore khi khởi động"""
+    store = get_store()
+    if store is None:
+        return 0
+    try:
+        return store.warm_start()
+    except sqlite3.Error as e:
+        logger.error(f"Error loading snapshot from {store.path}: {e}")
+        return 0
@@ -0,0 +1,414 @@
+"""
+Báo cáo tính cước theo phân vị 95 và lưu lượng của từng interface
+
+Mỗi interface có một bản ghi sử dụng cho mỗi tháng (UTC), được cập nhật bởi collect_interfaces:
+tốc độ được gộp thành các mẫu trung bình 5 phút như cách tính cước 95th percentile thông thường,
+mỗi mẫu được đưa vào QuantileSketch (histogram logarit, sai số tương đối cố định) nên bộ nhớ
+không tăng theo số mẫu. Tổng byte được tính từ chênh lệch counter, có xử lý counter bị reset.
+
+Trạng thái được lưu định kỳ ra file JSON để báo cáo tháng không mất khi khởi động lại.
+"""
+
+import base64
+import csv
+import io
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+import zlib
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Độ dài mẫu dùng để tính phân vị (giây)
+SAMPLE_INTERVAL = 300
+
+# Các cột của báo cáo, tốc độ tính bằng bit/s
+REPORT_COLUMNS = (
+    'device_id', 'device_name', 'interface', 'month', 'samples',
+    'rx_percentile_bps', 'tx_percentile_bps', 'billable_bps',
+    'rx_peak_bps', 'tx_peak_bps', 'rx_avg_bps', 'tx_avg_bps', 'rx_bytes', 'tx_bytes',
+)
+
+
+def month_of(timestamp: float) -> str:
+    """Tháng (UTC) của timestamp dạng YYYY-MM"""
+    return time.strftime('%Y-%m', time.gmtime(timestamp))
+
+
+class QuantileSketch:
+    """Histogram logarit (kiểu DDSketch) cho giá trị không âm
+
+    Mọi phân vị có sai số tương đối không quá relative_accuracy. Các bucket được lưu dày đặc
+    trong một array uint32 từ chỉ số nhỏ nhất tới lớn nhất đã gặp; giá trị nhỏ hơn min_value
+    được đếm riêng như 0.
+
+    Args:
+        relative_accuracy: Sai số tương đối tối đa của phân vị
+        min_value: Giá trị nhỏ nhất được phân biệt với 0
+    """
+
+    __slots__ = ('relative_accuracy', 'min_value', 'gamma', '_log_gamma', 'offset', 'counts', 'zeros', 'count')
+
+    def __init__(self, relative_accuracy: float = 0.01, min_value: float = 1e-3):
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.offset = 0
+        self.counts = array('I')
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        if value < self.min_value:
+            self.zeros += 1
+            return
+
+        index = math.ceil(math.log(value) / self._log_gamma)
+        counts = self.counts
+        if not counts:
+            self.offset = index
+            counts.append(1)
+            return
+        position = index - self.offset
+        if position < 0:
+            # Mở rộng về phía chỉ số nhỏ
+            self.counts = counts = array('I', bytes(counts.itemsize * -position)) + counts
+            self.offset = index
+            position = 0
+        elif position >= len(counts):
+            counts.extend(array('I', bytes(counts.itemsize * (position - len(counts) + 1))))
+        counts[position] += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Phân vị q (0..1) theo nearest-rank, None nếu chưa có mẫu"""
+        if not self.count:
+            return None
+        rank = max(0, math.ceil(q * self.count) - 1)
+        if rank < self.zeros:
+            return 0.0
+        cumulative = list(accumulate(self.counts))
+        position = bisect_right(cumulative, rank - self.zeros)
+        # Giá trị đại diện của bucket (gamma^(i-1), gamma^i]
+        return 2 * self.gamma ** (self.offset + position) / (self.gamma + 1)
+
+    def copy(self) -> 'QuantileSketch':
+        sketch = QuantileSketch(self.relative_accuracy, self.min_value)
+        sketch.offset = self.offset
+        sketch.counts = array('I', self.counts)
+        sketch.zeros = self.zeros
+        sketch.count = self.count
+        return sketch
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'min_value': self.min_value,
+            'offset': self.offset,
+            # Các bucket liên tiếp phần lớn là 0 nên nén rất tốt
+            'counts': base64.b64encode(zlib.compress(array('Q', self.counts).tobytes())).decode('ascii'),
+            'zeros': self.zeros,
+            'count': self.count,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'QuantileSketch':
+        sketch = cls(data.get('relative_accuracy', 0.01), data.get('min_value', 1e-3))
+        sketch.offset = data.get('offset', 0)
+        counts = array('Q')
+        payload = data.get('counts')
+        if payload:
+            counts.frombytes(zlib.decompress(base64.b64decode(payload)))
+        sketch.counts = array('I', counts)
+        sketch.zeros = data.get('zeros', 0)
+        sketch.count = data.get('count', 0)
+        return sketch
+
+
+class InterfaceUsage:
+    """Số liệu sử dụng của một interface trong một tháng
+
+    Tốc độ (byte/s) được gộp thành mẫu trung bình SAMPLE_INTERVAL giây trước khi đưa vào sketch;
+    peak là tốc độ tức thời lớn nhất, tổng byte lấy từ chênh lệch counter.
+    """
+
+    __slots__ = ('month', 'rx_sketch', 'tx_sketch', 'samples', 'rx_sum', 'tx_sum', 'rx_peak', 'tx_peak',
+                 'rx_bytes', 'tx_bytes', 'last_rx_byte', 'last_tx_byte', 'slot', 'slot_rx', 'slot_tx', 'slot_count')
+
+    def __init__(self, month: str, last_rx_byte: Optional[int] = None, last_tx_byte: Optional[int] = None):
+        self.month = month
+        self.rx_sketch = QuantileSketch()
+        self.tx_sketch = QuantileSketch()
+        self.samples = 0
+        self.rx_sum = 0.0
+        self.tx_sum = 0.0
+        self.rx_peak = 0.0
+        self.tx_peak = 0.0
+        self.rx_bytes = 0
+        self.tx_bytes = 0
+        self.last_rx_byte = last_rx_byte
+        self.last_tx_byte = last_tx_byte
+        # Mẫu 5 phút đang gộp dở
+        self.slot: Optional[int] = None
+        self.slot_rx = 0.0
+        self.slot_tx = 0.0
+        self.slot_count = 0
+
+    def add(self, timestamp: float, rx_byte: int, tx_byte: int, rx_speed: float, tx_speed: float) -> None:
+        slot = int(timestamp // SAMPLE_INTERVAL)
+        if slot != self.slot:
+            self.close_sample()
+            self.slot = slot
+        self.slot_rx += rx_speed
+        self.slot_tx += tx_speed
+        self.slot_count += 1
+
+        if rx_speed > self.rx_peak:
+            self.rx_peak = rx_speed
+        if tx_speed > self.tx_peak:
+            self.tx_peak = tx_speed
+
+        if self.last_rx_byte is not None:
+            # Counter nhỏ hơn lần trước nghĩa là đã bị reset
+            self.rx_bytes += rx_byte - self.last_rx_byte if rx_byte >= self.last_rx_byte else rx_byte
+            self.tx_bytes += tx_byte - self.last_tx_byte if tx_byte >= self.last_tx_byte else tx_byte
+        self.last_rx_byte = rx_byte
+        self.last_tx_byte = tx_byte
+
+    def close_sample(self) -> None:
+        """Đưa mẫu 5 phút đang gộp vào sketch"""
+        if not self.slot_count:
+            return
+        rx = self.slot_rx / self.slot_count
+        tx = self.slot_tx / self.slot_count
+        self.rx_sketch.add(rx)
+        self.tx_sketch.add(tx)
+        self.rx_sum += rx
+        self.tx_sum += tx
+        self.samples += 1
+        self.slot_rx = self.slot_tx = 0.0
+        self.slot_count = 0
+
+    def copy(self) -> 'InterfaceUsage':
+        usage = InterfaceUsage(self.month)
+        for name in self.__slots__:
+            value = getattr(self, name)
+            setattr(usage, name, value.copy() if isinstance(value, QuantileSketch) else value)
+        return usage
+
+    def report(self, percentile: float) -> Dict[str, Any]:
+        """Số liệu báo cáo, tính cả mẫu 5 phút đang gộp dở; tốc độ đổi sang bit/s"""
+        rx_sketch, tx_sketch = self.rx_sketch, self.tx_sketch
+        samples, rx_sum, tx_sum = self.samples, self.rx_sum, self.tx_sum
+        if self.slot_count:
+            rx_sketch = rx_sketch.copy()
+            tx_sketch = tx_sketch.copy()
+            rx = self.slot_rx / self.slot_count
+            tx = self.slot_tx / self.slot_count
+            rx_sketch.add(rx)
+            tx_sketch.add(tx)
+            samples += 1
+            rx_sum += rx
+            tx_sum += tx
+
+        rx_percentile = (rx_sketch.quantile(percentile / 100) or 0.0) * 8
+        tx_percentile = (tx_sketch.quantile(percentile / 100) or 0.0) * 8
+        return {
+            'month': self.month,
+            'samples': samples,
+            'rx_percentile_bps': round(rx_percentile),
+            'tx_percentile_bps': round(tx_percentile),
+            # Cước thường tính theo chiều lớn hơn
+            'billable_bps': round(max(rx_percentile, tx_percentile)),
+            'rx_peak_bps': round(self.rx_peak * 8),
+            'tx_peak_bps': round(self.tx_peak * 8),
+            'rx_avg_bps': round(rx_sum / samples * 8) if samples else 0,
+            'tx_avg_bps': round(tx_sum / samples * 8) if samples else 0,
+            'rx_bytes': self.rx_bytes,
+            'tx_bytes': self.tx_bytes,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {name: getattr(self, name) for name in self.__slots__ if not name.endswith('_sketch')}
+        data['rx_sketch'] = self.rx_sketch.to_dict()
+        data['tx_sketch'] = self.tx_sketch.to_dict()
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'InterfaceUsage':
+        usage = cls(data['month'])
+        for name in cls.__slots__:
+            if name.endswith('_sketch'):
+                setattr(usage, name, QuantileSketch.from_dict(data.get(name, {})))
+            elif name in data:
+                setattr(usage, name, data[name])
+        return usage
+
+
+class ReportStore:
+    """Số liệu sử dụng theo thiết bị, interface và tháng
+
+    Args:
+        months: Số tháng gần nhất được giữ lại
+    """
+
+    def __init__(self, months: int = 13):
+        self.months = months
+        # (device_id, interface) -> {tháng: InterfaceUsage}
+        self.usage: Dict[Tuple[str, str], Dict[str, InterfaceUsage]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, device_id: str, interface: str, timestamp: float, rx_byte: int, tx_byte: int,
+               rx_speed: float, tx_speed: float) -> None:
+        """Thêm một mẫu của interface (tốc độ byte/s, counter byte)"""
+        key = (device_id, interface)
+        month = month_of(timestamp)
+        with self._lock:
+            months = self.usage.get(key)
+            if months is None:
+                months = self.usage[key] = {}
+            usage = months.get(month)
+            if usage is None:
+                previous = months[max(months)] if months else None
+                if previous is not None:
+                    previous.close_sample()
+                # Counter nối tiếp từ tháng trước để không mất lưu lượng giữa hai tháng
+                usage = months[month] = InterfaceUsage(
+                    month,
+                    previous.last_rx_byte if previous else None,
+                    previous.last_tx_byte if previous else None
+                )
+                for old in sorted(months)[:-self.months]:
+                    del months[old]
+            usage.add(timestamp, rx_byte, tx_byte, rx_speed, tx_speed)
+
+    def remove_device(self, device_id: str) -> None:
+        with self._lock:
+            for key in [key for key in self.usage if key[0] == device_id]:
+                del self.usage[key]
+
+    def percentile_report(self, month: str, percentile: float = 95.0,
+                          device_ids: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        """Báo cáo của mọi interface trong tháng, sắp xếp theo thiết bị và interface"""
+        from models import DataStore
+
+        wanted = set(device_ids) if device_ids is not None else None
+        # record() thay đổi InterfaceUsage trên luồng collector: chụp lại khi giữ khóa
+        # rồi tính phân vị trên bản chụp để không giữ khóa lâu
+        with self._lock:
+            entries = [
+                (key, months[month].copy()) for key, months in self.usage.items()
+                if month in months and (wanted is None or key[0] in wanted)
+            ]
+
+        rows = []
+        for (device_id, interface), usage in sorted(entries, key=lambda entry: entry[0]):
+            device = DataStore.devices.get(device_id)
+            row = {
+                'device_id': device_id,
+                'device_name': device.name if device else device_id,
+                'interface': interface,
+            }
+            row.update(usage.report(percentile))
+            rows.append(row)
+        return rows
+
+    def save(self, path: str) -> None:
+        """Ghi trạng thái ra file JSON (ghi file tạm rồi đổi tên)"""
+        with self._lock:
+            data = {
+                'version': 1,
+                'usage': [
+                    {'device_id': device_id, 'interface': interface, **usage.to_dict()}
+                    for (device_id, interface), months in self.usage.items()
+                    for usage in months.values()
+                ]
+            }
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.reports.', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except Exception:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def load(self, path: str) -> int:
+        """Nạp trạng thái đã lưu, trả về số bản ghi tháng đã nạp"""
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return 0
+
+        loaded = 0
+        with self._lock:
+            for entry in data.get('usage', []):
+                usage = InterfaceUsage.from_dict(entry)
+                self.usage.setdefault((entry['device_id'], entry['interface']), {})[usage.month] = usage
+                loaded += 1
+        return loaded
+
+
+def to_csv(rows: List[Dict[str, Any]]) -> str:
+    """Chuyển báo cáo thành CSV theo thứ tự REPORT_COLUMNS"""
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=REPORT_COLUMNS, extrasaction='ignore')
+    writer.writeheader()
+    writer.writerows(rows)
+    return output.getvalue()
+
+
+report_store = ReportStore(config.get_setting('report_months', 13))
+
+
+def record_interfaces(device_id: str, interfaces: Iterable[Any]) -> None:
+    """Đưa số liệu mới nhất của các interface vào báo cáo (không làm gì khi reports_enabled tắt)"""
+    if not config.get_setting('reports_enabled', False):
+        return
+    report_store.months = config.get_setting('report_months', 13)
+    for interface in interfaces:
+        report_store.record(device_id, interface.name, interface.timestamp.timestamp(), interface.rx_byte,
+                            interface.tx_byte, interface.rx_speed, interface.tx_speed)
+
+
+def save() -> None:
+    """Lưu trạng thái báo cáo ra reports_path"""
+    if not config.get_setting('reports_enabled', False):
+        return
+    path = config.get_setting('reports_path', 'data/reports.json')
+    try:
+        report_store.save(path)
+    except Exception as e:
+        logger.error(f"Error saving report state to {path}: {e}")
+
+
+def load() -> int:
+    """Nạp trạng thái báo cáo từ reports_path khi khởi động"""
+    if not config.get_setting('reports_enabled', False):
+        return 0
+    path = config.get_setting('reports_path', 'data/reports.json')
+    try:
+        return report_store.load(path)
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"Error loading report state from {path}: {e}")
+        return 0
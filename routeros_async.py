@@ -0,0 +1,409 @@
+"""
+Client RouterOS API bất đồng bộ (asyncio) với các lệnh được gắn .tag
+
+Mọi lệnh của một thiết bị được gửi liên tiếp trên cùng một socket mà không chờ
+phản hồi, sau đó các câu trả lời được phân loại theo .tag. Một event loop có thể
+thu thập dữ liệu của hàng nghìn router cùng lúc.
+
+PrefetchedApi cung cấp giao diện giống routeros_api (get_resource().get()/call())
+trên dữ liệu đã lấy trước, để các collector hiện có trong MikrotikAPI chạy không cần sửa.
+Lệnh call() chưa được lấy trước hoặc được lấy trước với tham số khác được gửi trực tiếp.
+"""
+
+import asyncio
+import binascii
+import hashlib
+import logging
+import ssl
+import threading
+from typing import Any, Awaitable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Một lệnh: (đường dẫn, lệnh, tham số)
+Command = Tuple[str, str, Optional[Dict[str, str]]]
+
+
+class RouterOsTrapError(Exception):
+    """Router trả về !trap cho một lệnh"""
+
+
+class RouterOsConnectionError(Exception):
+    """Mất kết nối hoặc router trả về !fatal"""
+
+
+def encode_length(length: int) -> bytes:
+    """Mã hóa độ dài word theo giao thức RouterOS API"""
+    if length < 0x80:
+        return bytes([length])
+    if length < 0x4000:
+        return (length | 0x8000).to_bytes(2, 'big')
+    if length < 0x200000:
+        return (length | 0xC00000).to_bytes(3, 'big')
+    if length < 0x10000000:
+        return (length | 0xE0000000).to_bytes(4, 'big')
+    return b'\xf0' + length.to_bytes(4, 'big')
+
+
+def encode_sentence(words: Iterable[str]) -> bytes:
+    """Mã hóa một sentence (danh sách word, kết thúc bằng word rỗng)"""
+    parts = []
+    for word in words:
+        data = word.encode('utf-8')
+        parts.append(encode_length(len(data)))
+        parts.append(data)
+    parts.append(b'\x00')
+    return b''.join(parts)
+
+
+async def read_length(reader: asyncio.StreamReader) -> int:
+    """Đọc độ dài word từ stream"""
+    first = (await reader.readexactly(1))[0]
+    if first & 0x80 == 0x00:
+        return first
+    if first & 0xC0 == 0x80:
+        return ((first & 0x3F) << 8) | (await reader.readexactly(1))[0]
+    if first & 0xE0 == 0xC0:
+        return ((first & 0x1F) << 16) | int.from_bytes(await reader.readexactly(2), 'big')
+    if first & 0xF0 == 0xE0:
+        return ((first & 0x0F) << 24) | int.from_bytes(await reader.readexactly(3), 'big')
+    if first == 0xF0:
+        return int.from_bytes(await reader.readexactly(4), 'big')
+    raise RouterOsConnectionError(f"Invalid length prefix 0x{first:02x}")
+
+
+async def read_sentence(reader: asyncio.StreamReader) -> List[str]:
+    """Đọc một sentence từ stream"""
+    words = []
+    while True:
+        length = await read_length(reader)
+        if length == 0:
+            return words
+        words.append((await reader.readexactly(length)).decode('utf-8', errors='replace'))
+
+
+class SentenceDecoder:
+    """Tách sentence từ luồng byte theo từng khối, tránh một lần await cho mỗi word"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._words: List[str] = []
+
+    def feed(self, data: bytes) -> List[List[str]]:
+        """Nạp thêm dữ liệu và trả về các sentence đã đầy đủ"""
+        buffer = self._buffer
+        buffer += data
+        sentences = []
+        position = 0
+        end = len(buffer)
+        while position < end:
+            first = buffer[position]
+            if first < 0x80:
+                size, length = 1, first
+            elif first < 0xC0:
+                size, length = 2, ((first & 0x3F) << 8)
+            elif first < 0xE0:
+                size, length = 3, ((first & 0x1F) << 16)
+            elif first < 0xF0:
+                size, length = 4, ((first & 0x0F) << 24)
+            elif first == 0xF0:
+                size, length = 5, 0
+            else:
+                raise RouterOsConnectionError(f"Invalid length prefix 0x{first:02x}")
+
+            if position + size > end:
+                break
+            if size > 1:
+                length |= int.from_bytes(buffer[position + 1:position + size], 'big')
+            start = position + size
+            if start + length > end:
+                break
+
+            if length == 0:
+                sentences.append(self._words)
+                self._words = []
+            else:
+                self._words.append(buffer[start:start + length].decode('utf-8', errors='replace'))
+            position = start + length
+
+        del buffer[:position]
+        return sentences
+
+
+def parse_attributes(words: Iterable[str]) -> Tuple[Dict[str, str], Optional[str]]:
+    """Tách các word =key=value thành dict và lấy .tag nếu có"""
+    attributes = {}
+    tag = None
+    for word in words:
+        if word.startswith('='):
+            key, _, value = word[1:].partition('=')
+            attributes[key] = value
+        elif word.startswith('.tag='):
+            tag = word[5:]
+    return attributes, tag
+
+
+class _PendingCommand:
+    """Lệnh đang chờ phản hồi"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.rows: List[Dict[str, str]] = []
+        self.error: Optional[str] = None
+        self.future: asyncio.Future = loop.create_future()
+
+
+class AsyncRouterOsApi:
+    """Kết nối RouterOS API bất đồng bộ, cho phép nhiều lệnh chạy song song trên một socket"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, timeout: float = 10.0):
+        self.reader = reader
+        self.writer = writer
+        self.timeout = timeout
+        self.closed = False
+        self._tag = 0
+        self._pending: Dict[str, _PendingCommand] = {}
+        self._reader_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    async def connect(cls, host: str, port: int = 8728, username: str = 'admin', password: str = '',
+                      use_ssl: bool = False, ssl_verify: bool = True, timeout: float = 10.0) -> 'AsyncRouterOsApi':
+        """Kết nối và đăng nhập vào thiết bị"""
+        ssl_context = None
+        if use_ssl:
+            ssl_context = ssl.create_default_context()
+            if not ssl_verify:
+                ssl_context.check_hostname = False
+                ssl_context.verify_mode = ssl.CERT_NONE
+
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(host, port, ssl=ssl_context), timeout
+            )
+        except (OSError, asyncio.TimeoutError) as e:
+            raise RouterOsConnectionError(f"Failed to connect to {host}:{port}: {e or 'timed out'}") from e
+
+        api = cls(reader, writer, timeout)
+        api._reader_task = asyncio.ensure_future(api._read_loop())
+        try:
+            await api.login(username, password)
+        except Exception:
+            await api.close()
+            raise
+        return api
+
+    async def login(self, username: str, password: str) -> None:
+        """Đăng nhập (kiểu mới từ RouterOS 6.43, tự chuyển sang challenge MD5 với bản cũ)"""
+        _, done = await self._execute(['/login', f'=name={username}', f'=password={password}'])
+        challenge = done.get('ret')
+        if challenge:
+            digest = hashlib.md5(b'\x00' + password.encode('utf-8') + binascii.unhexlify(challenge)).hexdigest()
+            await self._execute(['/login', f'=name={username}', f'=response=00{digest}'])
+
+    async def call(self, path: str, command: str = 'print', arguments: Optional[Dict[str, str]] = None,
+                   queries: Optional[Dict[str, str]] = None) -> List[Dict[str, str]]:
+        """Gửi một lệnh và trả về các bản ghi !re"""
+        words = [f"{path.rstrip('/')}/{command}"]
+        words.extend(f'={key}={value}' for key, value in (arguments or {}).items())
+        words.extend(f'?{key}={value}' for key, value in (queries or {}).items())
+        rows, _ = await self._execute(words)
+        return rows
+
+    async def call_many(self, commands: Dict[str, Command]) -> Dict[str, Any]:
+        """Gửi toàn bộ lệnh cùng lúc rồi chờ các phản hồi
+
+        Returns:
+            Dict[str, Any]: Kết quả theo khóa của lệnh, hoặc exception nếu lệnh đó lỗi
+        """
+        keys = list(commands)
+        results = await asyncio.gather(
+            *(self.call(path, command, arguments) for path, command, arguments in commands.values()),
+            return_exceptions=True
+        )
+        return dict(zip(keys, results))
+
+    async def _execute(self, words: List[str]) -> Tuple[List[Dict[str, str]], Dict[str, str]]:
+        """Gửi sentence có gắn .tag và chờ !done hoặc !trap"""
+        if self.closed:
+            raise RouterOsConnectionError("Connection is closed")
+
+        self._tag += 1
+        tag = str(self._tag)
+        pending = _PendingCommand(asyncio.get_running_loop())
+        self._pending[tag] = pending
+
+        self.writer.write(encode_sentence(words + [f'.tag={tag}']))
+        try:
+            await self.writer.drain()
+            return await asyncio.wait_for(pending.future, self.timeout)
+        except asyncio.TimeoutError:
+            raise RouterOsConnectionError(f"Command {words[0]} timed out after {self.timeout} seconds")
+        except OSError as e:
+            raise RouterOsConnectionError(str(e)) from e
+        finally:
+            self._pending.pop(tag, None)
+
+    async def _read_loop(self) -> None:
+        """Đọc phản hồi liên tục và chuyển tới lệnh tương ứng theo .tag"""
+        error: Exception = RouterOsConnectionError("Connection closed by router")
+        decoder = SentenceDecoder()
+        try:
+            while True:
+                data = await self.reader.read(65536)
+                if not data:
+                    break
+                for words in decoder.feed(data):
+                    if words:
+                        self._dispatch(words)
+        except RouterOsConnectionError as e:
+            error = e
+        except OSError as e:
+            error = RouterOsConnectionError(f"Connection lost: {e}")
+        except asyncio.CancelledError:
+            error = RouterOsConnectionError("Connection is closed")
+        except Exception as e:
+            error = RouterOsConnectionError(f"Protocol error: {e}")
+
+        self.closed = True
+        for pending in self._pending.values():
+            if not pending.future.done():
+                pending.future.set_exception(error)
+
+    def _dispatch(self, words: List[str]) -> None:
+        """Chuyển một sentence phản hồi tới lệnh có .tag tương ứng"""
+        reply_type = words[0]
+        attributes, tag = parse_attributes(words[1:])
+
+        if reply_type == '!fatal':
+            raise RouterOsConnectionError(f"Fatal error: {' '.join(words[1:])}")
+
+        pending = self._pending.get(tag)
+        if pending is None or pending.future.done():
+            return
+
+        if reply_type == '!re':
+            pending.rows.append(attributes)
+        elif reply_type == '!trap':
+            pending.error = attributes.get('message', 'unknown error')
+        elif reply_type in ('!done', '!empty'):
+            if pending.error is not None:
+                pending.future.set_exception(RouterOsTrapError(pending.error))
+            else:
+                pending.future.set_result((pending.rows, attributes))
+
+    async def close(self) -> None:
+        """Đóng kết nối"""
+        self.closed = True
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        try:
+            self.writer.close()
+            await self.writer.wait_closed()
+        except Exception:
+            pass
+
+
+class _EventLoopThread:
+    """Event loop chạy trên một luồng nền, dùng chung cho toàn bộ kết nối bất đồng bộ"""
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=self._loop.run_forever, name='routeros-async', daemon=True)
+                thread.start()
+            return self._loop
+
+
+_event_loop_thread = _EventLoopThread()
+
+
+def run_coroutine(coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+    """Chạy coroutine trên event loop nền và chờ kết quả từ luồng gọi"""
+    future = asyncio.run_coroutine_threadsafe(coro, _event_loop_thread.loop())
+    return future.result(timeout)
+
+
+def command_key(path: str, command: str = 'print') -> str:
+    """Khóa của một lệnh trong kết quả lấy trước, ví dụ '/ip/arp/print'"""
+    return f"{path.rstrip('/')}/{command.strip('/')}"
+
+
+class _PrefetchedResource:
+    """Resource đọc từ kết quả đã lấy trước"""
+
+    def __init__(self, api: 'PrefetchedApi', path: str):
+        self.api = api
+        self.path = path
+
+    def get(self, **kwargs) -> List[Dict[str, str]]:
+        rows = self.api.result(command_key(self.path))
+        limit = kwargs.pop('limit', None)
+        if kwargs:
+            rows = [row for row in rows if all(row.get(key) == str(value) for key, value in kwargs.items())]
+        if limit is not None:
+            rows = rows[-int(limit):]
+        return rows
+
+    def call(self, command: str, arguments: Optional[Dict[str, Any]] = None,
+             queries: Optional[Dict[str, Any]] = None) -> List[Dict[str, str]]:
+        return self.api.call(self.path, command, arguments, queries)
+
+
+class PrefetchedApi:
+    """Giao diện giống routeros_api trên kết quả của AsyncRouterOsApi.call_many
+
+    Lệnh chưa được lấy trước hoặc lỗi sẽ ném error_class, để collector xử lý như lỗi API thông thường.
+
+    Args:
+        results: Kết quả của call_many theo khóa lệnh
+        error_class: Exception ném ra khi lệnh lỗi
+        commands: Các lệnh đã gửi trong call_many, để call() biết kết quả có đúng tham số hay không
+        client: Kết nối dùng để gửi trực tiếp lệnh call() không có kết quả lấy trước phù hợp
+        timeout: Thời gian chờ (giây) của lệnh gửi trực tiếp
+    """
+
+    def __init__(self, results: Dict[str, Any], error_class: type = RouterOsTrapError,
+                 commands: Optional[Dict[str, Command]] = None, client: Optional[AsyncRouterOsApi] = None,
+                 timeout: Optional[float] = None):
+        self.results = results
+        self.error_class = error_class
+        self.commands = commands or {}
+        self.client = client
+        self.timeout = timeout
+
+    def result(self, key: str) -> List[Dict[str, str]]:
+        if key not in self.results:
+            raise self.error_class(f"{key} was not prefetched")
+        return self._rows(self.results[key])
+
+    def call(self, path: str, command: str, arguments: Optional[Dict[str, Any]] = None,
+             queries: Optional[Dict[str, Any]] = None) -> List[Dict[str, str]]:
+        """Kết quả lấy trước nếu lệnh đã được gửi với cùng tham số, nếu không thì gửi trực tiếp"""
+        key = command_key(path, command)
+        prefetched = self.commands.get(key)
+        if key in self.results and not queries and (prefetched is None or prefetched[2] == (arguments or None)):
+            return self.result(key)
+        if self.client is None:
+            raise self.error_class(f"{key} was not prefetched with these arguments")
+        try:
+            value = run_coroutine(self.client.call(path, command, arguments, queries), self.timeout)
+        except Exception as e:
+            value = e
+        return self._rows(value)
+
+    def _rows(self, value: Any) -> List[Dict[str, str]]:
+        if isinstance(value, Exception):
+            raise self.error_class(str(value))
+        # routeros_api trả về khóa 'id' thay cho '.id'
+        return [{('id' if k == '.id' else k): v for k, v in row.items()} if '.id' in row else row
+                for row in value]
+
+    def get_resource(self, path: str) -> _PrefetchedResource:
+        return _PrefetchedResource(self, path)
+
+    def get_binary_resource(self, path: str) -> _PrefetchedResource:
+        return _PrefetchedResource(self, path)
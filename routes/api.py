@@ -1,11 +1,22 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request
 from models import DataStore
 from mikrotik import mikrotik_api
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
+import heapq
 import json
 import logging
+import math
+import time
 from datetime import datetime
 import realtime_discovery
+from history import (
+    AGGREGATIONS, DEFAULT_MAX_POINTS, DOWNSAMPLE_METHODS, INTERFACE_ROLLUP_FIELDS, MAX_QUERY_POINTS, ROLLUP_STEPS,
+    SYSTEM_ROLLUP_FIELDS, HistoryBuffer, RollupSet, aggregate_window, downsample_window, query_history
+)
+import notifications
+import persistence
+import reports
+import tsdb
 
 logger = logging.getLogger(__name__)
 api = Blueprint('api', __name__)
@@ -54,15 +65,104 @@ def get_system(device_id):
         }
     })
 
+def _history_range() -> Tuple[Optional[float], Optional[float]]:
+    """Đọc khoảng thời gian (epoch giây) từ tham số start/end hoặc span (số giây tính tới hiện tại)"""
+    start = request.args.get('start', type=float)
+    end = request.args.get('end', type=float)
+    span = request.args.get('span', type=float)
+    if start is None and span:
+        start = (end if end is not None else time.time()) - span
+    return start, end
+
+def _history_step(start: Optional[float], end: Optional[float]) -> Tuple[Optional[float], str]:
+    """Đọc step (số giây hoặc tên độ phân giải như 5m) và agg; ValueError nếu không hợp lệ"""
+    agg = request.args.get('agg', 'avg')
+    if agg not in AGGREGATIONS:
+        raise ValueError(f"agg must be one of: {', '.join(AGGREGATIONS)}")
+    value = request.args.get('step')
+    if not value:
+        return None, agg
+    step = float(ROLLUP_STEPS[value]) if value in ROLLUP_STEPS else float(value)
+    if step <= 0:
+        raise ValueError('step must be positive')
+    if start is not None:
+        # Giới hạn số khoảng trả về của một truy vấn
+        step = max(step, math.ceil(((end if end is not None else time.time()) - start) / MAX_QUERY_POINTS))
+    return step, agg
+
+def _history_downsample() -> Tuple[Optional[str], int]:
+    """Đọc downsample (lttb, minmax) và max_points; ValueError nếu không hợp lệ"""
+    method = request.args.get('downsample') or None
+    if method is not None and method not in DOWNSAMPLE_METHODS:
+        raise ValueError(f"downsample must be one of: {', '.join(DOWNSAMPLE_METHODS)}")
+    max_points = request.args.get('max_points', DEFAULT_MAX_POINTS, type=int)
+    if not 3 <= max_points <= MAX_QUERY_POINTS:
+        raise ValueError(f'max_points must be between 3 and {MAX_QUERY_POINTS}')
+    return method, max_points
+
+def _memory_covers(raw: Optional[HistoryBuffer], rollups: Optional[RollupSet], start: float) -> bool:
+    """Lịch sử trong bộ nhớ (thô hoặc một mức gộp) có còn dữ liệu từ `start` không"""
+    sources = ([raw] if raw is not None else []) + (rollups.rollups if rollups is not None else [])
+    for source in sources:
+        first = source.first_timestamp()
+        if first is not None and first <= start:
+            return True
+    return False
+
+def _query_history(kind: str, device_id: str, series: str, raw: Optional[HistoryBuffer],
+                   rollups: Optional[RollupSet]) -> Optional[Dict[str, Any]]:
+    """Truy vấn lịch sử, đọc từ kho trên đĩa khi bộ nhớ không phủ hết khoảng thời gian yêu cầu
+
+    Trả về nội dung phản hồi, None nếu không có lịch sử; ValueError nếu tham số không hợp lệ.
+    """
+    start, end = _history_range()
+    step, agg = _history_step(start, end)
+    downsample, max_points = _history_downsample()
+    if step is not None and downsample is not None:
+        raise ValueError('step and downsample cannot be combined')
+    response: Dict[str, Any] = {'step': step, 'agg': agg} if step is not None else {}
+    if downsample is not None:
+        response.update(downsample=downsample, max_points=max_points)
+    
+    store = tsdb.get_store()
+    if store is not None and (raw is None or (start is not None and not _memory_covers(raw, rollups, start))):
+        store.flush()
+        with store.window(kind, device_id, series, start, end) as window:
+            if len(window):
+                if step is not None:
+                    history = aggregate_window(window, window.fields, step, agg)
+                elif downsample is not None:
+                    shape = INTERFACE_ROLLUP_FIELDS if kind == 'interfaces' else SYSTEM_ROLLUP_FIELDS
+                    history = downsample_window(window, shape, max_points, downsample)
+                else:
+                    history = window.to_records(max_points)
+                response.update(resolution='tsdb', history=history)
+                return response
+    if raw is None:
+        return None
+    
+    resolution, history = query_history(raw, rollups, start, end, max_points, step, agg, downsample)
+    response.update(resolution=resolution, history=history)
+    return response
+
 @api.route('/system/history/<device_id>', methods=['GET'])
 def get_system_history(device_id):
-    """Get system resource history for a device"""
-    if device_id not in DataStore.system_history:
+    """Get system resource history for a device
+    
+    Với start/end hoặc span, độ phân giải (raw, 1m, 5m, 1h, 1d) được chọn theo độ dài khoảng thời gian;
+    khoảng thời gian cũ hơn dữ liệu trong bộ nhớ được đọc từ kho trên đĩa (tsdb) nếu bật.
+    step (giây hoặc 1m/5m/1h/1d) và agg (avg, max, min, p95) gộp dữ liệu trên server;
+    downsample (lttb, minmax) giảm còn tối đa max_points điểm giữ nguyên các đỉnh.
+    """
+    try:
+        result = _query_history('system', device_id, tsdb.SYSTEM_SERIES, DataStore.system_history.get(device_id),
+                                DataStore.system_rollups.get(device_id))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if result is None:
         return jsonify({'error': 'System history not available for this device'}), 404
     
-    return jsonify({
-        'history': DataStore.system_history[device_id]
-    })
+    return jsonify(result)
 
 @api.route('/interfaces/<device_id>', methods=['GET'])
 def get_interfaces(device_id):
@@ -89,6 +189,8 @@ def get_interfaces(device_id):
                 'tx_drop': interface.tx_drop,
                 'rx_speed': interface.rx_speed,
                 'tx_speed': interface.tx_speed,
+                'link_speed': interface.link_speed,
+                'utilization': interface.utilization,
                 'last_link_down_time': interface.last_link_down_time,
                 'last_link_up_time': interface.last_link_up_time,
                 'actual_mtu': interface.actual_mtu,
@@ -99,16 +201,66 @@ def get_interfaces(device_id):
         ]
     })
 
+@api.route('/interfaces/top-utilized', methods=['GET'])
+def get_top_utilized_interfaces():
+    """Các liên kết có mức sử dụng cao nhất trên mọi thiết bị (chỉ interface đã biết tốc độ liên kết)
+    
+    Tham số: limit (mặc định 10, tối đa 1000), site_id, device_id (có thể lặp lại để lọc nhiều thiết bị).
+    """
+    limit = request.args.get('limit', 10, type=int)
+    if limit is None or not 1 <= limit <= 1000:
+        return jsonify({'error': 'limit must be between 1 and 1000'}), 400
+    
+    device_ids = request.args.getlist('device_id') or list(DataStore.interfaces)
+    site_id = request.args.get('site_id')
+    if site_id:
+        device_ids = [device_id for device_id in device_ids
+                      if device_id in DataStore.devices and DataStore.devices[device_id].site_id == site_id]
+    
+    candidates = (
+        interface
+        for device_id in device_ids
+        for interface in DataStore.interfaces.get(device_id, ())
+        if interface.link_speed
+    )
+    top = heapq.nlargest(limit, candidates, key=lambda interface: interface.utilization)
+    
+    return jsonify({
+        'interfaces': [
+            {
+                'device_id': interface.device_id,
+                'device_name': DataStore.devices[interface.device_id].name
+                if interface.device_id in DataStore.devices else interface.device_id,
+                'name': interface.name,
+                'link_speed': interface.link_speed,
+                'rx_bps': interface.rx_speed * 8,
+                'tx_bps': interface.tx_speed * 8,
+                'utilization': interface.utilization,
+                'timestamp': interface.timestamp.isoformat() if interface.timestamp else None
+            }
+            for interface in top
+        ]
+    })
+
 @api.route('/interfaces/history/<device_id>/<interface_name>', methods=['GET'])
 def get_interface_history(device_id, interface_name):
-    """Get interface history for a specific interface"""
-    if (device_id not in DataStore.interface_history or 
-        interface_name not in DataStore.interface_history[device_id]):
+    """Get interface history for a specific interface
+    
+    Với start/end hoặc span, độ phân giải (raw, 1m, 5m, 1h, 1d) được chọn theo độ dài khoảng thời gian;
+    khoảng thời gian cũ hơn dữ liệu trong bộ nhớ được đọc từ kho trên đĩa (tsdb) nếu bật.
+    step (giây hoặc 1m/5m/1h/1d) và agg (avg, max, min, p95) gộp dữ liệu trên server;
+    downsample (lttb, minmax) giảm còn tối đa max_points điểm giữ nguyên các đỉnh.
+    """
+    try:
+        result = _query_history('interfaces', device_id, interface_name,
+                                DataStore.interface_history.get(device_id, {}).get(interface_name),
+                                DataStore.interface_rollups.get(device_id, {}).get(interface_name))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if result is None:
         return jsonify({'error': 'Interface history not available'}), 404
     
-    return jsonify({
-        'history': DataStore.interface_history[device_id][interface_name]
-    })
+    return jsonify(result)
 
 @api.route('/ip/<device_id>', methods=['GET'])
 def get_ip_addresses(device_id):
@@ -277,6 +429,38 @@ def get_capsman_registrations(device_id):
         ]
     })
 
+@api.route('/reports/percentile', methods=['GET'])
+def get_percentile_report():
+    """Báo cáo tính cước theo tháng của mọi interface: phân vị, peak, trung bình (bit/s) và tổng byte
+    
+    Tham số: month (YYYY-MM, mặc định tháng hiện tại theo UTC), percentile (mặc định 95),
+    device_id (có thể lặp lại để lọc nhiều thiết bị), format (json hoặc csv).
+    """
+    month = request.args.get('month') or reports.month_of(time.time())
+    try:
+        datetime.strptime(month, '%Y-%m')
+    except ValueError:
+        return jsonify({'error': 'month must be in YYYY-MM format'}), 400
+    
+    percentile = request.args.get('percentile', 95.0, type=float)
+    if not 0 < percentile <= 100:
+        return jsonify({'error': 'percentile must be in (0, 100]'}), 400
+    
+    device_ids = request.args.getlist('device_id') or None
+    rows = reports.report_store.percentile_report(month, percentile, device_ids)
+    
+    if request.args.get('format') == 'csv':
+        return Response(
+            reports.to_csv(rows),
+            mimetype='text/csv',
+            headers={'Content-Disposition': f'attachment; filename=percentile-{month}.csv'}
+        )
+    return jsonify({
+        'month': month,
+        'percentile': percentile,
+        'interfaces': rows
+    })
+
 @api.route('/alerts', methods=['GET'])
 def get_alerts():
     """Get all alerts"""
@@ -284,15 +468,17 @@ def get_alerts():
     
     if device_id:
         # Filter alerts for specific device
-        alerts = [alert for alert in DataStore.alerts if alert.device_id == device_id]
+        alerts = DataStore.alerts.for_device(device_id)
     else:
-        alerts = DataStore.alerts
+        alerts = list(DataStore.alerts)
     
     return jsonify({
         'alerts': [
             {
+                'id': alert.id,
                 'device_id': alert.device_id,
                 'type': alert.type,
+                'subject': alert.subject,
                 'message': alert.message,
                 'severity': alert.severity,
                 'created': alert.created.isoformat() if alert.created else None,
@@ -309,10 +495,12 @@ def resolve_alert(alert_id):
     """Resolve an alert"""
     try:
         alert_id = int(alert_id)
-        if 0 <= alert_id < len(DataStore.alerts):
-            DataStore.alerts[alert_id].active = False
-            DataStore.alerts[alert_id].resolved = True
-            DataStore.alerts[alert_id].resolved_time = datetime.now()
+        alert = DataStore.alerts.get(alert_id)
+        was_active = alert is not None and alert.active
+        if DataStore.alerts.resolve(alert_id) is not None:
+            persistence.mark_alerts_dirty()
+            if was_active:
+                notifications.notify([('resolved', alert)])
             return jsonify({'success': True})
         else:
             return jsonify({'error': 'Alert not found'}), 404
@@ -328,13 +516,9 @@ def refresh_device(device_id):
     import config
     
     # Kiểm tra xem thiết bị còn tồn tại trong cấu hình không
-    device_exists = False
-    device_enabled = False
-    for device in config.get_devices():
-        if device['id'] == device_id:
-            device_exists = True
-            device_enabled = device.get('enabled', True)
-            break
+    device_config = config.get_device(device_id)
+    device_exists = device_config is not None
+    device_enabled = device_exists and device_config.get('enabled', True)
     
     # Nếu thiết bị không còn trong cấu hình hoặc bị vô hiệu hóa, làm sạch dữ liệu
     if not device_exists:
@@ -270,7 +270,7 @@ def site_devices(site_id):
     
     # Đếm số cảnh báo của thiết bị trong site này
     device_ids = [d.id for d in devices if d and hasattr(d, 'id')]
-    alerts_count = sum(1 for alert in DataStore.alerts if alert.device_id in device_ids and alert.active)
+    alerts_count = sum(1 for device_id in device_ids for alert in DataStore.alerts.for_device(device_id) if alert.active)
     
     return render_template('site_devices.html',
                           page='sites',
@@ -447,24 +447,23 @@ def settings():
         
         elif 'update_config' in request.form:
             # Update general configuration
-            config_data = config.load_config()
-            config_data['refresh_interval'] = int(request.form.get('refresh_interval', 60))
-            
-            # Update thresholds
-            config_data['thresholds'] = {
-                'cpu_load': int(request.form.get('threshold_cpu', 80)),
-                'memory_usage': int(request.form.get('threshold_memory', 80)),
-                'disk_usage': int(request.form.get('threshold_disk', 80)),
-                'interface_usage': int(request.form.get('threshold_interface', 80))
-            }
-            
-            # Update connection settings
-            config_data['use_ssl'] = 'use_ssl' in request.form
-            config_data['connection_timeout'] = int(request.form.get('connection_timeout', 10))
-            config_data['connection_retries'] = int(request.form.get('connection_retries', 2))
-            config_data['retry_delay'] = int(request.form.get('retry_delay', 1))
+            with config.transaction() as config_data:
+                config_data['refresh_interval'] = int(request.form.get('refresh_interval', 60))
+                
+                # Update thresholds
+                config_data['thresholds'] = {
+                    'cpu_load': int(request.form.get('threshold_cpu', 80)),
+                    'memory_usage': int(request.form.get('threshold_memory', 80)),
+                    'disk_usage': int(request.form.get('threshold_disk', 80)),
+                    'interface_usage': int(request.form.get('threshold_interface', 80))
+                }
+                
+                # Update connection settings
+                config_data['use_ssl'] = 'use_ssl' in request.form
+                config_data['connection_timeout'] = int(request.form.get('connection_timeout', 10))
+                config_data['connection_retries'] = int(request.form.get('connection_retries', 2))
+                config_data['retry_delay'] = int(request.form.get('retry_delay', 1))
             
-            config.save_config(config_data)
             flash('Configuration updated successfully', 'success')
             
             # Refresh the scheduler to apply changes
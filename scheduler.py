@@ -1,30 +1,39 @@
 import logging
+import threading
 import time
+import zlib
 from datetime import datetime
+from apscheduler.executors.pool import ThreadPoolExecutor
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
-from typing import Dict, Any
+from typing import Dict, Any, List, Mapping, Optional
 
 from mikrotik import mikrotik_api
 from models import DataStore, Device
+import alerting
 import config
+import notifications
+import persistence
+import reports
+import tsdb
 
 logger = logging.getLogger(__name__)
 
 # Create scheduler
-scheduler = BackgroundScheduler()
+scheduler = BackgroundScheduler(
+    executors={'default': ThreadPoolExecutor(config.get_setting('scheduler_max_workers', 20))},
+    job_defaults={'coalesce': True, 'max_instances': 1}
+)
 
-def collect_device_data(device_id: str) -> None:
-    """Collect data from a device"""
-    # Kiểm tra xem thiết bị còn tồn tại trong cấu hình không
-    device_exists = False
-    for device_config in config.get_devices():
-        if device_config['id'] == device_id:
-            device_exists = True
-            break
+def collect_device_data(device_id: str, collectors: Optional[List[str]] = None) -> None:
+    """Collect data from a device
     
+    Args:
+        device_id: ID của thiết bị
+        collectors: Các collector cần chạy (mặc định chạy tất cả)
+    """
     # Nếu thiết bị không còn trong cấu hình, làm sạch dữ liệu và bỏ qua
-    if not device_exists:
+    if config.get_device(device_id) is None:
         logger.warning(f"Device {device_id} not found in config, cleaning up data")
         config.remove_device(device_id)
         return
@@ -32,10 +41,11 @@ def collect_device_data(device_id: str) -> None:
     device = DataStore.devices.get(device_id)
     if not device or not device.enabled:
         logger.debug(f"Skipping disabled or missing device: {device_id}")
+        alerting.engine.expire_device(device_id)
         return
     
     logger.debug(f"Collecting data from device: {device.name} ({device.host})")
-    result = mikrotik_api.collect_all_data(device_id)
+    result = mikrotik_api.collect_all_data(device_id, collectors)
     
     if not result.get("success", False):
         error_message = result.get("error", "Unknown error")
@@ -44,6 +54,12 @@ def collect_device_data(device_id: str) -> None:
         # Update device status
         device.error_message = error_message
         DataStore.devices[device_id] = device
+        
+        # Chỉ số cũ của các collector lỗi không được dùng để đánh giá cảnh báo
+        results = result.get("results")
+        alerting.engine.expire_device(
+            device_id, [name for name, ok in results.items() if not ok] if results else None
+        )
     else:
         logger.debug(f"Successfully collected data from {device.name}")
         
@@ -51,63 +67,202 @@ def collect_device_data(device_id: str) -> None:
         device.last_connected = datetime.now()
         device.error_message = None
         DataStore.devices[device_id] = device
+    
+    persistence.mark_dirty(device_id)
 
-def schedule_device_collection() -> None:
-    """Schedule data collection for configured devices"""
-    # Clear existing jobs
-    scheduler.remove_all_jobs()
+# Tiền tố id của các job thu thập dữ liệu thiết bị
+JOB_PREFIX = "collect_data_"
+
+# Các trường cấu hình mà khi thay đổi cần kết nối lại thiết bị
+CONNECTION_FIELDS = ('host', 'port', 'username', 'password', 'use_ssl')
+
+# Tham số lập lịch của các job thu thập đang chạy, theo job id
+_job_specs: Dict[str, Dict[str, Any]] = {}
+_reconcile_lock = threading.Lock()
+
+def _device_fields(device_data: Mapping[str, Any]) -> Dict[str, Any]:
+    """Các thuộc tính Device lấy từ cấu hình thiết bị"""
+    return {
+        'name': device_data.get('name', ''),
+        'host': device_data.get('host', ''),
+        'site_id': device_data.get('site_id', 'default'),
+        'port': device_data.get('port', 8728),
+        'username': device_data.get('username', 'admin'),
+        'password': device_data.get('password', ''),
+        'enabled': device_data.get('enabled', True),
+        'use_ssl': device_data.get('use_ssl', False),
+        'comment': device_data.get('comment', ''),
+        'location': device_data.get('location', ''),
+        'mac_address': device_data.get('mac_address', ''),
+        'vendor': device_data.get('vendor', ''),
+        'device_type': device_data.get('device_type', ''),
+        'auto_detected': device_data.get('auto_detected', False)
+    }
+
+def _sync_device(device_data: Mapping[str, Any]) -> Device:
+    """Tạo mới hoặc cập nhật Device trong DataStore, giữ nguyên trạng thái đang chạy
+    
+    Trạng thái như last_connected, error_message được giữ lại. Nếu thông tin kết nối
+    thay đổi, kết nối cũ được đóng để lần thu thập sau kết nối lại.
+    """
+    device_id = device_data['id']
+    fields = _device_fields(device_data)
+    device = DataStore.devices.get(device_id)
+    
+    if device is None:
+        device = Device(id=device_id, first_seen=device_data.get('first_seen'), **fields)
+        DataStore.devices[device_id] = device
+        return device
     
-    # Get refresh interval from config
+    reconnect = any(getattr(device, name) != fields[name] for name in CONNECTION_FIELDS)
+    for name, value in fields.items():
+        setattr(device, name, value)
+    
+    if reconnect and device_id in mikrotik_api.connections:
+        logger.info(f"Connection settings changed for {device.name}, reconnecting on next collection")
+        mikrotik_api.disconnect(device_id)
+    return device
+
+def _device_offset(device_id: str, interval: float) -> float:
+    """Độ lệch cố định (giây) của thiết bị trong chu kỳ, suy ra từ hash của id
+    
+    Hash phân bố đều nên thời điểm bắt đầu của các thiết bị trải đều trên chu kỳ,
+    và độ lệch của một thiết bị không đổi khi thêm hoặc bớt thiết bị khác.
+    """
+    return zlib.crc32(device_id.encode('utf-8')) / 2 ** 32 * interval
+
+def _make_trigger(spec: Dict[str, Any]) -> IntervalTrigger:
+    """Tạo trigger cho job thu thập theo chế độ lập lịch"""
+    if spec['mode'] != 'staggered':
+        return IntervalTrigger(seconds=spec['interval'], jitter=spec['jitter'] or None)
+    
+    # Căn mốc đầu tiên vào vị trí của thiết bị trong chu kỳ, tính từ epoch
+    now = time.time()
+    start = now - now % spec['interval'] + spec['offset']
+    if start <= now:
+        start += spec['interval']
+    return IntervalTrigger(
+        seconds=spec['interval'],
+        start_date=datetime.fromtimestamp(start),
+        jitter=spec['jitter'] or None
+    )
+
+def _collector_groups() -> Dict[int, List[str]]:
+    """Nhóm các collector theo chu kỳ thu thập (giây) cấu hình trong collector_intervals
+    
+    Collector không có trong collector_intervals dùng refresh_interval.
+    """
     refresh_interval = config.get_refresh_interval()
-    logger.info(f"Using refresh interval of {refresh_interval} seconds from configuration")
+    intervals = config.get_setting('collector_intervals', {})
+    groups: Dict[int, List[str]] = {}
+    for name, _ in mikrotik_api.COLLECTORS:
+        try:
+            interval = int(intervals.get(name, refresh_interval))
+        except (TypeError, ValueError):
+            interval = refresh_interval
+        if interval <= 0:
+            interval = refresh_interval
+        groups.setdefault(interval, []).append(name)
+    return groups
+
+def _desired_jobs() -> Dict[str, Dict[str, Any]]:
+    """Tập job thu thập mong muốn theo cấu hình hiện tại
     
-    # Schedule data collection for each device
-    devices = config.get_devices()
-    for device_data in devices:
-        device_id = device_data['id']
+    Mỗi thiết bị có một job cho mỗi chu kỳ thu thập khác nhau.
+    """
+    groups = _collector_groups()
+    mode = config.get_setting('schedule_mode', 'staggered')
+    jitter = config.get_setting('schedule_jitter', 0)
+    jobs = {}
+    for device_data in config.get_devices():
+        device = _sync_device(device_data)
+        if not device.enabled:
+            continue
+        for interval, collectors in groups.items():
+            jobs[f"{JOB_PREFIX}{device.id}:{interval}"] = {
+                'device_id': device.id,
+                'interval': interval,
+                # None nghĩa là chạy tất cả collector
+                'collectors': None if len(groups) == 1 else collectors,
+                'mode': mode,
+                'jitter': jitter,
+                'offset': round(_device_offset(device.id, interval), 3)
+            }
+    return jobs
+
+def schedule_device_collection() -> None:
+    """Đồng bộ lịch thu thập với cấu hình: chỉ thêm, xóa hoặc đổi lịch các job đã thay đổi"""
+    with _reconcile_lock:
+        # Lần đồng bộ đầu tiên (khi khởi động) không thu thập ngay để tránh mọi thiết bị cùng chạy
+        initial = not _job_specs
+        desired = _desired_jobs()
+        current = {job.id for job in scheduler.get_jobs() if job.id.startswith(JOB_PREFIX)}
         
-        # Create or update device in data store
-        device = Device(
-            id=device_id,
-            name=device_data['name'],
-            host=device_data['host'],
-            port=device_data.get('port', 8728),
-            username=device_data.get('username', 'admin'),
-            password=device_data.get('password', ''),
-            enabled=device_data.get('enabled', True),
-            use_ssl=device_data.get('use_ssl', False)
-        )
-        DataStore.devices[device_id] = device
+        # Xóa job của thiết bị đã bị xóa, bị vô hiệu hóa hoặc chu kỳ không còn dùng
+        active_devices = {spec['device_id'] for spec in desired.values()}
+        for job_id in current - desired.keys():
+            scheduler.remove_job(job_id)
+            spec = _job_specs.pop(job_id, None)
+            if spec and spec['device_id'] not in active_devices:
+                mikrotik_api.disconnect(spec['device_id'])
+                alerting.engine.expire_device(spec['device_id'])
+            logger.info(f"Removed collection job {job_id}")
         
-        # Schedule data collection
-        if device.enabled:
-            job_id = f"collect_data_{device_id}"
-            trigger = IntervalTrigger(seconds=refresh_interval)
-            scheduler.add_job(
-                collect_device_data, 
-                trigger=trigger, 
-                id=job_id,
-                args=[device_id],
-                replace_existing=True
-            )
-            logger.info(f"Scheduled data collection for {device.name} every {refresh_interval} seconds")
+        for job_id, spec in desired.items():
+            trigger = _make_trigger(spec)
+            
+            if job_id not in current:
+                # Thiết bị mới: thu thập ngay rồi lặp lại theo chu kỳ.
+                # Ở chế độ staggered khi khởi động, lần chạy đầu là vị trí của thiết bị trong chu kỳ.
+                job_options = {}
+                if not (initial and spec['mode'] == 'staggered'):
+                    job_options['next_run_time'] = datetime.now()
+                scheduler.add_job(
+                    collect_device_data,
+                    trigger=trigger,
+                    id=job_id,
+                    args=[spec['device_id'], spec['collectors']],
+                    replace_existing=True,
+                    **job_options
+                )
+                logger.info(f"Scheduled data collection for {spec['device_id']} every {spec['interval']} seconds")
+            elif _job_specs.get(job_id) != spec:
+                scheduler.modify_job(job_id, args=[spec['device_id'], spec['collectors']])
+                scheduler.reschedule_job(job_id, trigger=trigger)
+                logger.info(f"Rescheduled data collection for {spec['device_id']} every {spec['interval']} seconds")
             
-            # Collect data immediately
-            scheduler.add_job(
-                collect_device_data,
-                args=[device_id],
-                id=f"initial_collect_{device_id}",
-                next_run_time=datetime.now()
-            )
+            _job_specs[job_id] = spec
+        
+        logger.debug(f"Collection schedule reconciled: {len(desired)} jobs")
 
 def cleanup_alerts() -> None:
     """Clean up old resolved alerts"""
-    current_time = datetime.now()
     # Keep alerts that are either active or resolved within the last 24 hours
-    DataStore.alerts = [
-        alert for alert in DataStore.alerts
-        if alert.active or (alert.resolved_time and (current_time - alert.resolved_time).total_seconds() < 86400)
-    ]
+    removed = DataStore.alerts.cleanup(86400)
+    if removed:
+        persistence.mark_alerts_dirty()
+
+def flush_tsdb() -> None:
+    """Ghi các mẫu lịch sử đang chờ xuống kho trên đĩa"""
+    store = tsdb.get_store()
+    if store is not None:
+        written = store.flush()
+        logger.debug(f"Time series store flushed {written} records")
+
+def maintain_tsdb() -> None:
+    """Gộp segment cũ và xóa dữ liệu hết hạn của kho trên đĩa"""
+    store = tsdb.get_store()
+    if store is not None:
+        stats = store.maintain()
+        logger.info(f"Time series store maintenance: {stats['compacted']} segments compacted, "
+                    f"{stats['removed']} segments removed")
+
+def flush_snapshot() -> None:
+    """Ghi ảnh chụp của các thiết bị đã thay đổi xuống SQLite"""
+    store = persistence.get_store()
+    if store is not None:
+        written = store.flush()
+        logger.debug(f"Snapshot flushed {written} devices")
 
 def start_scheduler() -> None:
     """Start the background scheduler"""
@@ -118,6 +273,14 @@ def start_scheduler() -> None:
     # Schedule device data collection
     schedule_device_collection()
     
+    # Đánh giá luật cảnh báo cho toàn bộ thiết bị trong một lượt
+    scheduler.add_job(
+        alerting.evaluate,
+        IntervalTrigger(seconds=config.get_setting('alert_evaluation_interval', 10)),
+        id="alert_evaluation",
+        replace_existing=True
+    )
+    
     # Schedule alert cleanup every hour
     scheduler.add_job(
         cleanup_alerts,
@@ -134,6 +297,33 @@ def start_scheduler() -> None:
         replace_existing=True
     )
     
+    # Ghi lịch sử xuống đĩa định kỳ và bảo trì kho mỗi ngày
+    scheduler.add_job(
+        flush_tsdb,
+        IntervalTrigger(seconds=config.get_setting('tsdb_flush_interval', 60)),
+        id="tsdb_flush",
+        replace_existing=True
+    )
+    scheduler.add_job(
+        maintain_tsdb,
+        IntervalTrigger(days=1),
+        id="tsdb_maintain",
+        replace_existing=True
+    )
+    
+    scheduler.add_job(
+        reports.save,
+        IntervalTrigger(seconds=config.get_setting('reports_save_interval', 300)),
+        id="reports_save",
+        replace_existing=True
+    )
+    scheduler.add_job(
+        flush_snapshot,
+        IntervalTrigger(seconds=config.get_setting('snapshot_interval', 30)),
+        id="snapshot_flush",
+        replace_existing=True
+    )
+    
     # Start the scheduler
     scheduler.start()
     logger.info("Started background scheduler")
@@ -142,4 +332,8 @@ def stop_scheduler() -> None:
     """Stop the background scheduler"""
     if scheduler.running:
         scheduler.shutdown()
+        tsdb.flush()
+        flush_snapshot()
+        reports.save()
+        notifications.stop()
         logger.info("Stopped background scheduler")
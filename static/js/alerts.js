@@ -98,7 +98,7 @@ function loadAlerts(deviceId) {
             const alertsList = document.createElement('div');
             alertsList.className = 'alerts-list';
             
-            alerts.forEach((alert, index) => {
+            alerts.forEach(alert => {
                 const severityClass = getSeverityClass(alert.severity);
                 const statusClass = alert.active ? 'active' : 'resolved';
                 
@@ -126,7 +126,7 @@ function loadAlerts(deviceId) {
                         <div class="alert-actions">
                             ${alert.active ? 
                                 `<button class="btn btn-sm btn-outline-${severityClass} resolve-alert-btn" 
-                                    data-alert-id="${index}">
+                                    data-alert-id="${alert.id}">
                                     <i class="bi bi-check-lg"></i> Resolve
                                 </button>` : 
                                 `<span class="badge bg-secondary">
@@ -156,9 +156,9 @@ function loadAlerts(deviceId) {
             if (resolveAllBtn) {
                 resolveAllBtn.addEventListener('click', function() {
                     const activeAlertIds = [];
-                    alerts.forEach((alert, index) => {
+                    alerts.forEach(alert => {
                         if (alert.active) {
-                            activeAlertIds.push(index);
+                            activeAlertIds.push(alert.id);
                         }
                     });
                     
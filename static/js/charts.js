@@ -2,6 +2,18 @@
  * Charts utility functions for Mikrotik monitoring dashboard
  */
 
+// Default time range of history charts (seconds) and number of points when the chart width is unknown
+const HISTORY_SPAN = 86400;
+const HISTORY_POINTS = 288;
+
+// Build query string for history endpoints: the server downsamples (LTTB, keeps spikes)
+// to one point per horizontal pixel of `element`
+function historyQuery(element, span = HISTORY_SPAN, method = 'lttb') {
+    const width = element ? Math.round(element.clientWidth) : 0;
+    const points = Math.min(10000, Math.max(3, width || HISTORY_POINTS));
+    return `span=${span}&downsample=${method}&max_points=${points}`;
+}
+
 // Create a gauge chart
 function createGaugeChart(elementId, value, maxValue, label, options = {}) {
     const ctx = document.getElementById(elementId);
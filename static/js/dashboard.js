@@ -30,6 +30,9 @@ function initDashboard() {
                 deviceSelect.value = deviceId;
             }
             
+            // Receive real-time speeds for this device only
+            watchDevice(deviceId);
+            
             // Load the dashboard data
             loadDashboardData(deviceId);
             
@@ -476,7 +479,7 @@ function loadSystemResources(deviceId) {
 // Load system history data - returns a Promise
 function loadSystemHistory(deviceId) {
     return new Promise((resolve, reject) => {
-        fetch(`/api/system/history/${deviceId}`)
+        fetch(`/api/system/history/${deviceId}?${historyQuery(document.getElementById('systemResourcesCard'))}`)
             .then(response => {
                 if (!response.ok) {
                     // It's ok if history is not available yet
@@ -835,7 +838,7 @@ function loadInterfaceTrafficChart(deviceId, interfaceName) {
             return;
         }
         
-        fetch(`/api/interfaces/history/${deviceId}/${interfaceName}`)
+        fetch(`/api/interfaces/history/${deviceId}/${encodeURIComponent(interfaceName)}?${historyQuery(ctx)}`)
             .then(response => {
                 if (!response.ok) {
                     // It's ok if history is not available yet
@@ -1024,7 +1027,7 @@ function loadAlertsSummary(deviceId) {
                 const recentAlerts = activeAlerts.slice(0, 5);
                 
                 // Display alerts
-                alertsList.innerHTML = recentAlerts.map((alert, index) => {
+                alertsList.innerHTML = recentAlerts.map(alert => {
                     const severityClass = {
                         'info': 'info',
                         'warning': 'warning',
@@ -1041,7 +1044,7 @@ function loadAlertsSummary(deviceId) {
                                 </div>
                                 <div>
                                     <button class="btn btn-sm btn-outline-${severityClass} resolve-alert-btn" 
-                                            data-alert-id="${index}" 
+                                            data-alert-id="${alert.id}" 
                                             title="Resolve Alert">
                                         <i class="bi bi-check-lg"></i>
                                     </button>
@@ -35,6 +35,9 @@ function initInterfacesPage() {
 function loadInterfacesData(deviceId) {
     if (!deviceId) return;
     
+    // Receive real-time speeds for this device only
+    watchDevice(deviceId);
+    
     loadInterfacesList(deviceId);
     loadInterfacesCharts(deviceId);
 }
@@ -251,6 +254,14 @@ function showInterfaceDetails(interfaceData) {
                                             <th>Current TX Speed</th>
                                             <td>${formatSpeed(interfaceData.tx_speed)}</td>
                                         </tr>
+                                        <tr>
+                                            <th>Link Speed</th>
+                                            <td>${interfaceData.link_speed ? formatSpeed(interfaceData.link_speed / 8, 1) : '-'}</td>
+                                        </tr>
+                                        <tr>
+                                            <th>Utilization</th>
+                                            <td>${interfaceData.link_speed ? interfaceData.utilization.toFixed(1) + '%' : '-'}</td>
+                                        </tr>
                                         <tr>
                                             <th>RX Bytes</th>
                                             <td>${formatBytes(interfaceData.rx_byte)}</td>
@@ -315,7 +326,8 @@ function showInterfaceDetails(interfaceData) {
 
 // Load interface traffic history for detail modal
 function loadInterfaceDetailChart(deviceId, interfaceName) {
-    fetch(`/api/interfaces/history/${deviceId}/${interfaceName}`)
+    const canvas = document.getElementById('interfaceDetailChart');
+    fetch(`/api/interfaces/history/${deviceId}/${encodeURIComponent(interfaceName)}?${historyQuery(canvas)}`)
         .then(response => {
             if (!response.ok) {
                 return { history: [] };
@@ -547,7 +559,7 @@ function loadInterfaceTrafficChart(deviceId, interfaceName) {
     const ctx = document.getElementById(chartId);
     if (!ctx) return;
     
-    fetch(`/api/interfaces/history/${deviceId}/${interfaceName}`)
+    fetch(`/api/interfaces/history/${deviceId}/${encodeURIComponent(interfaceName)}?${historyQuery(ctx)}`)
         .then(response => {
             if (!response.ok) {
                 // It's ok if history is not available yet
@@ -204,7 +204,7 @@ function loadSystemHistoryData(deviceId) {
     historyCard.innerHTML = '';
     historyCard.appendChild(createSpinner());
     
-    fetch(`/api/system/history/${deviceId}`)
+    fetch(`/api/system/history/${deviceId}?${historyQuery(historyCard)}`)
         .then(response => {
             if (!response.ok) {
                 throw new Error('System history not available');
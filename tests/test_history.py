@@ -0,0 +1,82 @@
+import threading
+import time
+import unittest
+
+from history import INTERFACE_FIELDS, RingBuffer, RollupSet, query_history
+
+
+class ConcurrentHistoryTest(unittest.TestCase):
+    """Luồng API đọc lịch sử trong lúc collector đang ghi"""
+
+    def _run(self, append, read, count):
+        errors = []
+        stop = threading.Event()
+
+        def reader():
+            while not stop.is_set():
+                try:
+                    read()
+                except Exception as e:
+                    errors.append(e)
+
+        thread = threading.Thread(target=reader)
+        thread.start()
+        try:
+            for index in range(count):
+                try:
+                    append(index)
+                except Exception as e:
+                    errors.append(e)
+        finally:
+            stop.set()
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_raw_append_while_downsampling(self):
+        buffer = RingBuffer(INTERFACE_FIELDS, 2000)
+        started = time.time()
+        self._run(
+            lambda index: buffer.append(started + index, (index, index, index % 7, index % 5)),
+            lambda: query_history(buffer, None, max_points=50, downsample='lttb'),
+            2000
+        )
+        self.assertEqual(len(buffer), 2000)
+        self.assertEqual(len(buffer.timestamps), 2000)
+        for name in INTERFACE_FIELDS:
+            self.assertEqual(len(buffer.columns[name]), 2000)
+        self.assertEqual(list(buffer.window().iter_column('rx_byte')), [float(i) for i in range(2000)])
+
+    def test_append_while_window_alive(self):
+        buffer = RingBuffer(INTERFACE_FIELDS, 10)
+        buffer.append(1.0, (1, 1, 1, 1))
+        window = buffer.window()
+        buffer.append(2.0, (2, 2, 2, 2))
+        self.assertEqual(list(window.iter_column('timestamp')), [1.0])
+        self.assertEqual(list(buffer.window().iter_column('timestamp')), [1.0, 2.0])
+
+
+class RollupSetTest(unittest.TestCase):
+
+    def test_flush_while_window_alive(self):
+        rollups = RollupSet(('rx_speed', 'tx_speed'), {'1m': 744})
+        rollups.add(0.0, (1.0, 2.0))
+        rollups.add(60.0, (3.0, 4.0))
+        window = rollups.rollups[0].window()
+        rollups.add(120.0, (5.0, 6.0))
+        self.assertEqual(list(window.iter_column('rx_speed')), [1.0, 3.0])
+        self.assertEqual(list(rollups.rollups[0].window().iter_column('rx_speed')), [1.0, 3.0, 5.0])
+
+    def test_configure_adds_and_removes_levels(self):
+        rollups = RollupSet(('rx_speed', 'tx_speed'), {'1m': 10, '1h': 0})
+        rollups.add(0.0, (1.0, 1.0))
+        minute = rollups.rollups[0]
+        rollups.configure({'1m': 20, '1h': 5, '5m': 3})
+        self.assertEqual([rollup.name for rollup in rollups.rollups], ['1m', '5m', '1h'])
+        self.assertIs(rollups.rollups[0], minute)
+        self.assertEqual(minute.buffer.capacity, 20)
+        rollups.configure({'1m': 0, '1h': 5})
+        self.assertEqual([rollup.name for rollup in rollups.rollups], ['1h'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import shutil
+import tempfile
+import unittest
+from array import array
+
+from history import INTERFACE_FIELDS, aggregate_window, downsample_window
+from tsdb import TimeSeriesStore
+
+DAY = 86400.0
+
+
+class _CopiedWindow:
+    """Window với các cột đã sao chép ra array, để so sánh với cách đọc theo segment"""
+
+    def __init__(self, window):
+        self.fields = window.fields
+        self.columns = {name: array('d', window.column(name)) for name in ('timestamp',) + window.fields}
+
+    def column(self, name):
+        return self.columns[name]
+
+
+class SeriesWindowTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.store = TimeSeriesStore(self.path)
+        # Ba segment ngày, mỗi segment 1000 điểm
+        self.start = 19000 * DAY
+        for index in range(3000):
+            timestamp = self.start + index * 3 * DAY / 3000
+            self.store.append('interfaces', 'dev', 'ether1', timestamp,
+                              (index, index * 2, index % 97, (index * 7) % 89))
+        self.store.flush()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_column_spans_segments(self):
+        with self.store.window('interfaces', 'dev', 'ether1', self.start + 100, self.start + 2.5 * DAY) as window:
+            self.assertEqual(len(window.column('timestamp').parts), 3)
+            column = window.column('rx_byte')
+            values = list(column)
+            self.assertEqual(len(column), len(values))
+            self.assertEqual(column[0], values[0])
+            self.assertEqual(column[-1], values[-1])
+            self.assertEqual(list(column[990:2010]), values[990:2010])
+            self.assertEqual(list(column[5:5]), [])
+
+    def test_aggregate_and_downsample_match_copied_columns(self):
+        with self.store.window('interfaces', 'dev', 'ether1') as window:
+            copied = _CopiedWindow(window)
+            for step, agg in ((3600, 'avg'), (DAY * 2, 'max'), (7200, 'p95')):
+                self.assertEqual(aggregate_window(window, INTERFACE_FIELDS, step, agg),
+                                 aggregate_window(copied, INTERFACE_FIELDS, step, agg))
+            for method in ('lttb', 'minmax'):
+                self.assertEqual(downsample_window(window, ('rx_speed', 'tx_speed'), 200, method),
+                                 downsample_window(copied, ('rx_speed', 'tx_speed'), 200, method))
+
+
+if __name__ == '__main__':
+    unittest.main()
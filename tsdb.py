@@ -0,0 +1,487 @@
+"""
+Kho chuỗi thời gian trên đĩa cho lịch sử interface và tài nguyên hệ thống
+
+Mỗi chuỗi (thiết bị + interface, hoặc tài nguyên của thiết bị) có một thư mục chứa các segment
+chỉ ghi nối thêm. Mỗi bản ghi có độ dài cố định gồm 5 float64: timestamp và 4 giá trị theo
+history.INTERFACE_FIELDS / history.SYSTEM_FIELDS.
+
+    <tsdb_path>/<kind>/<device>/<series>/YYYYMMDD.seg   segment theo ngày (UTC)
+    <tsdb_path>/<kind>/<device>/<series>/YYYYMM.seg     segment theo tháng sau khi gộp
+
+Khi đọc, segment được mmap và truy cập qua memoryview nên dữ liệu nhiều tháng không phải nạp
+vào heap Python. Ghi được gom trong bộ nhớ và flush định kỳ; maintain() gộp các segment ngày
+cũ thành segment tháng và xóa segment hết hạn lưu trữ.
+"""
+
+import atexit
+import calendar
+import logging
+import mmap
+import os
+import shutil
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from itertools import chain
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+from urllib.parse import quote
+
+import config
+from history import INTERFACE_FIELDS, SYSTEM_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# Số giá trị mỗi bản ghi (không tính timestamp)
+VALUES_PER_RECORD = 4
+RECORD = struct.Struct(f'<{VALUES_PER_RECORD + 1}d')
+RECORD_SIZE = RECORD.size
+STRIDE = VALUES_PER_RECORD + 1
+
+# Loại chuỗi và các cột tương ứng
+KIND_FIELDS: Dict[str, Tuple[str, ...]] = {
+    'interfaces': INTERFACE_FIELDS,
+    'system': SYSTEM_FIELDS,
+}
+
+# Tên chuỗi của lịch sử tài nguyên hệ thống
+SYSTEM_SERIES = 'resources'
+
+
+def _segment_range(name: str) -> Optional[Tuple[float, float]]:
+    """Khoảng thời gian [đầu, cuối) mà một segment có thể chứa, theo tên file"""
+    stem = name[:-4]
+    if not name.endswith('.seg') or not stem.isdigit():
+        return None
+    if len(stem) == 8:
+        start = calendar.timegm((int(stem[:4]), int(stem[4:6]), int(stem[6:]), 0, 0, 0))
+        return float(start), float(start + 86400)
+    if len(stem) == 6:
+        year, month = int(stem[:4]), int(stem[4:])
+        start = calendar.timegm((year, month, 1, 0, 0, 0))
+        end = calendar.timegm((year + month // 12, month % 12 + 1, 1, 0, 0, 0))
+        return float(start), float(end)
+    return None
+
+
+class _Segment:
+    """Segment được mmap, timestamps và các cột là memoryview có bước nhảy trên cùng vùng nhớ"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.map: Optional[mmap.mmap] = None
+        self.values: Optional[memoryview] = None
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            # Bỏ qua bản ghi ghi dở ở cuối file (ví dụ khi tiến trình bị dừng giữa chừng)
+            usable = size - size % RECORD_SIZE
+            if usable:
+                self.map = mmap.mmap(f.fileno(), usable, access=mmap.ACCESS_READ)
+                self.values = memoryview(self.map).cast('d')
+        self.count = usable // RECORD_SIZE
+
+    def timestamps(self) -> memoryview:
+        return self.values[0::STRIDE] if self.values is not None else memoryview(b'').cast('d')
+
+    def column(self, index: int) -> memoryview:
+        return self.values[index + 1::STRIDE]
+
+    def close(self) -> None:
+        if self.values is not None:
+            self.values.release()
+            self.values = None
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+
+class SegmentedColumn(Sequence):
+    """Một cột của SeriesWindow nối từ các memoryview có bước nhảy trên từng segment
+
+    Truy cập theo chỉ số và tìm kiếm nhị phân không sao chép dữ liệu; cắt một khoảng chỉ sao chép
+    khoảng đó ra array, nên gộp hay giảm điểm theo từng khoảng không nạp cả cột vào heap Python.
+    """
+
+    def __init__(self, parts: List[memoryview]):
+        self.parts = parts
+        # Chỉ số đầu của từng phần trong cột
+        self.offsets: List[int] = []
+        count = 0
+        for part in parts:
+            self.offsets.append(count)
+            count += len(part)
+        self.count = count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator[float]:
+        return chain.from_iterable(self.parts)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[float, array]:
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.count)
+            if step != 1:
+                raise ValueError('SegmentedColumn slices do not support a step')
+            result = array('d')
+            if start >= stop:
+                return result
+            part = bisect_right(self.offsets, start) - 1
+            while start < stop:
+                offset = self.offsets[part]
+                end = min(stop, offset + len(self.parts[part]))
+                result.extend(self.parts[part][start - offset:end - offset])
+                start = end
+                part += 1
+            return result
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError('SegmentedColumn index out of range')
+        part = bisect_right(self.offsets, index) - 1
+        return self.parts[part][index - self.offsets[part]]
+
+    def release(self) -> None:
+        for part in self.parts:
+            part.release()
+        self.parts = []
+        self.offsets = []
+        self.count = 0
+
+
+class SeriesWindow:
+    """Dữ liệu của một chuỗi trong [start, end], đọc trực tiếp từ các segment đã mmap
+
+    Gọi close() (hoặc dùng with) sau khi đọc xong để giải phóng mmap.
+    """
+
+    def __init__(self, fields: Tuple[str, ...], segments: List[_Segment], start: Optional[float],
+                 end: Optional[float]):
+        self.fields = fields
+        self.segments = segments
+        # (segment, chỉ số đầu, chỉ số cuối) của các bản ghi nằm trong khoảng
+        self.ranges: List[Tuple[_Segment, int, int]] = []
+        for segment in segments:
+            timestamps = segment.timestamps()
+            first = 0 if start is None else bisect_left(timestamps, start)
+            last = segment.count if end is None else bisect_right(timestamps, end)
+            if first < last:
+                self.ranges.append((segment, first, last))
+        # Các cột đã trả về, được giải phóng trước khi đóng mmap
+        self._columns: List[SegmentedColumn] = []
+
+    def __len__(self) -> int:
+        return sum(last - first for _, first, last in self.ranges)
+
+    def __enter__(self) -> 'SeriesWindow':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        for column in self._columns:
+            column.release()
+        self._columns = []
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
+        self.ranges = []
+
+    def column(self, name: str) -> 'SegmentedColumn':
+        """Một cột ('timestamp' cho thời gian) của toàn bộ khoảng, đọc trực tiếp từ các segment
+
+        Cột chỉ dùng được tới khi window được đóng.
+        """
+        index = 0 if name == 'timestamp' else self.fields.index(name) + 1
+        column = SegmentedColumn([segment.values[index::STRIDE][first:last] for segment, first, last in self.ranges])
+        self._columns.append(column)
+        return column
+
+    def iter_rows(self):
+        """Duyệt (timestamp, giá trị...) theo thứ tự thời gian"""
+        for segment, first, last in self.ranges:
+            columns = [segment.timestamps()[first:last]] + [
+                segment.column(i)[first:last] for i in range(len(self.fields))
+            ]
+            yield from zip(*columns)
+
+    def to_records(self, max_points: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Bản ghi với timestamp ISO; khi vượt quá max_points, gộp theo khoảng thời gian đều nhau với min/max/avg"""
+        count = len(self)
+        if not count:
+            return []
+
+        names = ('timestamp',) + self.fields
+        if not max_points or count <= max_points:
+            records = []
+            for row in self.iter_rows():
+                record = dict(zip(names, row))
+                record['timestamp'] = datetime.fromtimestamp(row[0]).isoformat()
+                records.append(record)
+            return records
+
+        first_segment, first, _ = self.ranges[0]
+        last_segment, _, last = self.ranges[-1]
+        begin = first_segment.timestamps()[first]
+        span = last_segment.timestamps()[last - 1] - begin
+        step = max(span / max_points, 1e-9)
+
+        records = []
+        bucket = None
+        width = len(self.fields)
+        for row in self.iter_rows():
+            index = min(int((row[0] - begin) / step), max_points - 1)
+            if bucket is None or index != bucket[0]:
+                if bucket is not None:
+                    records.append(self._bucket_record(begin, step, bucket))
+                bucket = [index, 0, [0.0] * width, list(row[1:]), list(row[1:])]
+            bucket[1] += 1
+            sums, minimums, maximums = bucket[2], bucket[3], bucket[4]
+            for i in range(width):
+                value = row[i + 1]
+                sums[i] += value
+                if value < minimums[i]:
+                    minimums[i] = value
+                if value > maximums[i]:
+                    maximums[i] = value
+        records.append(self._bucket_record(begin, step, bucket))
+        return records
+
+    def _bucket_record(self, begin: float, step: float, bucket: List[Any]) -> Dict[str, Any]:
+        index, count, sums, minimums, maximums = bucket
+        record: Dict[str, Any] = {'timestamp': datetime.fromtimestamp(begin + index * step).isoformat()}
+        for i, name in enumerate(self.fields):
+            record[name] = sums[i] / count
+            record[f'{name}_min'] = minimums[i]
+            record[f'{name}_max'] = maximums[i]
+        return record
+
+
+class TimeSeriesStore:
+    """Kho chuỗi thời gian theo segment ngày/tháng
+
+    Args:
+        path: Thư mục gốc của kho
+        retention_days: Số ngày dữ liệu được giữ lại (xóa theo từng segment)
+        compact_after_days: Segment ngày cũ hơn số ngày này được gộp vào segment tháng
+    """
+
+    def __init__(self, path: str, retention_days: int = 365, compact_after_days: int = 7):
+        self.path = path
+        self.retention_days = retention_days
+        self.compact_after_days = compact_after_days
+        self._pending: Dict[str, List[bytes]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def series_dir(self, kind: str, device_id: str, series: str) -> str:
+        return os.path.join(self.path, kind, quote(device_id, safe=''), quote(series, safe=''))
+
+    def append(self, kind: str, device_id: str, series: str, timestamp: float, values: Sequence[float]) -> None:
+        """Thêm một bản ghi vào bộ đệm ghi, values gồm VALUES_PER_RECORD giá trị"""
+        day = time.strftime('%Y%m%d', time.gmtime(timestamp))
+        path = os.path.join(self.series_dir(kind, device_id, series), f'{day}.seg')
+        record = RECORD.pack(timestamp, *values)
+        with self._lock:
+            self._pending.setdefault(path, []).append(record)
+
+    def flush(self) -> int:
+        """Ghi các bản ghi đang chờ xuống segment, trả về số bản ghi đã ghi"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        written = 0
+        with self._flush_lock:
+            for path, records in pending.items():
+                try:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+                    try:
+                        # Cắt bản ghi ghi dở từ lần trước để giữ độ dài cố định
+                        size = os.fstat(fd).st_size
+                        if size % RECORD_SIZE:
+                            os.ftruncate(fd, size - size % RECORD_SIZE)
+                        os.write(fd, b''.join(records))
+                    finally:
+                        os.close(fd)
+                    written += len(records)
+                except OSError as e:
+                    logger.error(f"Error writing time series segment {path}: {e}")
+        return written
+
+    def _segments(self, kind: str, device_id: str, series: str, start: Optional[float],
+                  end: Optional[float]) -> List[_Segment]:
+        directory = self.series_dir(kind, device_id, series)
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return []
+
+        candidates = []
+        for name in names:
+            segment_range = _segment_range(name)
+            if segment_range is None:
+                continue
+            if (start is not None and segment_range[1] <= start) or (end is not None and segment_range[0] > end):
+                continue
+            candidates.append((segment_range[0], name))
+
+        segments = []
+        for _, name in sorted(candidates):
+            try:
+                segments.append(_Segment(os.path.join(directory, name)))
+            except (OSError, ValueError) as e:
+                logger.error(f"Error opening time series segment {name} in {directory}: {e}")
+        return segments
+
+    def window(self, kind: str, device_id: str, series: str, start: Optional[float] = None,
+               end: Optional[float] = None) -> SeriesWindow:
+        """Mở dữ liệu của một chuỗi trong [start, end] qua mmap"""
+        return SeriesWindow(KIND_FIELDS[kind], self._segments(kind, device_id, series, start, end), start, end)
+
+    def first_timestamp(self, kind: str, device_id: str, series: str) -> Optional[float]:
+        with self.window(kind, device_id, series) as window:
+            for segment, first, _ in window.ranges:
+                return segment.timestamps()[first]
+        return None
+
+    def records(self, kind: str, device_id: str, series: str, start: Optional[float] = None,
+                end: Optional[float] = None, max_points: Optional[int] = None) -> List[Dict[str, Any]]:
+        with self.window(kind, device_id, series, start, end) as window:
+            return window.to_records(max_points)
+
+    def remove_device(self, device_id: str) -> None:
+        """Xóa toàn bộ dữ liệu của thiết bị"""
+        for kind in KIND_FIELDS:
+            shutil.rmtree(os.path.join(self.path, kind, quote(device_id, safe='')), ignore_errors=True)
+
+    def maintain(self, now: Optional[float] = None) -> Dict[str, int]:
+        """Gộp segment ngày cũ vào segment tháng và xóa segment hết hạn lưu trữ"""
+        now = time.time() if now is None else now
+        compact_before = now - self.compact_after_days * 86400
+        retain_after = now - self.retention_days * 86400
+        stats = {'compacted': 0, 'removed': 0}
+
+        self.flush()
+        with self._flush_lock:
+            for kind in KIND_FIELDS:
+                kind_dir = os.path.join(self.path, kind)
+                if not os.path.isdir(kind_dir):
+                    continue
+                for device in os.listdir(kind_dir):
+                    device_dir = os.path.join(kind_dir, device)
+                    for series in os.listdir(device_dir):
+                        self._maintain_series(os.path.join(device_dir, series), compact_before, retain_after, stats)
+        return stats
+
+    def _maintain_series(self, directory: str, compact_before: float, retain_after: float,
+                         stats: Dict[str, int]) -> None:
+        try:
+            names = sorted(os.listdir(directory))
+        except OSError:
+            return
+
+        for name in names:
+            segment_range = _segment_range(name)
+            if segment_range is None:
+                continue
+            path = os.path.join(directory, name)
+
+            # Hết hạn lưu trữ: chỉ xóa khi toàn bộ segment đã cũ hơn thời hạn
+            if segment_range[1] <= retain_after:
+                os.unlink(path)
+                stats['removed'] += 1
+                continue
+
+            if len(name) == 12 and segment_range[1] <= compact_before:
+                self._compact_day(directory, name)
+                stats['compacted'] += 1
+
+        try:
+            os.rmdir(directory)  # Chỉ thành công khi thư mục đã rỗng
+        except OSError:
+            pass
+
+    def _compact_day(self, directory: str, name: str) -> None:
+        """Nối segment ngày vào segment tháng tương ứng"""
+        day_path = os.path.join(directory, name)
+        month_path = os.path.join(directory, f'{name[:6]}.seg')
+        with open(day_path, 'rb') as f:
+            data = f.read()
+        data = data[:len(data) - len(data) % RECORD_SIZE]
+
+        last_month_timestamp = None
+        if os.path.exists(month_path):
+            size = os.path.getsize(month_path)
+            size -= size % RECORD_SIZE
+            if size:
+                with open(month_path, 'rb') as f:
+                    f.seek(size - RECORD_SIZE)
+                    last_month_timestamp = RECORD.unpack(f.read(RECORD_SIZE))[0]
+
+        first_day_timestamp = RECORD.unpack_from(data)[0] if data else None
+        if data and last_month_timestamp is not None and first_day_timestamp < last_month_timestamp:
+            # Ngày cũ hơn dữ liệu đã gộp: sắp xếp lại toàn bộ segment tháng
+            with open(month_path, 'rb') as f:
+                existing = f.read()
+            existing = existing[:len(existing) - len(existing) % RECORD_SIZE]
+            combined = existing + data
+            records = sorted((combined[i:i + RECORD_SIZE] for i in range(0, len(combined), RECORD_SIZE)),
+                             key=lambda record: RECORD.unpack(record)[0])
+            tmp_path = f'{month_path}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(b''.join(records))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, month_path)
+        elif data:
+            with open(month_path, 'ab') as f:
+                size = f.tell()
+                if size % RECORD_SIZE:
+                    f.truncate(size - size % RECORD_SIZE)
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+        os.unlink(day_path)
+
+
+_store: Optional[TimeSeriesStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> Optional[TimeSeriesStore]:
+    """Kho dùng chung của tiến trình, None khi tsdb_enabled tắt"""
+    global _store
+    settings = config.get_snapshot()
+    if not settings.get('tsdb_enabled', False):
+        return None
+
+    path = settings.get('tsdb_path', 'data/tsdb')
+    retention_days = int(settings.get('tsdb_retention_days', 365))
+    compact_after_days = int(settings.get('tsdb_compact_after_days', 7))
+    store = _store
+    if store is not None and store.path == path:
+        store.retention_days = retention_days
+        store.compact_after_days = compact_after_days
+        return store
+
+    with _store_lock:
+        if _store is None or _store.path != path:
+            if _store is not None:
+                _store.flush()
+            _store = TimeSeriesStore(path, retention_days, compact_after_days)
+        return _store
+
+
+def flush() -> None:
+    """Ghi các bản ghi đang chờ của kho dùng chung"""
+    if _store is not None:
+        _store.flush()
+
+
+atexit.register(flush)